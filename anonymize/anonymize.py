@@ -4,11 +4,41 @@ import numpy as np
 import math
 import hashlib
 import re
-import datetime
 import random
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 from . import exceptions
-from .sequences.radix import AlphabetSequence
+from .encoding import email_domain_error, encode_series, factorize, \
+    keyed_hash, lookup_series, new_secret, replace_emails, sequence_labels, \
+    take_labels, to_bytes
+from .parallel import map_tasks
+from .profiling import key_size, measure, profiled_task, task_result
+from .key_stores import cached_replace, key_map
+from .cardinality import HyperLogLog, count_distinct, low_cardinality_limit
+from .schema_cache import load_deduction, schema_fingerprint, \
+    store_deduction
+from .numeric import draw_time_shift, float_affine, float_scale_shift, \
+    int_affine, int_scale_shift, output_array, time_of_day_shift, \
+    time_series, time_shift, time_values
+
+# Column names of dates or their parts, e.g. created_year or updatedDate
+DATE_COLUMN_REGEX = re.compile(r'((.*[^A-Z]*)(Year|Month|Day|Date|Hour'
+                               '|Minute|Second)|(.*[^a-z]*)(year|month'
+                               '|day|date|hour|minute|second))(.*)')
+
+# Formats tried, in order, on sampled values of date columns
+DATETIME_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y%m%d', '%d/%m/%Y', '%m/%d/%Y',
+                    '%d-%m-%Y', '%d.%m.%Y', '%Y-%m-%d %H:%M:%S',
+                    '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S.%f',
+                    '%Y-%m-%dT%H:%M:%S.%f', '%Y/%m/%d %H:%M:%S',
+                    '%Y-%m-%d %H:%M', '%d/%m/%Y %H:%M:%S',
+                    '%m/%d/%Y %H:%M:%S']
+
+# Parts of assembled datetimes and their defaults
+DATE_PARTS = [('year', 1970), ('month', 1), ('day', 1),
+              ('hour', 0), ('minute', 0), ('second', 0)]
 
 
 def anonymize(data,
@@ -18,30 +48,151 @@ def anonymize(data,
               low_cardinality_alphabet=None,
               types={}, replacers={},
               heuristic_level=1,
+              sample_size=None, min_confidence=1.0,
+              cache=False, cache_dir=None,
+              key_backend=None, cardinality_sketch=False,
+              n_jobs=None, executor=None, profile=None,
+              memo_caches=None,
               raise_exceptions=False, quiet=False):
-    # Initialize returning object
-    ret = pd.DataFrame()
-
-    # Initialize keys map
+    """
+    Anonymize data, returning (data, key). See anonymize_columns() for
+    the options of the column replacements.
+    """
+    with measure(profile, 'anonymize', rows=len(data)):
+        # Initialize keys map
+        key = init_key(key)
+
+        # Determine types and do data transformation
+        with measure(profile, 'deduce', rows=len(data)):
+            type_map, data, key = \
+                deduce_types(data, heuristic_level=heuristic_level,
+                             key=key,
+                             sample_size=sample_size,
+                             min_confidence=min_confidence,
+                             cache=cache, cache_dir=cache_dir,
+                             profile=profile,
+                             raise_exceptions=raise_exceptions,
+                             quiet=quiet)
+
+        return anonymize_columns(
+                    data, type_map, key,
+                    columns=columns,
+                    pass_columns=pass_columns,
+                    skip_columns=skip_columns,
+                    low_cardinality_threshold=low_cardinality_threshold,
+                    low_cardinality_alphabet=low_cardinality_alphabet,
+                    types=types, replacers=replacers,
+                    key_backend=key_backend,
+                    cardinality_sketch=cardinality_sketch,
+                    n_jobs=n_jobs, executor=executor, profile=profile,
+                    memo_caches=memo_caches,
+                    raise_exceptions=raise_exceptions, quiet=quiet)
+
+
+def anonymize_chunks(chunks,
+                     columns=None, key=None,
+                     pass_columns=[], skip_columns=[],
+                     low_cardinality_threshold=5,
+                     low_cardinality_alphabet=None,
+                     types={}, replacers={},
+                     heuristic_level=1,
+                     sample_size=None, min_confidence=1.0,
+                     cache=False, cache_dir=None,
+                     key_backend=None, cardinality_sketch=False,
+                     n_jobs=None, executor=None, profile=None,
+                     memo_caches=None,
+                     raise_exceptions=False, quiet=False):
+    """
+    Streaming version of anonymize(): yields (data, key) for every data
+    frame of chunks, types being deduced on the first one and all of them
+    extending the same key.
+    """
+    key = init_key(key)
+    type_map = None
+    own_executor = executor is None and n_jobs is not None and n_jobs != 1
+    if own_executor:
+        # Keep one pool of workers for all chunks
+        executor = ProcessPoolExecutor(
+                        max_workers=n_jobs if n_jobs > 0 else None)
+    try:
+        for chunk in chunks:
+            if type_map is None:
+                with measure(profile, 'deduce', rows=len(chunk)):
+                    type_map, chunk, key = \
+                        deduce_types(chunk, heuristic_level=heuristic_level,
+                                     key=key,
+                                     sample_size=sample_size,
+                                     min_confidence=min_confidence,
+                                     cache=cache, cache_dir=cache_dir,
+                                     profile=profile,
+                                     raise_exceptions=raise_exceptions,
+                                     quiet=quiet)
+            elif key.get('transformation_log', None):
+                with measure(profile, 'transform', rows=len(chunk)):
+                    chunk, key = transform_data(
+                                    chunk, key['transformation_log'], key,
+                                    raise_exceptions=raise_exceptions,
+                                    quiet=quiet)
+            ret, key = anonymize_columns(
+                        chunk, type_map, key,
+                        columns=columns,
+                        pass_columns=pass_columns,
+                        skip_columns=skip_columns,
+                        low_cardinality_threshold=low_cardinality_threshold,
+                        low_cardinality_alphabet=low_cardinality_alphabet,
+                        types=types, replacers=replacers,
+                        key_backend=key_backend,
+                        cardinality_sketch=cardinality_sketch,
+                        executor=executor, profile=profile,
+                        memo_caches=memo_caches,
+                        raise_exceptions=raise_exceptions, quiet=quiet)
+            yield (ret, key)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def init_key(key=None):
     key = {} if not key else key
     key['name_map'] = key.get('name_map', {})
     key['name_map']['old_to_new'] = key['name_map'].get('old_to_new', {})
     key['name_map']['new_to_old'] = key['name_map'].get('new_to_old', {})
     key['data_map'] = key.get('data_map', {})
-
-    # Determine types and do data transformation
-    type_map, data, key = deduce_types(data, heuristic_level=heuristic_level,
-                                       key=key,
-                                       raise_exceptions=raise_exceptions,
-                                       quiet=quiet)
+    return key
+
+
+def anonymize_columns(data, type_map, key,
+                      columns=None,
+                      pass_columns=[], skip_columns=[],
+                      low_cardinality_threshold=5,
+                      low_cardinality_alphabet=None,
+                      types={}, replacers={},
+                      key_backend=None, cardinality_sketch=False,
+                      n_jobs=None, executor=None, profile=None,
+                      memo_caches=None,
+                      raise_exceptions=False, quiet=False):
+    """
+    Anonymize columns of already deduced and transformed data, in worker
+    processes with n_jobs other than 1 or an executor. key_backend selects
+    the backend of new token maps, see key_stores.key_map(), and
+    memo_caches caches the tokens of generic and email columns.
+    """
+    # Initialize returning object
+    ret = pd.DataFrame(index=data.index)
+    if cardinality_sketch:
+        key['cardinality'] = dict(key.get('cardinality', {}))
 
     # Initialize columns
-    if not columns:
+    if columns is None or len(columns) == 0:
         columns = data.columns
-    elif type(columns) != 'list':
+    elif not isinstance(columns, (list, tuple, pd.Index)):
         columns = [columns]
 
-    # Loop through columns
+    # Plan replacement of every column, memo caches only live here
+    in_process = executor is None and (n_jobs is None or n_jobs == 1)
+    new_columns = []
+    tasks = []
+    task_columns = []
     idx = 0
     for column in columns:
         # Skip column if it's in skip_columns
@@ -50,59 +201,183 @@ def anonymize(data,
 
         # Don't change column if it's in pass_columns
         if column in pass_columns:
-            ret[column] = data[column]
             key['data_map'][column] = {}
             key['name_map']['old_to_new'][column] = column
             key['name_map']['new_to_old'][column] = column
+            new_columns.append((column, None))
+            continue
 
         # Get new name for the column
         new_column, key['name_map'] = column_name_replace(column, idx,
                                                           key['name_map'])
+        column_key = key['data_map'].get(new_column, {})
+
+        # Get type of the column, reuse the kind stored in the key, or
+        # check cardinality and pick corresponding replacement
+        column_type = types.get(column, type_map[column])
+        with measure(profile, 'cardinality', column, len(data)):
+            cardinality = None
+            rows = None
+            if cardinality_sketch:
+                sketch = key['cardinality'].get(new_column, None)
+                sketch = HyperLogLog() if sketch is None \
+                    else HyperLogLog.from_dict(sketch)
+                sketch.update(data[column])
+                key['cardinality'][new_column] = sketch.to_dict()
+                cardinality = sketch.count()
+                rows = sketch.rows
+            kind = column_kind(data[column], column_type, column_key,
+                               replacers, low_cardinality_threshold,
+                               cardinality, rows)
+        replacer, args, kwargs = \
+            column_task(data[column], column_type, kind, column_key,
+                        low_cardinality_alphabet, replacers, key_backend,
+                        raise_exceptions=raise_exceptions, quiet=quiet)
+        if memo_caches is not None and in_process:
+            if replacer is generic_replace:
+                kwargs['cache'] = memo_caches.get(column)
+            elif replacer is email_replace:
+                kwargs['cache'] = memo_caches.get((column, 'user'))
+                kwargs['domain_cache'] = memo_caches.get((column, 'domain'))
+        new_columns.append((new_column, len(tasks)))
+        # Sized before the task: in process replacers extend the maps
+        task_columns.append((data[column], key_size(column_key)))
+        tasks.append(profiled_task(profile, (replacer, args, kwargs),
+                                   getattr(replacer, '__name__', 'replace'),
+                                   column, len(data)))
+        idx += 1
 
-        # Get type and cardinality of the column and
-        # perform corresponding replacement
-        cardinality = len(data[column].unique())
-        type = type_map[column]
-        type = types.get(column, type)
-        if replacers.get(type, False):
-            replacers[type](data[column],
-                            key=key['data_map'].get(new_column, {}))
-        elif type == "datetime":
-            ret[new_column], key['data_map'][new_column] = \
-                date_replace(data[column],
-                             key=key['data_map'].get(new_column, {}))
-        elif cardinality <= low_cardinality_threshold or \
-                cardinality <= np.log(len(data)):
-            ret[new_column], key['data_map'][new_column] = \
-                low_cardinality_replace(data[column],
-                                        low_cardinality_alphabet,
-                                        key=key['data_map'].get(new_column, {})
-                                        )
-        elif type == "int":
-            ret[new_column], key['data_map'][new_column] = \
-                int_replace(data[column],
-                            key=key['data_map'].get(new_column, {}))
-        elif type == "float":
-            ret[new_column], key['data_map'][new_column] = \
-                float_replace(data[column],
-                              key=key['data_map'].get(new_column, {}))
-        elif type == "email":
-            ret[new_column], key['data_map'][new_column] = \
-                email_replace(data[column],
-                              key=key['data_map'].get(new_column, {}))
+    # Perform replacements, in worker processes if asked to, and merge
+    # column keys back in column order
+    results = map_tasks(tasks, n_jobs=n_jobs, executor=executor)
+    for new_column, task_idx in new_columns:
+        if task_idx is None:
+            ret[new_column] = data[new_column]
         else:
             ret[new_column], key['data_map'][new_column] = \
-                generic_replace(data[column],
-                                key=key['data_map'].get(new_column, {}),
-                                alphabet=high_cardinality_alphabet,
-                                raise_exceptions=raise_exceptions, quiet=quiet)
-        idx += 1
+                task_result(profile, results[task_idx],
+                            *task_columns[task_idx])
 
     return (ret, key)
 
 
+def column_kind(series, column_type, column_key, replacers={},
+                low_cardinality_threshold=5, cardinality=None, rows=None):
+    """
+    Kind of a column: the one in column_key, low_cardinality for few
+    distinct values, or None to anonymize it by its type.
+    """
+    kind = column_key.get('kind', None)
+    if kind is None and column_type != 'datetime' and \
+            not replacers.get(column_type, False):
+        limit = low_cardinality_limit(low_cardinality_threshold,
+                                      len(series) if rows is None else rows)
+        if cardinality is None:
+            cardinality = count_distinct(series, limit)
+        if cardinality <= limit:
+            kind = 'low_cardinality'
+    return kind
+
+
+def column_task(series, column_type, kind, column_key,
+                low_cardinality_alphabet=None, replacers={},
+                key_backend=None, raise_exceptions=False, quiet=False):
+    """
+    Replacement of series, of column_type and kind (see column_kind()),
+    as a task (replacer, args, kwargs) for map_tasks().
+    """
+    args = (series, )
+    kwargs = {'key': column_key}
+    if replacers.get(column_type, False):
+        replacer = replacers[column_type]
+    elif kind == 'date' or (kind is None and column_type == 'datetime'):
+        replacer = date_replace
+    elif kind == 'low_cardinality':
+        replacer = low_cardinality_replace
+        args = (series, low_cardinality_alphabet)
+    elif kind == 'int' or (kind is None and column_type == 'int'):
+        replacer = int_replace
+    elif kind == 'float' or (kind is None and column_type == 'float'):
+        replacer = float_replace
+    elif kind == 'keyed':
+        replacer = keyed_replace
+    elif kind == 'email' or (kind is None and column_type == 'email'):
+        replacer = email_replace
+        kwargs.update(raise_exceptions=raise_exceptions, quiet=quiet)
+    else:
+        replacer = generic_replace
+        kwargs.update(raise_exceptions=raise_exceptions, quiet=quiet)
+    if key_backend and 'map' not in column_key and \
+            replacer in (low_cardinality_replace, email_replace,
+                         generic_replace):
+        kwargs['key'] = dict(column_key, backend=key_backend)
+    return (replacer, args, kwargs)
+
+
+def deanonymize(data, key, raise_exceptions=False, quiet=False):
+    """
+    Restore original column names and values of anonymized data from its
+    key. Float values come back up to the noise added to them.
+    """
+    ret = pd.DataFrame(index=data.index)
+    name_map = key.get('name_map', {}).get('new_to_old', {})
+    data_map = key.get('data_map', {})
+    for column in data.columns:
+        old_column = name_map.get(column, column)
+        column_key = data_map.get(column, {})
+        kind = column_key.get('kind', column_key.get('type', None))
+        if kind == 'categorical':
+            kind = column_key.get('subtype', None)
+        series = data[column]
+        if not column_key:
+            ret[old_column] = series
+        elif kind == 'low_cardinality':
+            ret[old_column] = lookup_series(series, column_key['map'],
+                                            reverse=True).infer_objects()
+        elif kind == 'generic' or (kind == 'keyed' and 'map' in column_key):
+            ret[old_column] = lookup_series(series, column_key['map'])
+        elif kind == 'email':
+            emails = series.str.partition('@')
+            domains = emails[2]
+            if column_key.get('domains', 'replace') != 'keep':
+                domains = lookup_series(domains, column_key.get(
+                            'domain_map', {} if 'domains' in column_key
+                            else column_key['map']))
+                if column_key.get('domain_table', None):
+                    domains = domains.fillna(lookup_series(
+                                emails[2], column_key['domain_table'],
+                                reverse=True))
+            ret[old_column] = \
+                lookup_series(emails[0], column_key['map']) + '@' + domains
+        elif kind in ('date', 'datetime', 'time'):
+            series, values, nat = time_values(series,
+                                              timedeltas=kind == 'time')
+            check_conversion(data[column], series, column, kind, {},
+                             raise_exceptions, quiet)
+            shift = time_of_day_shift if kind == 'time' else time_shift
+            ret[old_column] = time_series(
+                shift(values, nat, -column_key['shift'],
+                      column_key.get('precision', 's')), series)
+        elif kind in ('int', 'timedelta'):
+            ret[old_column] = (series + column_key['shift']) // \
+                column_key['scale']
+        elif kind == 'float':
+            ret[old_column] = (series + column_key['shift']) / \
+                column_key['scale']
+        else:
+            if raise_exceptions:
+                raise exceptions.NotReversible(column, kind)
+            elif not quiet:
+                print('Can not deanonymize column %s of kind %s' %
+                      (column, kind))
+            ret[old_column] = series
+
+    return ret
+
+
 def column_name_replace(column, idx, key=None):
-    key = {} if not key else key.copy()
+    # The name map is extended in place, it is not copied per column
+    key = {} if key is None else key
     new_column = key.get('old_to_new', {}).get(column, None)
     new_column = 'col_'+str(idx) if new_column is None else new_column
     key['new_to_old'] = key.get('new_to_old', {})
@@ -113,26 +388,15 @@ def column_name_replace(column, idx, key=None):
 
 
 def low_cardinality_replace(series, alphabet=None, key=None):
-    elements = set(series.unique())
     key = {} if not key else key.copy()
     key['kind'] = 'low_cardinality'
-    key['map'] = key.get('map', {})
-    i = len(key['map'])
-    if alphabet:
-        alphabet_sequence = AlphabetSequence(alphabet, i)
-
-    for element in sorted(elements - set(key['map'].keys())):
-        if alphabet:
-            key['map'][element] = alphabet_sequence.next()
-        else:
-            key['map'][element] = i
-        i += 1
-
-    ret = series.apply(lambda x: key['map'][x])
+    key['map'] = key.get('map', key_map(key.get('backend', None)))
+    ret = encode_series(series, key['map'], sequence_labels(alphabet))
     return (ret, key)
 
 
-def int_replace(series, key=None, threshold_rate=0.5, max_scale=1024):
+def int_replace(series, key=None, threshold_rate=0.5, max_scale=1024,
+                inplace=False):
     scale = None
     shift = None
     if not key:
@@ -142,20 +406,17 @@ def int_replace(series, key=None, threshold_rate=0.5, max_scale=1024):
         key = key.copy()
         scale = key.get('scale', None)
         shift = key.get('shift', None)
-    scale = np.random.random_integers(max_scale) if scale is None else scale
-    ret = series.apply(lambda x: x*scale)
-    min_val = np.min(ret)
-    max_val = np.max(ret)
-    ret = ret + np.random.random_integers(0, scale, len(ret))
-    if shift is None:
-        shift = np.random.random(min_val, max_val) if min_val >= 0 else 0
+    values = series.to_numpy()
+    scale, shift = int_scale_shift(values, scale, shift, max_scale)
     key['scale'] = scale
     key['shift'] = shift
-    ret = series.apply(lambda x: (x-shift))
+    out = int_affine(values, scale, shift,
+                     out=output_array(values, np.int64, inplace))
+    ret = pd.Series(out, index=series.index, name=series.name, copy=False)
     return (ret, key)
 
 
-def float_replace(series, key=None):
+def float_replace(series, key=None, inplace=False):
     scale = None
     shift = None
     if not key:
@@ -165,15 +426,13 @@ def float_replace(series, key=None):
         key = key.copy()
         scale = key.get('scale', None)
         shift = key.get('shift', None)
-    scale = np.random.random() * np.avg(series) if scale is None else scale
-    ret = series.apply(lambda x: x*scale)
-    min_val = np.min(ret)
-    max_val = np.max(ret)
-    if shift is None:
-        shift = np.random.random(min_val, max_val) if min_val >= 0.0 else 0.0
+    values = series.to_numpy()
+    scale, shift = float_scale_shift(values, scale, shift)
     key['scale'] = scale
     key['shift'] = shift
-    ret = series.apply(lambda x: (x-shift))+np.random.rand(len(series))*scale
+    out = float_affine(values, scale, shift,
+                       out=output_array(values, np.float64, inplace))
+    ret = pd.Series(out, index=series.index, name=series.name, copy=False)
     return (ret, key)
 
 
@@ -186,89 +445,138 @@ def date_replace(series, key=None, precision='s', timediff_max=100000):
     else:
         key = key.copy()
         shift = key.get('shift', None)
-    min_val = np.min(series)
-    max_val = np.max(series)
+        precision = key.get('precision', precision)
+    series, values, nat = time_values(series)
     if shift is None:
-        abs_diff = (max_val - min_val).total_seconds()
-        abs_diff = abs_diff if abs_diff else timediff_max
-        shift = np.random.random_integers(0,
-                                          np.min([abs_diff,
-                                                  timediff_max]))
-        if precision == 'D':
-            shift_td = datetime.timedelta(int(shift))
-        else:
-            shift_td = datetime.timedelta(0, int(shift))
+        shift = draw_time_shift(values, nat, timediff_max)
     key['shift'] = shift
-    ret = series.apply(lambda x: (x-shift_td))
+    ret = time_series(time_shift(values, nat, shift, precision), series)
     return (ret, key)
 
 
 def email_replace(series, key=None, collision_retries=10,
+                  keep_domains=False, domain_table=None,
+                  cache=None, domain_cache=None,
                   raise_exceptions=False, quiet=False):
-    shift = None
-    if not key:
-        key = {}
-        key['kind'] = 'email'
-        key['domain_map'] = {}
-        key['user_map'] = {}
+    """
+    Replace users and domains of emails through key['map'] and
+    key['domain_map'], or keep domains or map them with a domain_table.
+    """
+    key = {} if not key else key.copy()
+    key['kind'] = 'email'
+    error = email_domain_error(key, keep_domains, domain_table)
+    if error:
+        if raise_exceptions:
+            raise exceptions.WrongParameters(error)
+        elif not quiet:
+            print(error)
     else:
-        key = key.copy()
-    emails = series.str.split("@")
-    users = emails.str.get(0).unique()
-    domains = emails.str.get(1).unique()
+        if keep_domains:
+            key['domains'] = 'keep'
+        if domain_table is not None:
+            key['domain_table'] = dict(domain_table)
 
-    def __replacer(value):
-        user = value.str.get(0)
-        domain = value.str.get(1)
-        user_hash = hashlib.sha256(np.random.bytes(25) + user).hexdigest()
-        domain_hash = hashlib.sha256(np.random.bytes(25) + domain).hexdigest()
-        replacement = user_hash + "@" + domain_hash
-        retry = 0
-        while hash in key['map'] and retry < collision_retries:
-            user_hash = hashlib.sha256(np.random.bytes(25) + user).hexdigest()
-            domain_hash = hashlib.sha256(np.random.bytes(25) +
-                                         domain).hexdigest()
-            replacement = user_hash + "@" + domain_hash
-            retry += 1
-        if hash not in key['map']:
-            key['map'][replacement] = keys[value.name]
-        else:
-            if raise_exceptions:
-                raise exceptions.RepeatedCollision(retry)
-            elif not quiet:
-                print('Persistent collision after %d retries' % retry)
-            return None
-        return replacement
+    def replace(parts, part_key, prefix):
+        return generic_replace(parts, key=part_key,
+                               collision_retries=collision_retries,
+                               cache=domain_cache if prefix else cache,
+                               raise_exceptions=raise_exceptions,
+                               quiet=quiet)
 
-    ret = emails.apply(__replacer)
-    return (ret, key)
+    return replace_emails(series, key, replace)
 
 
-def generic_replace(series, key=None, collision_retries=10,
+def generic_replace(series, key=None, collision_retries=10, cache=None,
                     raise_exceptions=False, quiet=False):
-    if not key:
-        key = {}
-        key['kind'] = 'generic'
-        key['map'] = {}
+    """
+    Replace values with SHA256 tokens through the token map key['map'],
+    looking recurring values up in a memo cache first.
+    """
+    key = {} if not key else key.copy()
+    key['kind'] = key.get('kind', 'generic')
+    key['map'] = key.get('map', key_map(key.get('backend', None)))
+    if cache is not None:
+        cache.bind(key['map'])
+    vectorized = hasattr(key['map'], 'reverse_lookup')
+    if not vectorized:
+        key['map_reverse'] = key.get('map_reverse', {})
+
+    def __hash(value, retry=0):
+        # A salt fixed in the key, e.g. by key_merge.prepare_key(), makes
+        # tokens deterministic; otherwise every value gets random bytes
+        if 'salt' in key:
+            return hashlib.sha256(to_bytes(key['salt']) +
+                                  to_bytes('%d:' % retry if retry else '') +
+                                  to_bytes(value)).hexdigest()
+        return hashlib.sha256(np.random.bytes(25) +
+                              to_bytes(value)).hexdigest()
+
+    def __collision(retry):
+        if raise_exceptions:
+            raise exceptions.RepeatedCollision(retry)
+        elif not quiet:
+            print('Persistent collision after %d retries' % retry)
+        return None
 
     def __replacer(value):
-        hash = hashlib.sha256(np.random.bytes(25) + value).digest()
+        if value in key['map_reverse']:
+            return key['map_reverse'][value]
+        hash = __hash(value)
         retry = 0
         while hash in key['map'] and retry < collision_retries:
-            hash = hashlib.sha256(np.random.bytes(25) + value).digest()
             retry += 1
+            hash = __hash(value, retry)
         if hash not in key['map']:
-            key['map'][hash] = key[value.name]
+            key['map'][hash] = value
+            key['map_reverse'][value] = hash
         else:
-            if raise_exceptions:
-                raise exceptions.RepeatedCollision(retry)
-            elif not quiet:
-                print('Persistent collision after %d retries' % retry)
-            return None
+            return __collision(retry)
         return hash
 
-    ret = series.apply(__replacer)
-    return (ret, key)
+    def __vectorized_replacer(values):
+        hashes, found = key['map'].reverse_lookup(values)
+        new_values = values[~found]
+        new_hashes = np.array([__hash(value) for value in new_values],
+                              dtype=object)
+        retry = 0
+        while True:
+            clash = key['map'].lookup(new_hashes)[1]
+            if not clash.any() or retry >= collision_retries:
+                break
+            retry += 1
+            new_hashes[clash] = [__hash(value, retry)
+                                 for value in new_values[clash]]
+        for position in np.flatnonzero(clash):
+            new_hashes[position] = __collision(retry)
+        key['map'].extend(new_hashes[~clash], new_values[~clash])
+        hashes[~found] = new_hashes
+        return hashes
+
+    def __replace_uniques(values):
+        return [__replacer(value) for value in values]
+
+    # Hash every distinct value once, known ones may come from the cache
+    codes, uniques = factorize(series)
+    hashes = cached_replace(uniques, __vectorized_replacer if vectorized
+                            else __replace_uniques, cache)
+    return (take_labels(codes, hashes, series), key)
+
+
+def keyed_replace(series, key=None, digest_size=16, reverse_sink=None):
+    """
+    Replace values with BLAKE2b digests keyed with key['secret'], writing
+    token -> value pairs to reverse_sink if given.
+    """
+    key = {} if not key else key.copy()
+    key['kind'] = 'keyed'
+    key['secret'] = key.get('secret', new_secret())
+    key['digest_size'] = key.get('digest_size', digest_size)
+    codes, uniques = factorize(series)
+    tokens = [keyed_hash(value, key['secret'], key['digest_size'])
+              for value in uniques]
+    if reverse_sink is not None:
+        reverse_sink.submit(tokens, uniques)
+    return (take_labels(codes, tokens, series), key)
 
 
 def deduce_type_from_dtype(dtype):
@@ -306,17 +614,112 @@ def deduce_type_from_dtype(dtype):
     return type
 
 
+def sample_rows(data, sample_size=None):
+    """
+    Stratified sample of at most sample_size rows: a third from the head,
+    a third from the tail and the rest drawn at random from the middle.
+    """
+    if sample_size is None or len(data) <= sample_size:
+        return data
+    edge = sample_size // 3
+    middle = np.random.choice(np.arange(edge, len(data) - edge),
+                              sample_size - 2 * edge, replace=False)
+    return data.iloc[np.concatenate([np.arange(edge),
+                                     np.sort(middle),
+                                     np.arange(len(data) - edge,
+                                               len(data))])]
+
+
+def guess_datetime_format(series):
+    """
+    First of DATETIME_FORMATS that parses all values of a string series,
+    None if there is none.
+    """
+    values = series.dropna().astype(str).str.strip().unique()
+    if not len(values):
+        return None
+    for format in DATETIME_FORMATS:
+        try:
+            for value in values:
+                datetime.strptime(value, format)
+        except ValueError:
+            continue
+        return format
+    return None
+
+
 def deduce_types(data, heuristic_level=1, key=None,
-                 raise_exceptions=False, quiet=False):
-    # Use dtype for numerical types: check if it's not a timestamp
-    # For strings try date regexes and then wikidata lookups to distinguish
-    # geography from other types
+                 sample_size=None, min_confidence=1.0,
+                 cache=False, cache_dir=None, fingerprint_rows=0,
+                 profile=None, raise_exceptions=False, quiet=False):
+    """
+    Deduce column types, transforming the data on heuristic_level > 1.
+    With sample_size only a sample of rows is checked, with cache or
+    cache_dir deductions are reused for data of a known schema.
+    """
     key = key if key else {}
+    fingerprint = None
+    cached = None
+    if cache or cache_dir is not None:
+        fingerprint = schema_fingerprint(
+                        data, fingerprint_rows,
+                        heuristic_level=heuristic_level,
+                        sample_size=sample_size,
+                        min_confidence=min_confidence)
+        cached = load_deduction(fingerprint, key, cache_dir)
     if key.get('transformation_log', None):
-        data, key = transform_data(data, key['transformation_log'], key,
-                                   raise_exceptions=raise_exceptions,
-                                   quiet=quiet)
+        with measure(profile, 'transform', rows=len(data)):
+            data, key = transform_data(data, key['transformation_log'], key,
+                                       raise_exceptions=raise_exceptions,
+                                       quiet=quiet)
+
+    if cached is None:
+        type_map, transformation_log, confidence = \
+            deduce_transformations(data, heuristic_level,
+                                   sample_size, min_confidence)
+    else:
+        type_map, transformation_log, confidence = cached
+        applied = [tuple(transformation)
+                   for transformation in key.get('transformation_log', [])]
+        if all(transformation in applied
+               for transformation in transformation_log):
+            # A reused key: its transformations were applied above
+            transformation_log = []
+
+    if transformation_log:
+        # Cached type maps already are the ones after transformation
+        with measure(profile, 'transform', rows=len(data)):
+            data, key = transform_data(data, transformation_log, key,
+                                       type_map=type_map if cached is None
+                                       else None,
+                                       raise_exceptions=raise_exceptions,
+                                       quiet=quiet)
+        key['transformation_log'] = \
+            key.get('transformation_log', []) + transformation_log
+    if confidence is not None:
+        type_confidence = dict(key.get('type_confidence', {}))
+        type_confidence.update((column, float(rate))
+                               for column, rate in confidence.items())
+        key['type_confidence'] = type_confidence
+    if fingerprint is not None and cached is None:
+        key = store_deduction(fingerprint, key, type_map,
+                              transformation_log, confidence,
+                              cache_dir=cache_dir)
+
+    return (type_map, data, key)
+
 
+def deduce_transformations(data, heuristic_level=1,
+                           sample_size=None, min_confidence=1.0):
+    """
+    Type map of data, transformations to apply to it and the confidence
+    of types deduced from a sample (None without sample_size).
+    """
+    # Use dtype for numerical types: check if it's not a timestamp
+    # For strings try date regexes and then wikidata lookups to distinguish
+    # geography from other types
+    sample = sample_rows(data, sample_size)
+    confidence = {}
     type_map = {}
     transformation_log = []
     location_fields = {}
@@ -330,10 +733,7 @@ def deduce_types(data, heuristic_level=1, key=None,
         type_map[column] = deduce_type_from_dtype(dtype)
         # Do data transformation on heuristic level > 1
         if heuristic_level > 1:
-            date_search = re.search(r'((.*[^A-Z]*)(Year|Month|Day|Date|Hour'
-                                    '|Minute|Second)|(.*[^a-z]*)(year|month'
-                                    '|day|date|hour|minute|second))(.*)',
-                                    column)
+            date_search = DATE_COLUMN_REGEX.search(column)
             if date_search:
                 date_groups = date_search.groups()
                 field_prefix = date_groups[1] or date_groups[3]
@@ -344,100 +744,129 @@ def deduce_types(data, heuristic_level=1, key=None,
                     ('Date' if field_is_cap else 'date') + \
                     field_suffix
                 if field_name.lower() == 'date':
-                    transformation_log.append(('change_type', column,
-                                               'datetime'))
+                    transformation = ('change_type', column, 'datetime')
+                    if sample_size is not None:
+                        # Parse the full column with the sample's format
+                        values = sample.loc[:, column]
+                        format = guess_datetime_format(values)
+                        if format:
+                            transformation += (format,)
+                        parsed = pd.to_datetime(values, format=format,
+                                                errors='coerce')
+                        confidence[column] = \
+                            parsed.notna().sum() / max(values.count(), 1)
+                        if confidence[column] < min_confidence:
+                            continue
+                    transformation_log.append(transformation)
                 else:
                     date_fields[field_date] = date_fields.get(field_date, {})
                     date_fields[field_date][field_name.lower()] = column
-            elif type_map[column] == 'generic' and \
-                    data.loc[:, column].str.strip().\
-                    str.match(r'[0-9,.]+').all():
-                transformation_log.append(('change_type', column, 'numeric'))
+            elif type_map[column] == 'generic':
+                # Missing values neither match nor count against the rate
+                values = sample.loc[:, column].dropna()
+                matches = values.str.strip().str.match(r'[0-9,.]+')
+                rate = matches.fillna(False).astype(bool).sum() / \
+                    max(len(values), 1)
+                confidence[column] = rate
+                if rate >= min_confidence:
+                    transformation_log.append(('change_type', column,
+                                               'numeric'))
 
     for field in date_fields:
-        if 'year' not in date_fields[field]:
-            transformation_log.append(('add', field+'year', 1970, 'generic'))
-            date_fields[field]['year'] = field+'year'
-        if 'month' not in date_fields[field]:
-            transformation_log.append(('add', field+'month', 1, 'generic'))
-            date_fields[field]['month'] = field+'month'
-        if 'day' not in date_fields[field]:
-            transformation_log.append(('add', field+'day', 1, 'generic'))
-            date_fields[field]['day'] = field+'day'
-        if 'hour' not in date_fields[field]:
-            transformation_log.append(('add', field+'hour', 0, 'generic'))
-            date_fields[field]['hour'] = field+'hour'
-        if 'minute' not in date_fields[field]:
-            transformation_log.append(('add', field+'minute', 0, 'generic'))
-            date_fields[field]['minute'] = field+'minute'
-        if 'second' not in date_fields[field]:
-            transformation_log.append(('add', field+'second', 0, 'generic'))
-            date_fields[field]['second'] = field+'second'
-        transformation_log.append(('combine', field, [
-            date_fields[field]['year'],
-            date_fields[field]['month'],
-            date_fields[field]['day'],
-            date_fields[field]['hour'],
-            date_fields[field]['minute'],
-            date_fields[field]['second']], '/'))
-        transformation_log.append(('change_type', field,
-                                   'datetime', '%Y/%m/%d/%H/%M/%S'))
-        transformation_log.append(('remove', date_fields[field]['year']))
-        transformation_log.append(('remove', date_fields[field]['month']))
-        transformation_log.append(('remove', date_fields[field]['day']))
-        transformation_log.append(('remove', date_fields[field]['hour']))
-        transformation_log.append(('remove', date_fields[field]['minute']))
-        transformation_log.append(('remove', date_fields[field]['second']))
-
-    if transformation_log:
-        data, key = transform_data(data, transformation_log, key,
-                                   type_map=type_map,
-                                   raise_exceptions=raise_exceptions,
-                                   quiet=quiet)
-        key['transformation_log'] = \
-            key.get('transformation_log', []) + transformation_log
-
-    return (type_map, data, key)
+        # Build datetimes from the parts, missing ones take defaults
+        transformation_log.append(('assemble', field,
+                                   dict(date_fields[field])))
+        for part, default in DATE_PARTS:
+            if part in date_fields[field]:
+                transformation_log.append(('remove',
+                                           date_fields[field][part]))
+
+    return (type_map, transformation_log,
+            confidence if sample_size is not None else None)
+
+
+def check_conversion(before, after, column, type, key,
+                     raise_exceptions=False, quiet=False):
+    """
+    Report values that were present before a type conversion and are
+    missing after it, counting them in key['type_mismatches'].
+    """
+    count = int((before.notna() & after.isna()).sum())
+    if not count:
+        return key
+    mismatches = dict(key.get('type_mismatches', {}))
+    mismatches[column] = mismatches.get(column, 0) + count
+    key['type_mismatches'] = mismatches
+    if raise_exceptions:
+        raise exceptions.TypeMismatch(column, type, count)
+    elif not quiet:
+        print('%d values of column %s do not match type %s' %
+              (count, column, type))
+    return key
+
+
+def assemble_datetime(data, components):
+    """
+    Datetimes assembled from columns of date parts, missing parts taking
+    defaults. Invalid dates are NaT.
+    """
+    parts = {}
+    for part, default in DATE_PARTS:
+        parts[part] = pd.to_numeric(data[components[part]], errors='coerce') \
+            if part in components else default
+    with np.errstate(invalid='ignore'):
+        return pd.to_datetime(pd.DataFrame(parts), errors='coerce')
 
 
 def transform_data(data, transformation_log, key, type_map=None,
                    raise_exceptions=False, quiet=False):
-    data = data.copy()
+    """
+    Apply transformation_log to a new frame that shares the untransformed
+    columns with data.
+    """
+    columns = OrderedDict((column, data[column]) for column in data.columns)
     key = key.copy()
+
+    def set_kind(column, kind):
+        key[column] = dict(key.get(column, {}), kind=kind)
+        if type_map:
+            type_map[column] = kind
+
     for transformation in transformation_log:
         if transformation[0] == 'change_type':
+            column = transformation[1]
+            before = columns[column]
             if transformation[2] == 'datetime':
                 if len(transformation) <= 3:
-                    data[transformation[1]] = \
-                        pd.to_datetime(
-                            data[transformation[1]],
-                            infer_datetime_format=True, errors='coerce')
+                    columns[column] = pd.to_datetime(
+                                        before, infer_datetime_format=True,
+                                        errors='coerce')
                 else:
-                    data[transformation[1]] = \
-                        pd.to_datetime(
-                            data[transformation[1]],
-                            format=transformation[3], errors='coerce')
-                key[transformation[1]] = key.get(transformation[1], {})
-                key[transformation[1]]['kind'] = 'datetime'
-                if type_map:
-                    type_map[transformation[1]] = 'datetime'
+                    columns[column] = pd.to_datetime(
+                                        before, format=transformation[3],
+                                        errors='coerce')
+                key = check_conversion(before, columns[column],
+                                       column, 'datetime', key,
+                                       raise_exceptions=raise_exceptions,
+                                       quiet=quiet)
+                set_kind(column, 'datetime')
             elif transformation[2] == 'numeric':
-                data[transformation[1]] = \
-                    pd.to_numeric(data[transformation[1]].str.strip().
-                                  str.replace(',', ''), errors='coerce')
-                key[transformation[1]] = key.get(transformation[1], {})
-                dtype = str(data[transformation[1]].dtype)
-                type = deduce_type_from_dtype(dtype)
-                key[transformation[1]]['kind'] = type
-                if type_map:
-                    type_map[transformation[1]] = type
+                columns[column] = pd.to_numeric(
+                                    before.str.strip().str.replace(',', ''),
+                                    errors='coerce')
+                key = check_conversion(before, columns[column],
+                                       column, 'numeric', key,
+                                       raise_exceptions=raise_exceptions,
+                                       quiet=quiet)
+                set_kind(column,
+                         deduce_type_from_dtype(str(columns[column].dtype)))
             elif transformation[2] == 'timedelta':
-                data[transformation[1]] = \
-                    pd.to_timedelta(data[transformation[1]], errors='coerce')
-                key[transformation[1]] = key.get(transformation[1], {})
-                key[transformation[1]]['kind'] = 'timedelta'
-                if type_map:
-                    type_map[transformation[1]] = 'timedelta'
+                columns[column] = pd.to_timedelta(before, errors='coerce')
+                key = check_conversion(before, columns[column],
+                                       column, 'timedelta', key,
+                                       raise_exceptions=raise_exceptions,
+                                       quiet=quiet)
+                set_kind(column, 'timedelta')
             else:
                 # Report an error
                 if raise_exceptions:
@@ -445,26 +874,37 @@ def transform_data(data, transformation_log, key, type_map=None,
                 elif not quiet:
                     print('Unsupported type for change_type: %s' %
                           transformation[2])
+        elif transformation[0] == 'assemble':
+            column = transformation[1]
+            columns[column] = assemble_datetime(columns, transformation[2])
+            # Count rows with all parts present that are not valid dates
+            present = np.logical_and.reduce(
+                        [columns[part].notna().values
+                         for part in transformation[2].values()])
+            present = pd.Series(np.where(present, 1, np.nan),
+                                index=data.index)
+            key = check_conversion(present, columns[column],
+                                   column, 'datetime', key,
+                                   raise_exceptions=raise_exceptions,
+                                   quiet=quiet)
+            set_kind(column, 'datetime')
         elif transformation[0] == 'combine':
-            data.loc[:, transformation[1]] = \
-                data.loc[:, transformation[2][0]].apply(str)
+            column = transformation[1]
+            columns[column] = columns[transformation[2][0]].apply(str)
             for i in range(1, len(transformation[2])):
-                data.loc[:, transformation[1]] = \
-                    data.loc[:, transformation[1]].str.cat(
-                        data.loc[:, transformation[2][i]].apply(str),
-                        sep=transformation[3])
-            key[transformation[1]] = key.get(transformation[1], {})
-            key[transformation[1]]['kind'] = 'generic'
-            if type_map:
-                type_map[transformation[1]] = 'generic'
+                columns[column] = columns[column].str.cat(
+                                    columns[transformation[2][i]].apply(str),
+                                    sep=transformation[3])
+            set_kind(column, 'generic')
         elif transformation[0] == 'remove':
-            del data[transformation[1]]
+            del columns[transformation[1]]
             if transformation[1] in key:
                 del key[transformation[1]]
-                if type_map:
-                    del type_map[transformation[1]]
+            if type_map and transformation[1] in type_map:
+                del type_map[transformation[1]]
         elif transformation[0] == 'add':
-            data[transformation[1]] = transformation[2]
+            columns[transformation[1]] = pd.Series(transformation[2],
+                                                   index=data.index)
             key[transformation[1]] = {'kind': transformation[3]}
             if type_map:
                 type_map[transformation[1]] = transformation[3]
@@ -476,4 +916,6 @@ def transform_data(data, transformation_log, key, type_map=None,
                 print('Unsupported action in transform_data: %s' %
                       transformation[0])
 
+    # Columns are already aligned on the index: don't copy them
+    data = pd.DataFrame(columns, index=data.index, copy=False)
     return (data, key)
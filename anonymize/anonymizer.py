@@ -7,6 +7,9 @@ import re
 import datetime
 
 from . import exceptions
+from .key_stores import MemoCaches
+from .parallel import map_tasks
+from .profiling import key_size, measure, profiled_task, task_result
 from .types.int_anonymizer import IntAnonymizer
 from .types.float_anonymizer import FloatAnonymizer
 from .types.categorical_anonymizer import CategoricalAnonymizer
@@ -32,6 +35,12 @@ class Anonymizer():
     name_based_anonymizers = {}
     type_based_anonymizers = {}
     raise_exceptions = False
+    n_jobs = None
+    executor = None
+    profile = None
+    cache_size = None
+    cache_policy = 'lru'
+    memo_caches = None
 
     # Block anonymizers
     __blocks = []
@@ -42,9 +51,17 @@ class Anonymizer():
                  name_anonymizer=None,
                  name_based_anonymizers={},
                  type_based_anonymizers={},
+                 n_jobs=None, executor=None, profile=None,
+                 cache_size=None, cache_policy='lru',
                  raise_exceptions=False):
         """
-        Configure anonymizer object through constructor.
+        Configure anonymizer object through constructor. With n_jobs other
+        than 1, or a concurrent.futures executor, columns are anonymized
+        in worker processes. With a profiling.Profile, every anonymize()
+        call records its stats in it. With cache_size, token replacements
+        of every column are memoized over anonymize() calls in a cache of
+        that many entries with cache_policy eviction ('lru' or 'clock'),
+        see cache_stats(); caches are not used in worker processes.
         """
         # Initialize the key
         self.key = {} if not key else key
@@ -56,14 +73,23 @@ class Anonymizer():
         self.key['data_map'] = self.key.get('data_map', {})
 
         # Initialize other attributes
-        self.column = columns
+        self.columns = columns
         self.pass_columns = pass_columns
         self.skip_columns = skip_columns
         self.low_cardinality_threshold = low_cardinality_threshold
         self.types = types
         self.name_based_anonymizers = name_based_anonymizers
-        self.type_based_anonymizers = type_based_anonymizers
+        # Copied, so that type anonymizers created below belong to this
+        # object and not to a shared default dict
+        self.type_based_anonymizers = dict(type_based_anonymizers)
         self.raise_exceptions = raise_exceptions
+        self.n_jobs = n_jobs
+        self.executor = executor
+        self.profile = profile
+        self.cache_size = cache_size
+        self.cache_policy = cache_policy
+        self.memo_caches = MemoCaches(cache_size, cache_policy) \
+            if cache_size else None
         self.name_anonymizer = self.column_name_anonymizer
 
         if not self.columns:
@@ -140,44 +166,112 @@ class Anonymizer():
                 else:
                     print("Unsupported type: %s", type)
 
-    def column_name_anonymizer(column, idx, key=None):
-        new_column = key.get(column, {}).get('name', None)
+    def __getstate__(self):
+        """
+        Anonymizer objects are pickled without the key, executor, profile
+        and memo cache entries, so that columns can be sent to worker
+        processes cheaply. Keep self.key separately to persist it.
+        """
+        state = self.__dict__.copy()
+        state['key'] = None
+        state['executor'] = None
+        state['profile'] = None
+        return state
+
+    def memo_cache(self, name):
+        """
+        Memo cache of replacements named after a column (or a part of
+        it), None without cache_size. Caches are bound to the key map they
+        are used with, so replacing the key does not serve stale tokens.
+        """
+        if self.memo_caches is None:
+            return None
+        return self.memo_caches.get(name)
+
+    def cache_stats(self):
+        """
+        Hit, miss and eviction counts of the memo caches, by name.
+        """
+        return self.memo_caches.stats() if self.memo_caches else {}
+
+    def column_name_anonymizer(self, column, idx):
+        new_column = self.key['name_map']['old_to_new'].get(column, None)
         new_column = 'col_'+str(idx) if new_column is None else new_column
         return new_column
 
     def anonymize(self, data):
-        ret = pd.DataFrame()
-        key = None
+        with measure(self.profile, 'anonymize', rows=len(data)):
+            return self.__anonymize(data)
 
-        columns = data.columns
+    def __anonymize(self, data):
+        ret = pd.DataFrame(index=data.index)
+        key = self.key
+        profile = self.profile
 
         for block in self.__blocks:
             block_id = block.signature()
-            if block.columns:
-                ret[block.columns, ], key[block_id] = \
-                    block.anonymize(data.loc[block.columns, ],
-                                    self.key[block_id])
-            else:
-                ret, key[block_id] = block.anonymize(data, key[block_id])
+            with measure(profile, 'block', block_id, len(data)):
+                if block.columns:
+                    ret[block.columns], key[block_id] = \
+                        block.anonymize(data[block.columns],
+                                        key.get(block_id, None))
+                else:
+                    ret, key[block_id] = \
+                        block.anonymize(data, key.get(block_id, None))
 
+        new_columns = []
+        tasks = []
+        task_columns = []
+        idx = 0
         for column in data.columns:
             if column in self.skip_columns:
                 continue
             elif column in self.pass_columns:
-                ret.loc[column, ], self.key[column] = (data.loc[column, ],
-                                                       {'name': column})
+                new_column = column
+                new_columns.append((column, None))
             else:
-                new_column = (self.name_anonymizer)(column, self.key)
+                new_column = (self.name_anonymizer)(column, idx)
+                column_key = key['data_map'].get(new_column, None)
                 if column in self.name_based_anonymizers:
-                    ret[new_column, ], key[column] = \
-                        self.name_based_anonymizers[column] \
-                            .anonymize(data.loc[column, ], self.key[column])
+                    column_anonymizer = self.name_based_anonymizers[column]
                 elif column in self.types:
-                    ret[new_column, ], key[column] = \
-                        self.type_based_anonymizer[self.types[column]] \
-                            .anonymize(data.loc[column, ], self.key[column])
-                key[column] = key.get(column, {})
-                key[column]['name'] = new_column
+                    column_anonymizer = \
+                        self.type_based_anonymizers[self.types[column]]
+                else:
+                    column_anonymizer = None
+                if column_anonymizer:
+                    new_columns.append((new_column, len(tasks)))
+                    task_columns.append((data[column],
+                                         key_size(column_key)))
+                    tasks.append(profiled_task(
+                                    profile,
+                                    (column_anonymizer.anonymize,
+                                     (data[column], column_key), {}),
+                                    column_anonymizer.__class__.__name__,
+                                    column, len(data)))
+                idx += 1
+            key['name_map']['old_to_new'][column] = new_column
+            key['name_map']['new_to_old'][new_column] = column
+
+        # Anonymize columns, in worker processes if configured to, and
+        # merge column keys back in column order
+        results = map_tasks(tasks, n_jobs=self.n_jobs, executor=self.executor)
+        for new_column, task_idx in new_columns:
+            if task_idx is None:
+                ret[new_column] = data[new_column]
+            else:
+                ret[new_column], key['data_map'][new_column] = \
+                    task_result(profile, results[task_idx],
+                                *task_columns[task_idx])
 
         self.key = key
         return ret
+
+    def anonymize_chunks(self, chunks):
+        """
+        Anonymize an iterable of data frames, e.g.
+        pd.read_csv(..., chunksize=...), yielding anonymized chunks.
+        All chunks extend the same key.
+        """
+        for chunk in chunks:
+            yield self.anonymize(chunk)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+# Bounded-cost distinct value counting for cardinality classification
+import numpy as np
+import pandas as pd
+
+from .numeric import BLOCK_SIZE
+
+
+def hash_values(values):
+    """
+    uint64 hashes of an array or series of values, equal for equal values.
+    """
+    return pd.util.hash_pandas_object(pd.Series(values), index=False).values
+
+
+def count_distinct(values, limit, dropna=False):
+    """
+    Number of distinct values if it is at most limit, limit + 1 otherwise.
+    Values are hashed in growing blocks and counting stops as soon as more
+    than limit distinct hashes were seen, so high cardinality columns are
+    classified after looking at a few rows.
+    """
+    series = pd.Series(values)
+    if dropna:
+        series = series.dropna()
+    limit = int(limit)
+    seen = np.array([], dtype=np.uint64)
+    start = 0
+    size = 4 * (limit + 1)
+    while start < len(series):
+        block = hash_values(series.iloc[start:start + size])
+        seen = np.union1d(seen, block)
+        if len(seen) > limit:
+            return limit + 1
+        start += size
+        size = min(2 * size, BLOCK_SIZE)
+    return len(seen)
+
+
+def low_cardinality_limit(threshold, rows):
+    """
+    Largest number of distinct values of a low cardinality column: the
+    threshold or, for long columns, the logarithm of the number of rows.
+    """
+    return int(max(threshold, np.log(rows) if rows else 0))
+
+
+class HyperLogLog():
+    """
+    HyperLogLog sketch of the number of distinct values. Sketches of
+    chunks or partitions of a column can be merged, and the state is a
+    plain dict (to_dict/from_dict) so that it can be kept in keys.
+    """
+
+    def __init__(self, precision=12, registers=None, rows=0):
+        if not 4 <= precision <= 18:
+            raise ValueError('HyperLogLog precision must be in [4, 18]')
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) \
+            if registers is None else np.asarray(registers, dtype=np.uint8)
+        self.rows = rows
+
+    def update(self, values):
+        """
+        Add an array or series of values.
+        """
+        hashes = hash_values(values)
+        bits = 64 - self.precision
+        index = (hashes >> np.uint64(bits)).astype(np.int64)
+        rest = hashes & np.uint64((1 << bits) - 1)
+        # Rank is the position of the first set bit of the rest
+        length = np.zeros(len(rest), dtype=np.int64)
+        for shift in (32, 16, 8, 4, 2, 1):
+            high = rest >= np.uint64(1 << shift)
+            length[high] += shift
+            rest[high] >>= np.uint64(shift)
+        length += rest > 0
+        np.maximum.at(self.registers, index,
+                      (bits - length + 1).astype(np.uint8))
+        self.rows += len(hashes)
+        return self
+
+    def merge(self, other):
+        """
+        Merge another sketch of the same precision into this one.
+        """
+        if other.precision != self.precision:
+            raise ValueError('Can not merge HyperLogLog sketches of '
+                             'different precision')
+        np.maximum(self.registers, other.registers, out=self.registers)
+        self.rows += other.rows
+        return self
+
+    def count(self):
+        """
+        Estimated number of distinct values.
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(2.0 ** -self.registers.astype(int))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more precise for small cardinalities
+            estimate = m * np.log(float(m) / zeros)
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {'precision': self.precision,
+                'registers': self.registers.tobytes(),
+                'rows': self.rows}
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(state['precision'],
+                   np.frombuffer(state['registers'], dtype=np.uint8).copy(),
+                   state.get('rows', 0))
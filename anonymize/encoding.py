@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Vectorized helpers for value -> label encodings
+import hashlib
+import random
+
+import numpy as np
+import pandas as pd
+
+from .sequences.radix import AlphabetSequence
+
+
+def to_bytes(value):
+    """
+    UTF-8 bytes of the value's string representation.
+    """
+    if isinstance(value, bytes):
+        return value
+    return (u'%s' % value).encode('utf-8')
+
+
+def new_secret():
+    """
+    Random 256-bit secret as a hex string, for keyed hashing.
+    """
+    return '%064x' % random.SystemRandom().getrandbits(256)
+
+
+# ASCII codes of hex digits
+HEX_DIGITS = np.frombuffer(b'0123456789abcdef', dtype=np.uint8)
+
+
+def random_hex_tokens(count, hex_length=25):
+    """
+    Object array of count random hex strings of hex_length digits, drawn
+    from one block of random bytes and hex-encoded with array operations.
+    """
+    width = (hex_length + 1) // 2
+    random_bytes = np.frombuffer(np.random.bytes(count * width),
+                                 dtype=np.uint8).reshape(count, width)
+    digits = np.empty((count, 2 * width), dtype=np.uint8)
+    digits[:, 0::2] = HEX_DIGITS[random_bytes >> 4]
+    digits[:, 1::2] = HEX_DIGITS[random_bytes & 15]
+    digits = np.ascontiguousarray(digits[:, :hex_length])
+    return digits.view('S%d' % hex_length).ravel().astype('U') \
+        .astype(object)
+
+
+def keyed_hash(value, secret, digest_size=16):
+    """
+    Hex BLAKE2b digest of value keyed with a hex secret. Equal for equal
+    values and secrets, so tokens need no stored map to be consistent.
+    """
+    return hashlib.blake2b(to_bytes(value),
+                           key=bytes(bytearray.fromhex(secret)),
+                           digest_size=digest_size).hexdigest()
+
+
+def factorize(series):
+    """
+    Split series into integer codes and an object array of its unique
+    values. Missing values get code -1.
+    """
+    codes, uniques = pd.factorize(series)
+    return (codes, np.asarray(uniques, dtype=object))
+
+
+def take_labels(codes, labels, series, na_value=np.nan):
+    """
+    Build a series with the index and name of the original series from
+    factorize codes and one label per unique value. Code -1 gets na_value.
+    """
+    labels = np.asarray(labels)
+    if len(codes) and codes.min() < 0:
+        # take() with -1 picks the last element
+        labels = np.append(labels.astype(object), [na_value])
+    return pd.Series(labels.take(codes), index=series.index,
+                     name=series.name)
+
+
+def encode_series(series, mapping, new_labels):
+    """
+    Map series through mapping (value -> label), extending mapping with
+    labels for the values it has not seen yet. new_labels(values, start)
+    returns labels for the sorted list of new values, start being the
+    current size of the mapping. Python work is done per unique value,
+    rows are mapped with one array take. Mappings with a lookup() method,
+    like ArrayKeyMap, are looked up and extended with whole arrays.
+    """
+    codes, uniques = factorize(series)
+    if hasattr(mapping, 'lookup'):
+        # Vectorized key map backend
+        labels, found = mapping.lookup(uniques)
+        new_values = sorted(uniques[~found])
+        if new_values:
+            mapping.extend(new_values,
+                           list(new_labels(new_values, len(mapping))))
+            labels, found = mapping.lookup(uniques)
+        return take_labels(codes, labels, series)
+    new_values = sorted(value for value in uniques if value not in mapping)
+    if new_values:
+        labels = new_labels(new_values, len(mapping))
+        for value, label in zip(new_values, labels):
+            mapping[value] = label
+    return take_labels(codes, [mapping[value] for value in uniques], series)
+
+
+def lookup_series(series, mapping, reverse=False):
+    """
+    Map series through mapping in bulk: each distinct value is looked up
+    once in a hash index over the mapping keys, or over its values if
+    reverse is set. Values missing from the mapping become NaN.
+    """
+    codes, uniques = factorize(series)
+    if hasattr(mapping, 'lookup'):
+        lookup = mapping.reverse_lookup if reverse else mapping.lookup
+        labels, found = lookup(uniques)
+        labels = labels.astype(object)
+    else:
+        keys = list(mapping.values()) if reverse else list(mapping.keys())
+        values = list(mapping.keys()) if reverse else list(mapping.values())
+        positions = pd.Index(keys).get_indexer(uniques)
+        found = positions >= 0
+        labels = np.empty(len(uniques), dtype=object)
+        labels[found] = np.asarray(values, dtype=object)[positions[found]]
+    labels[~found] = np.nan
+    return take_labels(codes, labels, series)
+
+
+def email_part_key(key, prefix):
+    """
+    Key of one part of emails: the token maps stored under prefix, e.g.
+    domain_map and domain_map_reverse for prefix 'domain_', and the
+    settings shared by both parts, like salt or method.
+    """
+    part_key = dict((name, value) for name, value in key.items()
+                    if not name.endswith('map') and
+                    not name.endswith('map_reverse'))
+    for name in ('map', 'map_reverse'):
+        if prefix + name in key:
+            part_key[name] = key[prefix + name]
+    return part_key
+
+
+def email_domain_error(key, keep_domains=False, domain_table=None):
+    """
+    Why keep_domains or domain_table can not be set on an email key, None
+    if they can. Domains already replaced in the key can not be kept,
+    and a domain_table has to map every domain to its own replacement,
+    so that deanonymize() can reverse it.
+    """
+    if keep_domains and key.get('domains', 'replace') != 'keep':
+        replaced = key.get('domain_map', {}) if 'domains' in key \
+            else key.get('map', {})
+        if len(replaced):
+            return 'Domains are already replaced in the key, they can ' \
+                'not be kept'
+    if domain_table is not None:
+        replacements = list(dict(domain_table).values())
+        if len(set(replacements)) < len(replacements):
+            return 'domain_table maps several domains to the same ' \
+                'replacement, they can not be deanonymized'
+    return None
+
+
+def replace_emails(series, key, replace):
+    """
+    Replace users and domains of emails with separate token maps: users
+    through key['map'] and domains through key['domain_map'] (and their
+    reverse maps). replace(parts, part_key, prefix) returns
+    (replacements, part_key) for a series of parts, hashing each
+    distinct part once; prefix is '' for users and 'domain_' for domains.
+
+    Only distinct emails are split; their parts' replacements are joined
+    by vectorized concatenation and taken back to rows. key['domains']
+    set to 'keep' keeps domains; a key['domain_table'] (domain ->
+    replacement) replaces known domains, others get tokens, see
+    email_domain_error(). key is updated in place and returned with the
+    replaced series.
+    """
+    if 'map' in key and 'domains' not in key:
+        # Earlier keys share one map for users and domains
+        key['domain_map'] = key['map']
+        if 'map_reverse' in key:
+            key['domain_map_reverse'] = key['map_reverse']
+    key['domains'] = key.get('domains', 'replace')
+
+    def replace_part(parts, prefix):
+        replacements, part_key = replace(parts, email_part_key(key, prefix),
+                                         prefix)
+        for name, value in part_key.items():
+            if name in ('map', 'map_reverse'):
+                key[prefix + name] = value
+            elif name not in ('kind', 'type'):
+                key[name] = value
+        return pd.Series(np.asarray(replacements, dtype=object),
+                         index=parts.index)
+
+    codes, uniques = factorize(series)
+    emails = pd.Series(uniques, dtype=object).str.partition('@')
+    users = replace_part(emails[0], '')
+    domains = emails[2]
+    if key['domains'] != 'keep':
+        domains = domains.map(key.get('domain_table', {}))
+        missing = domains.isnull()
+        if missing.any():
+            domains[missing] = replace_part(emails[2][missing], 'domain_')
+    emails = users + '@' + domains
+    return (take_labels(codes, emails.values, series), key)
+
+
+def sequence_labels(alphabet=None):
+    """
+    Label generator for encode_series: consecutive integers or, if
+    alphabet is given, consecutive AlphabetSequence labels.
+    """
+    def new_labels(values, start):
+        if not alphabet:
+            return range(start, start + len(values))
+        return AlphabetSequence(alphabet).take(start, len(values))
+    return new_labels
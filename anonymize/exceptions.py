@@ -53,3 +53,34 @@ class WrongKeyType(AnonymizerError):
 class WrongParameters(AnonymizerError):
     def __init__(self, message):
         self.message = message
+
+
+class NotReversible(AnonymizerError):
+    def __init__(self, column, kind):
+        self.message = 'Can not deanonymize column %s of kind %s' % \
+            (column, kind)
+
+
+class TypeMismatch(AnonymizerError):
+    def __init__(self, column, type, count):
+        self.message = '%d values of column %s do not match type %s' % \
+            (count, column, type)
+
+
+class KeyConflict(AnonymizerError):
+    def __init__(self, column, count):
+        self.message = '%d conflicting key entries for column %s' % \
+            (count, column)
+
+
+class IntegerOverflow(AnonymizerError):
+    def __init__(self, largest, scale, shift):
+        self.message = 'Scaling values up to %d by %d and shifting them ' \
+            'by %d overflows int64' % (largest, scale, shift)
+
+
+class IncompleteValues(AnonymizerError):
+    def __init__(self, column):
+        self.message = 'Values of low cardinality column %s are not ' \
+            'known in full, their labels would differ across partitions' \
+            % column
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# Append-only journal of key changes for incremental anonymization
+import os
+import pickle
+from collections import ChainMap
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+def is_key_map(value):
+    """
+    True for vectorized value maps, like ArrayKeyMap.
+    """
+    return hasattr(value, 'lookup') and hasattr(value, 'tail')
+
+
+class LayeredDict(ChainMap):
+    """
+    Read view over layers of a key, newest first, with writes going to
+    the newest layer. Nested dicts and vectorized value maps are layered
+    as well when read, so that writing into them never changes older
+    layers and the newest layer only holds what was added.
+    """
+
+    def __getitem__(self, name):
+        top = self.maps[0]
+        if name in top:
+            return top[name]
+        layers = []
+        for layer in self.maps[1:]:
+            if name in layer:
+                layers.append(layer[name])
+                if not isinstance(layer[name], Mapping) and \
+                        not is_key_map(layer[name]):
+                    break
+        if not layers:
+            return self.__missing__(name)
+        if is_key_map(layers[0]):
+            maps = [layer for layer in layers if is_key_map(layer)]
+            value = maps[-1].copy()
+            for layer in reversed(maps[:-1]):
+                value.extend(layer.keys(), layer.values())
+        elif isinstance(layers[0], Mapping):
+            value = LayeredDict({}, *[layer for layer in layers
+                                      if isinstance(layer, Mapping)])
+        else:
+            return layers[0]
+        top[name] = value
+        return value
+
+    def __len__(self):
+        # Count keys of small newer layers, not the union of all of them
+        seen = set()
+        for layer in self.maps[:-1]:
+            seen.update(layer)
+        return len(self.maps[-1]) + \
+            sum(1 for name in seen if name not in self.maps[-1])
+
+    def copy(self):
+        return self.__class__(self.maps[0].copy(), *self.maps[1:])
+
+    __copy__ = copy
+
+
+def unchanged(old, new):
+    """
+    True if a key value was written again without changing.
+    """
+    if old is new:
+        return True
+    try:
+        return type(old) is type(new) and bool(old == new)
+    except (TypeError, ValueError):
+        return False
+
+
+def key_delta(key):
+    """
+    Entries written into a layered key view: new values and, for nested
+    dicts and value maps, only their new entries.
+    """
+    if not isinstance(key, LayeredDict):
+        return key
+    delta = {}
+    for name, value in key.maps[0].items():
+        if isinstance(value, LayeredDict):
+            value = key_delta(value)
+            if not value:
+                continue
+        elif is_key_map(value):
+            start = 0
+            for layer in key.maps[1:]:
+                if name in layer:
+                    if not is_key_map(layer[name]):
+                        break
+                    start += len(layer[name])
+            if start == len(value):
+                continue
+            new_value = value.__class__()
+            new_value.extend(*value.tail(start))
+            value = new_value
+        else:
+            older = [layer[name] for layer in key.maps[1:] if name in layer]
+            if older and unchanged(older[0], value):
+                continue
+        delta[name] = value
+    return delta
+
+
+def merge_delta(key, delta):
+    """
+    Merge a delta into key in place and return key.
+    """
+    for name, value in delta.items():
+        if name not in key:
+            key[name] = value
+        elif is_key_map(value) and is_key_map(key[name]):
+            key[name].extend(value.keys(), value.values())
+        elif isinstance(value, Mapping) and isinstance(key[name], Mapping):
+            merge_delta(key[name], value)
+        else:
+            key[name] = value
+    return key
+
+
+class KeyJournal():
+    """
+    Key kept as a base and an append-only log of per-batch deltas.
+
+    view() gives a working key for the next batch which reads through
+    the base and all deltas; after anonymizing with it, commit() records
+    just the entries the batch added. compact() folds the deltas into the
+    base. With path, the base and every delta are also written to that
+    directory, each delta to its own file, and loaded from it on start.
+    """
+
+    def __init__(self, base=None, path=None):
+        self.base = {} if base is None else base
+        self.deltas = []
+        self.path = path
+        if path is not None:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.__load()
+
+    def __file(self, name):
+        return os.path.join(self.path, name)
+
+    def __delta_files(self):
+        return sorted(name for name in os.listdir(self.path)
+                      if name.startswith('delta-') and name.endswith('.pkl'))
+
+    def __load(self):
+        if os.path.exists(self.__file('base.pkl')):
+            with open(self.__file('base.pkl'), 'rb') as base_file:
+                self.base = pickle.load(base_file)
+        for name in self.__delta_files():
+            with open(self.__file(name), 'rb') as delta_file:
+                self.deltas.append(pickle.load(delta_file))
+
+    def __write(self, name, value):
+        # A crash while writing leaves the previous file in place
+        with open(self.__file(name + '.tmp'), 'wb') as journal_file:
+            pickle.dump(value, journal_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(self.__file(name + '.tmp'), self.__file(name))
+
+    def view(self):
+        """
+        Working key reading through the deltas and the base.
+        """
+        return LayeredDict({}, *(list(reversed(self.deltas)) + [self.base]))
+
+    def commit(self, key):
+        """
+        Record what was added to a working key from view() as a delta.
+        """
+        delta = key_delta(key)
+        if delta:
+            self.deltas.append(delta)
+            if self.path is not None:
+                self.__write('delta-%08d.pkl' % len(self.deltas), delta)
+        return delta
+
+    def compact(self):
+        """
+        Fold the deltas into the base and return it. Views taken before
+        compaction should not be used afterwards.
+        """
+        for delta in self.deltas:
+            merge_delta(self.base, delta)
+        if self.path is not None:
+            self.__write('base.pkl', self.base)
+            for name in self.__delta_files():
+                os.remove(self.__file(name))
+        self.deltas = []
+        return self.base
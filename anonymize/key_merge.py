@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+# Keys shared by independently anonymized partitions of a data set
+import numpy as np
+import pandas as pd
+
+from . import exceptions
+from .anonymize import anonymize, low_cardinality_replace
+from .cardinality import HyperLogLog
+from .encoding import new_secret
+
+# Column kinds whose token maps are rebuilt by every worker
+TOKEN_KINDS = ('generic', 'email')
+
+# Value maps of column keys, merged entry by entry, and their reverse maps
+KEY_MAPS = {'map': 'map_reverse', 'domain_map': 'domain_map_reverse'}
+
+
+def prepare_key(sample, key=None, values=None, **kwargs):
+    """
+    Key with per-column parameters fixed for anonymizing partitions of a
+    data set independently. Types, shifts, scales and low cardinality
+    labels are taken from anonymizing sample (with anonymize() keyword
+    arguments); token maps are dropped and replaced by fixed salts, so
+    every worker produces the same tokens for the same values. Merge the
+    workers' keys with merge_keys().
+
+    Labels are drawn in order of appearance, so workers would label
+    values missing from the sample differently. values maps low
+    cardinality columns to all of their distinct values in the data set,
+    which are labeled here; a low cardinality column without them fails
+    early with IncompleteValues (printed unless quiet without
+    raise_exceptions).
+    """
+    values = {} if values is None else values
+    ret, key = anonymize(sample, key=key, **kwargs)
+    for column, new_column in key['name_map']['old_to_new'].items():
+        column_key = key['data_map'].get(new_column, {})
+        if column_key.get('kind', None) != 'low_cardinality':
+            continue
+        if column not in values:
+            if kwargs.get('raise_exceptions', False):
+                raise exceptions.IncompleteValues(column)
+            elif not kwargs.get('quiet', False):
+                print('Values of low cardinality column %s are not known '
+                      'in full, their labels would differ across '
+                      'partitions' % column)
+            continue
+        ret, key['data_map'][new_column] = low_cardinality_replace(
+            pd.Series(list(values[column]), dtype=object),
+            kwargs.get('low_cardinality_alphabet', None), key=column_key)
+    for column_key in key['data_map'].values():
+        if column_key.get('kind', None) in TOKEN_KINDS:
+            for name, reverse_name in KEY_MAPS.items():
+                column_key.pop(name, None)
+                column_key.pop(reverse_name, None)
+            column_key['salt'] = column_key.get('salt', new_secret())
+    return key
+
+
+def map_items(mapping):
+    """
+    Object arrays of keys and values of a dict or vectorized value map.
+    """
+    return (np.asarray(list(mapping.keys()), dtype=object),
+            np.asarray(list(mapping.values()), dtype=object))
+
+
+def map_lookup(mapping, keys):
+    """
+    Values for keys and a mask of keys that were found.
+    """
+    if hasattr(mapping, 'lookup'):
+        values, found = mapping.lookup(keys)
+        return (np.asarray(values, dtype=object), found)
+    values = np.array([mapping.get(key, None) for key in keys], dtype=object)
+    found = np.array([key in mapping for key in keys], dtype=bool)
+    return (values, found)
+
+
+def differ(left, right):
+    """
+    Elementwise inequality of two object arrays.
+    """
+    return pd.Series(left, dtype=object).ne(
+                pd.Series(right, dtype=object)).values
+
+
+def merge_map(mapping, other, reverse=None):
+    """
+    Add entries of other to mapping, except conflicting ones: keys mapped
+    to another value, or, with a reverse map (value -> key), values
+    mapped from another key (vectorized maps are looked up in reverse
+    themselves). All checks are bulk lookups of other's entries. Returns
+    the number of conflicts and the arrays of added keys and values.
+    """
+    keys, values = map_items(other)
+    if not len(keys):
+        return (0, keys, values)
+    known, found = map_lookup(mapping, keys)
+    conflict = found & differ(known, values)
+    if reverse is None and hasattr(mapping, 'reverse_lookup'):
+        known_keys, found_keys = mapping.reverse_lookup(values)
+        conflict |= found_keys & differ(known_keys, keys)
+    elif reverse is not None:
+        known_keys, found_keys = map_lookup(reverse, values)
+        conflict |= found_keys & differ(known_keys, keys)
+    new = ~found & ~conflict
+    if hasattr(mapping, 'extend'):
+        mapping.extend(keys[new], values[new])
+    else:
+        mapping.update(zip(keys[new], values[new]))
+    return (int(conflict.sum()), keys[new], values[new])
+
+
+def merge_column_key(column_key, other):
+    """
+    Merge the key of one column of another partition into column_key in
+    place. Returns the number of conflicts.
+    """
+    conflicts = 0
+    for name, value in other.items():
+        if name not in column_key:
+            column_key[name] = value
+        elif name in KEY_MAPS:
+            reverse_name = KEY_MAPS[name]
+            mapping = column_key[name]
+            reverse = column_key.get(reverse_name, None)
+            if reverse is None and not hasattr(mapping, 'reverse_lookup') \
+                    and column_key.get('kind', column_key.get('subtype')) \
+                    == 'low_cardinality':
+                # Small maps of values to labels: labels must be unique
+                reverse = dict((label, value)
+                               for value, label in mapping.items())
+            count, keys, values = merge_map(mapping, value, reverse)
+            if reverse_name in column_key:
+                column_key[reverse_name].update(zip(values, keys))
+            conflicts += count
+        elif name in KEY_MAPS.values():
+            continue
+        elif isinstance(value, dict) or hasattr(value, 'lookup'):
+            continue
+        elif not np.all(column_key[name] == value):
+            conflicts += 1
+    return conflicts
+
+
+def merge_key(key, other, raise_exceptions=False, quiet=False):
+    """
+    Merge the key of another partition into key, in place, at the cost
+    of other's entries. Conflicting entries (a column or token mapped
+    differently, differing parameters) keep key's version and are
+    counted per column; with raise_exceptions they raise KeyConflict.
+    Returns (key, conflicts).
+    """
+    conflicts = {}
+
+    def report(column, count):
+        if not count:
+            return
+        conflicts[column] = conflicts.get(column, 0) + count
+        if raise_exceptions:
+            raise exceptions.KeyConflict(column, count)
+        elif not quiet:
+            print('%d conflicting key entries for column %s' %
+                  (count, column))
+
+    name_map = key.setdefault('name_map', {})
+    other_name_map = other.get('name_map', {})
+    for direction in ('old_to_new', 'new_to_old'):
+        mapping = name_map.setdefault(direction, {})
+        for column, name in other_name_map.get(direction, {}).items():
+            if mapping.setdefault(column, name) != name:
+                report(column, 1)
+
+    data_map = key.setdefault('data_map', {})
+    for column, column_key in other.get('data_map', {}).items():
+        if column not in data_map:
+            data_map[column] = column_key
+        else:
+            report(column, merge_column_key(data_map[column], column_key))
+
+    for column, sketch in other.get('cardinality', {}).items():
+        cardinality = key.setdefault('cardinality', {})
+        cardinality[column] = HyperLogLog.from_dict(sketch).merge(
+                                HyperLogLog.from_dict(cardinality[column])) \
+            .to_dict() if column in cardinality else sketch
+    for column, count in other.get('type_mismatches', {}).items():
+        mismatches = key.setdefault('type_mismatches', {})
+        mismatches[column] = mismatches.get(column, 0) + count
+    for name, value in other.items():
+        key.setdefault(name, value)
+    return (key, conflicts)
+
+
+def merge_keys(keys, raise_exceptions=False, quiet=False):
+    """
+    Merge keys of partitions anonymized with the same prepare_key() into
+    the first one. Returns (key, conflicts).
+    """
+    key = keys[0]
+    conflicts = {}
+    for other in keys[1:]:
+        key, other_conflicts = merge_key(key, other,
+                                         raise_exceptions=raise_exceptions,
+                                         quiet=quiet)
+        for column, count in other_conflicts.items():
+            conflicts[column] = conflicts.get(column, 0) + count
+    return (key, conflicts)
@@ -0,0 +1,843 @@
+# -*- coding: utf-8 -*-
+# Alternative backends for the value maps kept in keys
+import os
+import sqlite3
+import tempfile
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Lookups of at most this many values use IN (...), larger ones a join
+# with a temporary table
+SQLITE_IN_LIMIT = 500
+
+
+class StringArray():
+    """
+    Strings packed into one UTF-8 buffer with their offsets, plus the
+    uint64 hash of every string for hash indexes, instead of one Python
+    object per string. Strings are only decoded when taken.
+    """
+
+    def __init__(self, data=b'', offsets=None, hashes=None):
+        self.data = data
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None \
+            else offsets
+        self.hashes = np.array([], dtype=np.uint64) if hashes is None \
+            else hashes
+
+    @classmethod
+    def from_strings(cls, strings):
+        strings = np.asarray(strings, dtype=object)
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64,
+                              count=len(encoded)), out=offsets[1:])
+        return cls(b''.join(encoded), offsets, hash_items(strings))
+
+    @classmethod
+    def concatenate(cls, arrays):
+        offsets = [arrays[0].offsets]
+        for array in arrays[1:]:
+            offsets.append(array.offsets[1:] + offsets[-1][-1])
+        return cls(b''.join(array.data for array in arrays),
+                   np.concatenate(offsets),
+                   np.concatenate([array.hashes for array in arrays]))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def nbytes(self):
+        return len(self.data) + self.offsets.nbytes + self.hashes.nbytes
+
+    def take(self, positions):
+        """
+        Object array of the strings at positions.
+        """
+        data = self.data
+        starts = self.offsets[positions].tolist()
+        ends = self.offsets[np.asarray(positions) + 1].tolist()
+        ret = np.empty(len(starts), dtype=object)
+        ret[:] = [data[start:end].decode('utf-8')
+                  for start, end in zip(starts, ends)]
+        return ret
+
+    def tail(self, start):
+        """
+        StringArray of the strings from position start on.
+        """
+        offsets = self.offsets[start:]
+        return StringArray(self.data[offsets[0]:offsets[-1]],
+                           offsets - offsets[0], self.hashes[start:])
+
+    def to_array(self):
+        return self.take(np.arange(len(self)))
+
+
+def hash_items(items):
+    """
+    uint64 hashes of an object array, equal for equal strings.
+    """
+    return pd.util.hash_array(np.asarray(items, dtype=object),
+                              categorize=False)
+
+
+def packed_array(items):
+    """
+    Most compact storage of an array of items: a StringArray for strings,
+    a number array if possible, an object array otherwise.
+    """
+    if isinstance(items, StringArray):
+        return items
+    items = np.asarray(items)
+    if items.dtype.kind in 'SU':
+        items = items.astype(object)
+    if items.dtype == object:
+        inferred = pd.api.types.infer_dtype(items, skipna=False)
+        if inferred == 'string':
+            return StringArray.from_strings(items)
+        elif inferred in ('integer', 'floating'):
+            items = np.asarray(items.tolist())
+    return items
+
+
+def unpacked_array(items):
+    """
+    NumPy array of a packed_array().
+    """
+    return items.to_array() if isinstance(items, StringArray) else items
+
+
+def concatenate(arrays):
+    """
+    Concatenate packed arrays, falling back to object dtype when their
+    kinds differ, e.g. numbers and strings.
+    """
+    if all(isinstance(array, StringArray) for array in arrays):
+        return StringArray.concatenate(arrays)
+    arrays = [unpacked_array(array) for array in arrays]
+    if len(set(array.dtype.kind for array in arrays)) > 1:
+        arrays = [array.astype(object) for array in arrays]
+    return np.concatenate(arrays)
+
+
+def packed_index(items):
+    """
+    Index over a packed array: the order sorting the hashes of strings
+    or the numbers, or a pandas Index over other objects.
+    """
+    if isinstance(items, StringArray):
+        order = np.argsort(items.hashes, kind='stable')
+    elif items.dtype.kind in 'iufb':
+        order = np.argsort(items, kind='stable')
+    else:
+        return pd.Index(items)
+    return order.astype(np.int32) if len(order) < 2**31 else order
+
+
+def index_positions(items, index, queries):
+    """
+    Positions of an object array of queries in packed items with their
+    packed_index(), -1 for queries that are not found. Candidates found
+    by hash or value are checked for equality.
+    """
+    if isinstance(index, pd.Index):
+        return index.get_indexer(queries)
+    positions = np.full(len(queries), -1, dtype=np.int64)
+    if not len(items) or not len(queries):
+        return positions
+    if isinstance(items, StringArray):
+        sorted_by = items.hashes
+        needles = hash_items(queries)
+        candidates = np.flatnonzero(np.fromiter(
+                        (isinstance(query, str) for query in queries),
+                        dtype=bool, count=len(queries)))
+    else:
+        sorted_by = items
+        needles = np.asarray(queries.tolist())
+        candidates = np.arange(len(queries))
+        if needles.dtype.kind not in 'iufb':
+            candidates = np.flatnonzero(np.fromiter(
+                            (isinstance(query, (int, float, np.number))
+                             for query in queries),
+                            dtype=bool, count=len(queries)))
+            needles = np.zeros(len(queries))
+            needles[candidates] = queries[candidates].tolist()
+    needles = needles[candidates]
+    starts = np.searchsorted(sorted_by, needles, sorter=index)
+    inside = starts < len(items)
+    candidates, needles, starts = \
+        candidates[inside], needles[inside], starts[inside]
+    matched = sorted_by[index[starts]] == needles
+    candidates, needles, starts = \
+        candidates[matched], needles[matched], starts[matched]
+    if not isinstance(items, StringArray):
+        positions[candidates] = index[starts]
+        return positions
+    # Equal hashes of different strings are followed to the next entries
+    found = items.take(index[starts]) == queries[candidates]
+    positions[candidates[found]] = index[starts[found]]
+    for candidate, needle, start in zip(candidates[~found],
+                                        needles[~found], starts[~found]):
+        start += 1
+        while start < len(items) and sorted_by[index[start]] == needle:
+            if items.take([index[start]])[0] == queries[candidate]:
+                positions[candidate] = index[start]
+                break
+            start += 1
+    return positions
+
+
+def key_map(backend=None):
+    """
+    New empty value map for the given backend: a dict by default, an
+    ArrayKeyMap for 'array', or a SqliteKeyMap for 'sqlite' (in a new
+    temporary database file, deleted by its close()) or 'sqlite:<path>'
+    (in the database at path).
+    """
+    if backend == 'array':
+        return ArrayKeyMap()
+    if backend is not None and backend.split(':', 1)[0] == 'sqlite':
+        return SqliteKeyMap(backend[7:] or None)
+    return {}
+
+
+def to_python(value):
+    """
+    Plain Python value of a NumPy scalar, e.g. to store it in SQLite.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def object_array(items):
+    """
+    Object array of items, numeric if all of them are integers or floats.
+    """
+    items = np.asarray(items, dtype=object)
+    inferred = pd.api.types.infer_dtype(items, skipna=False)
+    if inferred == 'integer':
+        return items.astype(np.int64)
+    if inferred == 'floating':
+        return items.astype(np.float64)
+    return items
+
+
+class ArrayKeyMap():
+    """
+    Value map that keeps keys and values in aligned packed arrays with a
+    hash index over them, instead of one dict entry per value: strings
+    are stored as UTF-8 buffers with offsets and indexed by the order of
+    their uint64 hashes, numbers as NumPy arrays indexed by their sorting
+    order, see packed_array(). Supports vectorized lookup in both
+    directions and vectorized append; single values can be used like
+    with a dict.
+
+    Appended arrays are kept as segments which are merged whenever the
+    newest segment grows to the size of the previous one, so appends cost
+    amortized O(log n) per value and there are O(log n) segments to look
+    up in.
+    """
+
+    def __init__(self, keys=None, values=None):
+        self.__segments = []
+        self.__size = 0
+        if keys is not None and len(keys):
+            self.extend(keys, values)
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        for segment in self.__segments:
+            for key in unpacked_array(segment['keys']):
+                yield key
+
+    def __contains__(self, key):
+        return bool(self.lookup([key])[1][0])
+
+    def __getitem__(self, key):
+        values, found = self.lookup([key])
+        if not found[0]:
+            raise KeyError(key)
+        return values[0]
+
+    def __setitem__(self, key, value):
+        if key in self:
+            raise ValueError('ArrayKeyMap entries can not be changed')
+        self.extend([key], [value])
+
+    def get(self, key, default=None):
+        values, found = self.lookup([key])
+        return values[0] if found[0] else default
+
+    def keys(self):
+        return unpacked_array(concatenate([segment['keys']
+                                           for segment in self.__segments])) \
+            if self.__segments else np.array([], dtype=object)
+
+    def values(self):
+        return unpacked_array(concatenate([segment['values']
+                                           for segment in self.__segments])) \
+            if self.__segments else np.array([], dtype=object)
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    @property
+    def nbytes(self):
+        """
+        Bytes held by the arrays and indexes of the map.
+        """
+        total = 0
+        for segment in self.__segments:
+            for name in ['keys', 'values', 'keys_index', 'values_index']:
+                total += getattr(segment[name], 'nbytes', 0) or 0
+        return total
+
+    def copy(self):
+        """
+        Map sharing this map's arrays: arrays are never changed in place,
+        so extending either map leaves the other one as it is.
+        """
+        ret = ArrayKeyMap()
+        ret.__segments = [dict(segment) for segment in self.__segments]
+        ret.__size = self.__size
+        return ret
+
+    def tail(self, start):
+        """
+        Arrays of keys and values appended after the first start entries.
+        """
+        keys = []
+        values = []
+        offset = 0
+        for segment in self.__segments:
+            end = offset + len(segment['keys'])
+            if end > start:
+                for name, arrays in [('keys', keys), ('values', values)]:
+                    array = segment[name]
+                    position = max(start - offset, 0)
+                    arrays.append(array.tail(position)
+                                  if isinstance(array, StringArray)
+                                  else array[position:])
+            offset = end
+        if not keys:
+            return (np.array([], dtype=object), np.array([], dtype=object))
+        return (unpacked_array(concatenate(keys)),
+                unpacked_array(concatenate(values)))
+
+    def __lookup(self, items, side, other):
+        items = np.asarray(items, dtype=object)
+        ret = np.empty(len(items), dtype=object)
+        found = np.zeros(len(items), dtype=bool)
+        for segment in self.__segments:
+            if segment[side + '_index'] is None:
+                segment[side + '_index'] = packed_index(segment[side])
+            positions = index_positions(segment[side],
+                                        segment[side + '_index'], items)
+            hits = positions >= 0
+            values = segment[other]
+            ret[hits] = values.take(positions[hits]) \
+                if isinstance(values, StringArray) \
+                else values[positions[hits]]
+            found |= hits
+        dtypes = set(getattr(segment[other], 'dtype', None)
+                     for segment in self.__segments)
+        if found.all() and len(dtypes) == 1:
+            dtype = dtypes.pop()
+            if dtype is not None and dtype.kind in 'iufb':
+                ret = ret.astype(dtype)
+        return (ret, found)
+
+    def lookup(self, keys):
+        """
+        Values for an array of keys and a mask of keys that were found.
+        """
+        return self.__lookup(keys, 'keys', 'values')
+
+    def reverse_lookup(self, values):
+        """
+        Keys for an array of values and a mask of values that were found.
+        """
+        return self.__lookup(values, 'values', 'keys')
+
+    def extend(self, keys, values):
+        """
+        Append arrays of new keys and corresponding values.
+        """
+        keys = packed_array(keys)
+        values = packed_array(values)
+        if len(keys) != len(values):
+            raise ValueError('keys and values must have the same length')
+        if not len(keys):
+            return
+        self.__segments.append({'keys': keys, 'values': values,
+                                'keys_index': None, 'values_index': None})
+        self.__size += len(keys)
+        while len(self.__segments) > 1 and \
+                len(self.__segments[-2]['keys']) <= \
+                len(self.__segments[-1]['keys']):
+            last = self.__segments.pop()
+            previous = self.__segments.pop()
+            self.__segments.append({
+                'keys': concatenate([previous['keys'], last['keys']]),
+                'values': concatenate([previous['values'], last['values']]),
+                'keys_index': None,
+                'values_index': None})
+
+
+MISSING = object()
+
+
+class MemoCache():
+    """
+    Base of bounded caches, counting hits, misses and evictions.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.owner = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def bind(self, owner):
+        """
+        Tie the cache to the token map (or secret) its entries come from.
+        Binding it to another one, e.g. after the key was replaced, clears
+        it, so that tokens of a former key are never served.
+        """
+        if self.owner is not owner:
+            self.clear()
+            self.owner = owner
+        return self
+
+    def stats(self):
+        """
+        Size, capacity, hit, miss and eviction counts and the hit rate.
+        """
+        lookups = self.hits + self.misses
+        return {'size': len(self), 'capacity': self.capacity,
+                'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': float(self.hits) / lookups if lookups else None}
+
+    def reset_stats(self):
+        self.hits = self.misses = self.evictions = 0
+
+
+class LRUCache(MemoCache):
+    """
+    Dict-like cache holding at most capacity entries, evicting the least
+    recently used one first.
+    """
+
+    def __init__(self, capacity=65536):
+        MemoCache.__init__(self, capacity)
+        self.__entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def get(self, key, default=None):
+        if key not in self.__entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return self.__entries[key]
+
+    def put(self, key, value):
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.capacity:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.__entries.clear()
+
+
+class ClockCache(MemoCache):
+    """
+    Dict-like cache holding at most capacity entries with CLOCK eviction,
+    an approximation of LRU that is cheaper on hits: they only set the
+    entry's reference bit. To make room, a hand sweeps over the slots,
+    clearing set bits, and evicts the first entry whose bit is clear.
+    """
+
+    def __init__(self, capacity=65536):
+        MemoCache.__init__(self, capacity)
+        self.__slots = {}
+        self.__keys = []
+        self.__values = []
+        self.__referenced = []
+        self.__hand = 0
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def __contains__(self, key):
+        return key in self.__slots
+
+    def get(self, key, default=None):
+        slot = self.__slots.get(key, None)
+        if slot is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__referenced[slot] = True
+        return self.__values[slot]
+
+    def put(self, key, value):
+        slot = self.__slots.get(key, None)
+        if slot is not None:
+            self.__values[slot] = value
+            self.__referenced[slot] = True
+            return
+        if self.capacity <= 0:
+            return
+        if len(self.__keys) < self.capacity:
+            self.__slots[key] = len(self.__keys)
+            self.__keys.append(key)
+            self.__values.append(value)
+            self.__referenced.append(False)
+            return
+        while self.__referenced[self.__hand]:
+            self.__referenced[self.__hand] = False
+            self.__hand = (self.__hand + 1) % self.capacity
+        slot = self.__hand
+        del self.__slots[self.__keys[slot]]
+        self.__slots[key] = slot
+        self.__keys[slot] = key
+        self.__values[slot] = value
+        self.__hand = (slot + 1) % self.capacity
+        self.evictions += 1
+
+    def clear(self):
+        self.__slots.clear()
+        self.__keys = []
+        self.__values = []
+        self.__referenced = []
+        self.__hand = 0
+
+
+def memo_cache(capacity=65536, policy='lru'):
+    """
+    New bounded cache with the given eviction policy, 'lru' (LRUCache)
+    or 'clock' (ClockCache).
+    """
+    if policy == 'lru':
+        return LRUCache(capacity)
+    if policy == 'clock':
+        return ClockCache(capacity)
+    raise ValueError('Unknown cache policy: %s' % policy)
+
+
+def cached_replace(values, replace, cache=None):
+    """
+    replace(values) for an array of distinct values behind a memo cache:
+    cached values are resolved from it, the others are replaced in one
+    batch and cached. Without a cache values are just replaced.
+    """
+    if cache is None:
+        return replace(values)
+    values = np.asarray(values, dtype=object)
+    tokens = np.empty(len(values), dtype=object)
+    missing = []
+    for position, value in enumerate(values):
+        token = cache.get(value, MISSING)
+        if token is MISSING:
+            missing.append(position)
+        else:
+            tokens[position] = token
+    if missing:
+        new_tokens = replace(values[missing])
+        for value, token in zip(values[missing], new_tokens):
+            if token is not None:
+                cache.put(value, token)
+        tokens[missing] = new_tokens
+    return tokens
+
+
+class MemoCaches():
+    """
+    Memo caches by name, e.g. of columns or parts of them, created with
+    capacity entries and policy eviction on first use, see memo_cache().
+    Pickled copies start empty, so caches are not sent to worker
+    processes.
+    """
+
+    def __init__(self, capacity=65536, policy='lru'):
+        self.capacity = capacity
+        self.policy = policy
+        self.caches = {}
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'policy': self.policy}
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], state['policy'])
+
+    def get(self, name):
+        if name not in self.caches:
+            self.caches[name] = memo_cache(self.capacity, self.policy)
+        return self.caches[name]
+
+    def stats(self):
+        """
+        Stats of every cache, by name, see MemoCache.stats().
+        """
+        return dict((name, cache.stats())
+                    for name, cache in self.caches.items())
+
+
+class SqliteKeyMap():
+    """
+    Value map kept in a table of a local SQLite database, for maps that
+    do not fit in memory. Has the interface of ArrayKeyMap: whole arrays
+    are inserted with executemany() and looked up with one IN (...) query
+    or a join with a temporary table, after checking an in-memory LRU
+    cache of recently used entries in both directions.
+
+    Pickled maps only hold the database path and table name, so keys
+    with them can be saved and passed to worker processes.
+
+    Without a path the map creates a temporary database file and owns it:
+    close() deletes it. Pickled maps keep that ownership, so a map created
+    in a worker process still deletes its file when the key it is sent
+    back in is closed; only one of a map and its copies should be closed.
+    A database at a given path belongs to the caller.
+    """
+
+    def __init__(self, path=None, table=None, cache_size=65536):
+        self.temporary = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(suffix='.sqlite')
+            os.close(handle)
+        self.path = path
+        self.table = 'map_' + uuid.uuid4().hex if table is None else table
+        self.cache_size = cache_size
+        self.__connect()
+
+    def __connect(self):
+        # Maps may be written from a reverse sink's thread
+        self.__connection = sqlite3.connect(self.path, timeout=60,
+                                            check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        with self.__connection:
+            self.__connection.execute(
+                'CREATE TABLE IF NOT EXISTS %s (key PRIMARY KEY, value)'
+                % self.table)
+            self.__connection.execute(
+                'CREATE INDEX IF NOT EXISTS %s_value ON %s (value)'
+                % (self.table, self.table))
+        self.__size = self.__connection.execute(
+                        'SELECT COUNT(*) FROM %s' % self.table).fetchone()[0]
+        self.__caches = {'key': LRUCache(self.cache_size),
+                         'value': LRUCache(self.cache_size)}
+
+    def __getstate__(self):
+        return {'path': self.path, 'table': self.table,
+                'cache_size': self.cache_size, 'temporary': self.temporary}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self.table = state['table']
+        self.cache_size = state['cache_size']
+        self.temporary = state.get('temporary', False)
+        self.__connect()
+
+    def close(self):
+        """
+        Close the connection and delete the database file if it is a
+        temporary one created by this map.
+        """
+        self.__connection.close()
+        if self.temporary:
+            for suffix in ['', '-wal', '-shm']:
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            self.temporary = False
+
+    def __len__(self):
+        return self.__size
+
+    def __iter__(self):
+        for row in self.__connection.execute(
+                'SELECT key FROM %s ORDER BY rowid' % self.table):
+            yield row[0]
+
+    def __contains__(self, key):
+        return bool(self.lookup([key])[1][0])
+
+    def __getitem__(self, key):
+        values, found = self.lookup([key])
+        if not found[0]:
+            raise KeyError(key)
+        return values[0]
+
+    def __setitem__(self, key, value):
+        self.extend([key], [value])
+
+    def get(self, key, default=None):
+        values, found = self.lookup([key])
+        return values[0] if found[0] else default
+
+    def __column(self, column):
+        return object_array([row[0] for row in self.__connection.execute(
+                                'SELECT %s FROM %s ORDER BY rowid'
+                                % (column, self.table))])
+
+    def keys(self):
+        return self.__column('key')
+
+    def values(self):
+        return self.__column('value')
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __query(self, items, side, other):
+        """
+        Pairs (item, result) for the items found in column side.
+        """
+        if len(items) <= SQLITE_IN_LIMIT:
+            return self.__connection.execute(
+                        'SELECT %s, %s FROM %s WHERE %s IN (%s)'
+                        % (side, other, self.table, side,
+                           ', '.join('?' * len(items))), items).fetchall()
+        with self.__connection:
+            self.__connection.execute(
+                'CREATE TEMP TABLE IF NOT EXISTS lookup (item)')
+            self.__connection.execute('DELETE FROM lookup')
+            self.__connection.executemany(
+                'INSERT INTO lookup (item) VALUES (?)',
+                ((item, ) for item in items))
+            return self.__connection.execute(
+                        'SELECT t.%s, t.%s FROM lookup l JOIN %s t '
+                        'ON t.%s = l.item' % (side, other, self.table,
+                                              side)).fetchall()
+
+    def __lookup(self, items, side, other):
+        items = [to_python(item) for item in items]
+        ret = np.empty(len(items), dtype=object)
+        found = np.zeros(len(items), dtype=bool)
+        cache = self.__caches[side]
+        missing = {}
+        for position, item in enumerate(items):
+            value = cache.get(item, MISSING)
+            if value is MISSING:
+                missing.setdefault(item, []).append(position)
+            else:
+                ret[position] = value
+                found[position] = True
+        if missing:
+            for item, result in self.__query(list(missing), side, other):
+                positions = missing.get(item, [])
+                ret[positions] = result
+                found[positions] = True
+                cache.put(item, result)
+        if found.all():
+            ret = object_array(ret)
+        return (ret, found)
+
+    def lookup(self, keys):
+        """
+        Values for an array of keys and a mask of keys that were found.
+        """
+        return self.__lookup(keys, 'key', 'value')
+
+    def reverse_lookup(self, values):
+        """
+        Keys for an array of values and a mask of values that were found.
+        """
+        return self.__lookup(values, 'value', 'key')
+
+    def extend(self, keys, values):
+        """
+        Insert arrays of new keys and corresponding values.
+        """
+        if len(keys) != len(values):
+            raise ValueError('keys and values must have the same length')
+        rows = [(to_python(key), to_python(value))
+                for key, value in zip(keys, values)]
+        try:
+            with self.__connection:
+                self.__connection.executemany(
+                    'INSERT INTO %s (key, value) VALUES (?, ?)' % self.table,
+                    rows)
+        except sqlite3.IntegrityError:
+            raise ValueError('SqliteKeyMap entries can not be changed')
+        self.__size += len(rows)
+        for key, value in rows:
+            self.__caches['key'].put(key, value)
+            self.__caches['value'].put(value, key)
+
+
+class AsyncReverseSink():
+    """
+    Writes token -> value pairs into a value map in a background thread,
+    so that stateless replacers can keep an optional reverse map off their
+    hot path. Writes are applied in submission order; flush() waits for
+    them and raises the error of the first failed one. The map should not
+    be used elsewhere until then.
+    """
+
+    def __init__(self, mapping=None, backend=None):
+        self.mapping = key_map(backend) if mapping is None else mapping
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__futures = []
+
+    def __write(self, tokens, values):
+        tokens = np.asarray(tokens, dtype=object)
+        values = np.asarray(values, dtype=object)
+        if hasattr(self.mapping, 'lookup'):
+            new = ~self.mapping.lookup(tokens)[1] & \
+                ~pd.Series(tokens).duplicated().values
+            self.mapping.extend(tokens[new], values[new])
+        else:
+            for token, value in zip(tokens, values):
+                self.mapping[token] = value
+
+    def submit(self, tokens, values):
+        """
+        Queue writing of arrays of tokens and corresponding values.
+        """
+        # Failed writes are kept for flush() to raise their errors
+        self.__futures = [future for future in self.__futures
+                          if not future.done() or future.exception()]
+        self.__futures.append(self.__executor.submit(self.__write,
+                                                     list(tokens),
+                                                     list(values)))
+
+    def flush(self):
+        """
+        Wait for all queued writes and return the map, or raise the error
+        of the first failed one.
+        """
+        futures, self.__futures = self.__futures, []
+        errors = [error for error in [future.exception()
+                                      for future in futures]
+                  if error is not None]
+        if errors:
+            raise errors[0]
+        return self.mapping
+
+    def close(self):
+        self.flush()
+        self.__executor.shutdown()
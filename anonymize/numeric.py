@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+# Whole-array scale and shift transformations of numeric and time columns
+import numpy as np
+import pandas as pd
+
+from . import exceptions
+
+# Elements processed at once; bounds the size of temporary noise arrays
+BLOCK_SIZE = 1 << 16
+
+# Nanoseconds in a day
+DAY = 86400 * 10**9
+NAT = np.iinfo(np.int64).min
+INT64_MAX = np.iinfo(np.int64).max
+
+
+def int_scale_shift(values, scale=None, shift=None, max_scale=1024):
+    """
+    Draw missing scale and shift for an integer array: scale from
+    [1, max_scale], shift from the range of scaled values if they are not
+    negative, 0 otherwise. The scale is capped so that scaled values with
+    noise still fit in int64; exceptions.IntegerOverflow is raised when
+    they can not.
+    """
+    min_val = int(np.min(values)) if len(values) else 0
+    max_val = int(np.max(values)) if len(values) else 0
+    largest = max(abs(min_val), abs(max_val))
+    # |value| * scale + noise < (|value| + 1) * scale has to fit in int64
+    max_fit = INT64_MAX // (largest + 1)
+    if scale is None:
+        if max_fit < 1:
+            raise exceptions.IntegerOverflow(largest, 1, shift or 0)
+        scale = np.random.randint(1, min(max_scale, max_fit) + 1)
+    if scale > max_fit:
+        raise exceptions.IntegerOverflow(largest, scale, shift or 0)
+    if shift is None:
+        shift = np.random.randint(min_val * scale, max_val * scale + 1) \
+            if min_val >= 0 else 0
+    elif min_val * scale - shift < NAT or \
+            (max_val + 1) * scale - shift > INT64_MAX:
+        raise exceptions.IntegerOverflow(largest, scale, shift)
+    return (int(scale), int(shift))
+
+
+def float_scale_shift(values, scale=None, shift=None):
+    """
+    Draw missing scale and shift for a floating point array: scale is a
+    random fraction of the mean, shift is drawn from the range of scaled
+    values if they are not negative, 0.0 otherwise.
+    """
+    if scale is None:
+        scale = np.random.random() * np.nanmean(values) \
+            if len(values) else 1.0
+        scale = scale if scale and np.isfinite(scale) else 1.0
+    if shift is None:
+        min_val, max_val = sorted([np.nanmin(values) * scale,
+                                   np.nanmax(values) * scale]) \
+            if len(values) else (0.0, 0.0)
+        shift = np.random.uniform(min_val, max_val) if min_val >= 0.0 \
+            else 0.0
+    return (float(scale), float(shift))
+
+
+def int_affine(values, scale, shift, out=None):
+    """
+    values * scale + noise - shift with integer noise from [0, scale), so
+    that (ret + shift) // scale gives values back. Writes to out, which
+    may be values itself, or to a new int64 array.
+    """
+    if out is None:
+        out = np.empty(len(values), dtype=np.int64)
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = out[start:start + BLOCK_SIZE]
+        np.multiply(values[start:start + BLOCK_SIZE].astype(np.int64,
+                                                            copy=False),
+                    scale, out=block)
+        block += np.random.randint(0, scale, len(block))
+        block -= shift
+    return out
+
+
+def float_affine(values, scale, shift, out=None):
+    """
+    values * scale + noise - shift with noise from [0, scale). Writes to
+    out, which may be values itself, or to a new float64 array.
+    """
+    if out is None:
+        out = np.empty(len(values), dtype=np.float64)
+    for start in range(0, len(values), BLOCK_SIZE):
+        block = out[start:start + BLOCK_SIZE]
+        np.multiply(values[start:start + BLOCK_SIZE], scale, out=block)
+        noise = np.random.random_sample(len(block))
+        noise *= scale
+        block += noise
+        block -= shift
+    return out
+
+
+def output_array(values, dtype, inplace=False):
+    """
+    values itself when anonymizing in place and its dtype fits, None
+    (a new array) otherwise.
+    """
+    if inplace and values.dtype == dtype and values.flags.writeable:
+        return values
+    return None
+
+
+def precision_ns(precision='s'):
+    """
+    Nanoseconds in one unit of precision, e.g. 's' or 'D'.
+    """
+    return pd.Timedelta(1, unit=precision).value
+
+
+def time_values(series, timedeltas=False):
+    """
+    Datetime or timedelta series, its int64 nanoseconds (UTC for time
+    zone aware datetimes) and NaT mask. Series of other types are parsed
+    as datetimes first, or as timedeltas if timedeltas is set.
+    """
+    if not (pd.api.types.is_datetime64_any_dtype(series) or
+            pd.api.types.is_timedelta64_dtype(series)):
+        if timedeltas:
+            series = pd.to_timedelta(series.astype(str), errors='coerce')
+        else:
+            series = pd.to_datetime(series, errors='coerce')
+    values = series.values
+    return (series, values.view(np.int64), np.isnat(values))
+
+
+def time_series(values, like):
+    """
+    Series of int64 nanoseconds with the type, index and name of like.
+    """
+    if pd.api.types.is_timedelta64_dtype(like):
+        values = values.view('timedelta64[ns]')
+    else:
+        values = values.view('datetime64[ns]')
+    ret = pd.Series(values, index=like.index, name=like.name, copy=False)
+    tz = getattr(like.dtype, 'tz', None)
+    if tz is not None:
+        ret = ret.dt.tz_localize('UTC').dt.tz_convert(tz)
+    return ret
+
+
+def draw_time_shift(values, nat, timediff_max=100000):
+    """
+    Random shift from [0, min(range of values in seconds, timediff_max)].
+    """
+    valid = values[~nat] if nat.any() else values
+    abs_diff = (int(valid.max()) - int(valid.min())) // 10**9 \
+        if len(valid) else 0
+    abs_diff = abs_diff if abs_diff else timediff_max
+    return int(np.random.randint(0, min(abs_diff, timediff_max) + 1))
+
+
+def time_shift(values, nat, shift, precision='s', out=None):
+    """
+    Subtract shift, counted in precision units, from int64 nanoseconds
+    of datetimes or timedeltas, keeping NaT.
+    """
+    out = np.subtract(values, shift * precision_ns(precision), out=out)
+    out[nat] = NAT
+    return out
+
+
+def time_of_day_shift(values, nat, shift, precision='s', out=None):
+    """
+    Subtract shift, counted in precision units, from the time of day of
+    int64 nanoseconds, wrapping around within the day and keeping NaT.
+    Dates of datetimes are kept.
+    """
+    time_of_day = np.mod(values, DAY)
+    days = values - time_of_day
+    time_of_day -= shift * precision_ns(precision)
+    np.mod(time_of_day, DAY, out=time_of_day)
+    out = np.add(days, time_of_day, out=out)
+    out[nat] = NAT
+    return out
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Column-parallel execution helpers
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def run_seeded(seed, func, *args, **kwargs):
+    """
+    Call func after seeding random generators. Worker processes forked
+    from one parent share its random state, so every task gets its own
+    seed drawn in the parent.
+    """
+    np.random.seed(seed)
+    random.seed(seed)
+    return func(*args, **kwargs)
+
+
+def map_tasks(tasks, n_jobs=None, executor=None):
+    """
+    Run tasks, a list of (func, args, kwargs), and return their results
+    in task order. Tasks run in the current process unless an executor
+    is given or n_jobs is not 1, in which case a ProcessPoolExecutor with
+    n_jobs workers (all cores for n_jobs < 1) is used. Functions and
+    arguments must be picklable to run in other processes.
+    """
+    if executor is None and (n_jobs is None or n_jobs == 1):
+        return [func(*args, **kwargs) for func, args, kwargs in tasks]
+
+    seeds = np.random.randint(0, 2**32 - 1, len(tasks), dtype=np.int64)
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(
+                        max_workers=n_jobs if n_jobs > 0 else None)
+    try:
+        futures = [executor.submit(run_seeded, int(seed), func,
+                                   *args, **kwargs)
+                   for seed, (func, args, kwargs) in zip(seeds, tasks)]
+        return [future.result() for future in futures]
+    finally:
+        if own_executor:
+            executor.shutdown()
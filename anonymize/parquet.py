@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+# Streaming anonymization of Parquet files, one row group at a time
+import numpy as np
+import pandas as pd
+
+from .anonymize import column_kind, column_name_replace, column_task, \
+    deduce_type_from_dtype, init_key
+from .numeric import DAY, NAT, draw_time_shift, float_affine, \
+    float_scale_shift, int_affine, int_scale_shift, precision_ns, time_shift
+from .profiling import measure
+
+
+def import_pyarrow():
+    """
+    pyarrow, pyarrow.compute and pyarrow.parquet. pyarrow is an optional
+    dependency, install it with pip install anonymize[parquet].
+    """
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('anonymize_parquet() requires pyarrow, install '
+                          'it with pip install anonymize[parquet]')
+    return (pyarrow, pyarrow.compute, pyarrow.parquet)
+
+
+def is_text(pa, type):
+    """
+    True for string and binary Arrow types.
+    """
+    return pa.types.is_string(type) or pa.types.is_large_string(type) or \
+        pa.types.is_binary(type) or pa.types.is_large_binary(type)
+
+
+def arrow_column_type(pa, type):
+    """
+    Column type, as deduced from pandas dtypes, of an Arrow type.
+    """
+    if pa.types.is_dictionary(type):
+        type = type.value_type
+    if pa.types.is_date(type) or pa.types.is_timestamp(type):
+        return 'datetime'
+    if is_text(pa, type):
+        return 'generic'
+    try:
+        return deduce_type_from_dtype(str(np.dtype(type.to_pandas_dtype())))
+    except (NotImplementedError, TypeError):
+        return 'generic'
+
+
+def null_mask(chunk):
+    """
+    Boolean numpy mask of nulls of an Arrow array, None without nulls.
+    """
+    if not chunk.null_count:
+        return None
+    return chunk.is_null().to_numpy(zero_copy_only=False)
+
+
+def affine_array(pa, pc, chunk, kind, column_key):
+    """
+    Anonymize an int, float or datetime Arrow array with scale and shift
+    (kind int, float or date) on its values buffer, like int_replace(),
+    float_replace() and date_replace(), keeping nulls. Date types are
+    shifted by a nonzero number of whole days, so that they are not
+    truncated to another day when cast back. Returns (array, column_key).
+    """
+    column_key = dict(column_key, kind=kind)
+    mask = null_mask(chunk)
+    if kind == 'date':
+        type = chunk.type
+        tz = getattr(type, 'tz', None)
+        values = pc.cast(pc.cast(chunk, pa.timestamp('ns', tz)), pa.int64())
+        values = pc.fill_null(values, NAT).to_numpy()
+        nat = values == NAT
+        if 'shift' not in column_key and pa.types.is_date(type):
+            # Rounding a shift in seconds to days would often give 0
+            valid = values[~nat]
+            days = (int(valid.max()) - int(valid.min())) // DAY \
+                if len(valid) else 0
+            column_key['shift'] = int(np.random.randint(1, max(days, 1) + 1))
+            column_key['precision'] = 'D'
+        elif 'shift' not in column_key:
+            column_key['shift'] = draw_time_shift(values, nat)
+        column_key['precision'] = column_key.get('precision', 's')
+        if pa.types.is_date(type) and column_key['precision'] != 'D':
+            shift = column_key['shift'] * \
+                precision_ns(column_key['precision'])
+            column_key['shift'] = int(round(float(shift) / DAY))
+            column_key['precision'] = 'D'
+        out = time_shift(values, nat, column_key['shift'],
+                         column_key['precision'])
+        array = pa.array(out, mask=nat).cast(pa.timestamp('ns', tz))
+        return (pc.cast(array, type, safe=False), column_key)
+    if kind == 'int':
+        values = pc.fill_null(chunk, 0).to_numpy()
+        valid = values if mask is None else values[~mask]
+        scale, shift = int_scale_shift(valid, column_key.get('scale', None),
+                                       column_key.get('shift', None))
+        out = int_affine(values, scale, shift)
+    else:
+        values = pc.fill_null(pc.cast(chunk, pa.float64()),
+                              np.nan).to_numpy()
+        scale, shift = float_scale_shift(values,
+                                         column_key.get('scale', None),
+                                         column_key.get('shift', None))
+        out = float_affine(values, scale, shift)
+    column_key['scale'] = scale
+    column_key['shift'] = shift
+    return (pa.array(out, mask=mask), column_key)
+
+
+def anonymize_chunk(pa, pc, chunk, column_type, column_key, rows,
+                    low_cardinality_threshold=5,
+                    low_cardinality_alphabet=None,
+                    replacers={}, key_backend=None,
+                    raise_exceptions=False, quiet=False):
+    """
+    Anonymize one Arrow array of a column. Returns (array, column_key).
+
+    Numeric and datetime columns are scaled and shifted on their buffers.
+    All other columns are anonymized by their dictionary: dictionary
+    encoded arrays keep their indices and get a new dictionary, other
+    arrays are dictionary encoded with a hash kernel and the new values
+    are taken back by the indices. Only distinct values are converted to
+    Python objects.
+    """
+    if replacers.get(column_type, False):
+        ret, column_key = replacers[column_type](chunk.to_pandas(),
+                                                 key=column_key)
+        return (pa.Array.from_pandas(ret), column_key)
+    kind = column_key.get('kind', None)
+    encoded = chunk if pa.types.is_dictionary(chunk.type) else None
+    uniques = None
+    if kind is None and column_type != 'datetime':
+        if encoded is None:
+            encoded = chunk.dictionary_encode()
+        uniques = encoded.dictionary.to_pandas()
+        kind = column_kind(uniques, column_type, column_key, replacers,
+                           low_cardinality_threshold, len(uniques), rows)
+    if kind in ('int', 'float', 'date') or (kind is None and column_type
+                                            in ('int', 'float', 'datetime')):
+        if encoded is not None:
+            chunk = encoded.dictionary.take(encoded.indices)
+        kind = kind or ('date' if column_type == 'datetime' else column_type)
+        return affine_array(pa, pc, chunk, kind, column_key)
+    if encoded is None:
+        encoded = chunk.dictionary_encode()
+    if uniques is None:
+        uniques = encoded.dictionary.to_pandas()
+    replacer, args, kwargs = column_task(uniques, column_type, kind,
+                                         column_key,
+                                         low_cardinality_alphabet,
+                                         replacers, key_backend,
+                                         raise_exceptions=raise_exceptions,
+                                         quiet=quiet)
+    ret, column_key = replacer(*args, **kwargs)
+    if isinstance(ret.dtype, pd.CategoricalDtype):
+        ret = ret.astype(object)
+    dictionary = pa.Array.from_pandas(ret)
+    if pa.types.is_dictionary(chunk.type):
+        return (pa.DictionaryArray.from_arrays(encoded.indices, dictionary),
+                column_key)
+    return (dictionary.take(encoded.indices), column_key)
+
+
+def anonymize_column(pa, pc, data, column_type, column_key,
+                     low_cardinality_threshold=5,
+                     low_cardinality_alphabet=None,
+                     replacers={}, key_backend=None,
+                     raise_exceptions=False, quiet=False):
+    """
+    Anonymize a chunked Arrow column chunk by chunk, see
+    anonymize_chunk(). Returns (data, column_key).
+    """
+    chunks = []
+    for chunk in data.chunks:
+        chunk, column_key = anonymize_chunk(pa, pc, chunk, column_type,
+                                            column_key, len(data),
+                                            low_cardinality_threshold,
+                                            low_cardinality_alphabet,
+                                            replacers, key_backend,
+                                            raise_exceptions=raise_exceptions,
+                                            quiet=quiet)
+        chunks.append(chunk)
+    return (pa.chunked_array(chunks) if chunks else data, column_key)
+
+
+def anonymize_parquet(src, dst, key=None,
+                      columns=None,
+                      pass_columns=[], skip_columns=[],
+                      low_cardinality_threshold=5,
+                      low_cardinality_alphabet=None,
+                      types={}, replacers={},
+                      key_backend=None, compression='snappy',
+                      profile=None,
+                      raise_exceptions=False, quiet=False):
+    """
+    Anonymize the Parquet file src into dst, one row group at a time,
+    and return the key. Every row group is written as soon as it is
+    anonymized, so memory is bounded by the size of a row group.
+
+    Types come from the Parquet schema (string columns are generic, use
+    types to mark e.g. emails) and the kind of every column is chosen on
+    the first row group, like anonymize() does for the first chunk in
+    anonymize_chunks(). String columns are read dictionary encoded and
+    only their dictionaries are anonymized, see anonymize_chunk().
+    Requires pyarrow.
+    """
+    pa, pc, pq = import_pyarrow()
+    key = init_key(key)
+    schema = pq.read_schema(src)
+    if columns is None or len(columns) == 0:
+        columns = schema.names
+    elif not isinstance(columns, (list, tuple)):
+        columns = [columns]
+    columns = [column for column in columns if column not in skip_columns]
+    source = pq.ParquetFile(src, read_dictionary=[
+                field.name for field in schema
+                if field.name in columns and is_text(pa, field.type)])
+
+    # Name the columns once, in the order of anonymize()
+    new_names = []
+    idx = 0
+    for column in columns:
+        if column in pass_columns:
+            key['data_map'][column] = {}
+            key['name_map']['old_to_new'][column] = column
+            key['name_map']['new_to_old'][column] = column
+            new_names.append(column)
+            continue
+        new_column, key['name_map'] = column_name_replace(column, idx,
+                                                          key['name_map'])
+        new_names.append(new_column)
+        idx += 1
+
+    writer = None
+    try:
+        for group in range(source.num_row_groups):
+            table = source.read_row_group(group, columns=columns)
+            with measure(profile, 'row_group', rows=table.num_rows):
+                arrays = []
+                for column, new_column in zip(columns, new_names):
+                    data = table.column(column)
+                    if column in pass_columns:
+                        arrays.append(data)
+                        continue
+                    column_type = types.get(column, arrow_column_type(
+                                                pa, schema.field(column).type))
+                    with measure(profile, 'replace', column, table.num_rows):
+                        data, key['data_map'][new_column] = \
+                            anonymize_column(
+                                pa, pc, data, column_type,
+                                key['data_map'].get(new_column, {}),
+                                low_cardinality_threshold,
+                                low_cardinality_alphabet,
+                                replacers, key_backend,
+                                raise_exceptions=raise_exceptions,
+                                quiet=quiet)
+                    arrays.append(data)
+                ret = pa.Table.from_arrays(arrays, names=new_names)
+                if writer is None:
+                    writer = pq.ParquetWriter(dst, ret.schema,
+                                              compression=compression)
+                elif not ret.schema.equals(writer.schema):
+                    ret = ret.cast(writer.schema)
+                writer.write_table(ret)
+    finally:
+        if writer is not None:
+            writer.close()
+    return key
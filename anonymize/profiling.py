@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+# Opt-in statistics of anonymization stages and columns
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+def key_size(key):
+    """
+    Number of entries in the value and domain maps of a column key.
+    """
+    size = 0
+    for name in ('map', 'domain_map'):
+        mapping = key.get(name, None) if key else None
+        size += len(mapping) if mapping is not None else 0
+    return size
+
+
+class Profile():
+    """
+    Statistics of anonymization runs, collected when passed as profile to
+    anonymize(), anonymize_chunks() or Anonymizer. Every record is a dict
+    with the stage (anonymize, deduce, transform, cardinality or the
+    replacement of a column, named after its kind or anonymizer), column
+    (None for stages over the whole data), seconds, rows, rows_per_second
+    and, with trace_memory, the tracemalloc peak_bytes. Column stages also
+    have the number of distinct values (uniques) and of entries added to
+    the column's value map (key_growth). Stages nest: anonymize includes
+    deduce, which includes transform.
+
+    Hooks are called with every record once it is complete, e.g. to
+    forward it to a metrics system.
+    """
+
+    def __init__(self, hooks=None, trace_memory=True):
+        self.records = []
+        self.hooks = list(hooks) if hooks else []
+        self.trace_memory = trace_memory
+        # [memory at start, peak of finished inner stages] per open stage
+        self.__stack = []
+
+    def add(self, record):
+        """
+        Complete a record, store it and pass it to the hooks.
+        """
+        rows = record.get('rows', None)
+        record['rows_per_second'] = rows / record['seconds'] \
+            if rows and record['seconds'] else None
+        self.records.append(record)
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+    @contextmanager
+    def measure(self, stage, column=None, rows=None, **stats):
+        """
+        Context manager recording the time and memory peak of a stage.
+        Yields the record, so that more stats can be set on it.
+        """
+        record = dict(stats, stage=stage, column=column, rows=rows)
+        started = False
+        if self.trace_memory:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if self.__stack:
+                # Keep the peak of the enclosing stage before resetting it
+                self.__stack[-1][1] = max(self.__stack[-1][1], peak)
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            self.__stack.append([current, 0])
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                start_memory, inner_peak = self.__stack.pop()
+                peak = max(peak, inner_peak)
+                record['peak_bytes'] = max(peak - start_memory, 0)
+                if self.__stack:
+                    self.__stack[-1][1] = max(self.__stack[-1][1], peak)
+                if started:
+                    tracemalloc.stop()
+            self.add(record)
+
+    def to_frame(self):
+        """
+        Records as a data frame, one row per record.
+        """
+        return pd.DataFrame(self.records,
+                            columns=['stage', 'column', 'seconds', 'rows',
+                                     'rows_per_second', 'peak_bytes',
+                                     'uniques', 'key_growth'])
+
+    def summary(self, by='stage'):
+        """
+        Total seconds, rows and key growth and the largest memory peak
+        per stage (by='stage') or per column (by='column').
+        """
+        return self.to_frame().groupby(by).agg({'seconds': 'sum',
+                                                'rows': 'sum',
+                                                'peak_bytes': 'max',
+                                                'key_growth': 'sum'})
+
+
+@contextmanager
+def measure(profile, stage, column=None, rows=None, **stats):
+    """
+    profile.measure(), or a context doing nothing without a profile.
+    """
+    if profile is None:
+        yield {}
+    else:
+        with profile.measure(stage, column, rows, **stats) as record:
+            yield record
+
+
+def profile_call(func, args, kwargs, stage, column, rows, trace_memory):
+    """
+    Call func(*args, **kwargs) measuring it, possibly in a worker process.
+    Returns (result, record).
+    """
+    profile = Profile(trace_memory=trace_memory)
+    with profile.measure(stage, column, rows) as record:
+        result = func(*args, **kwargs)
+    return (result, record)
+
+
+def profiled_task(profile, task, stage, column=None, rows=None):
+    """
+    Column task (func, args, kwargs) for map_tasks(), measured by
+    profile_call() if there is a profile.
+    """
+    if profile is None:
+        return task
+    func, args, kwargs = task
+    return (profile_call,
+            (func, args, kwargs, stage, column, rows, profile.trace_memory),
+            {})
+
+
+def task_result(profile, result, series, size=0):
+    """
+    (data, key) result of a task from profiled_task(). Its record gets
+    the number of distinct values of series and the growth of the value
+    maps over size, their key_size() before the task ran, and is added to
+    profile.
+    """
+    if profile is None:
+        return result
+    result, record = result
+    record['uniques'] = int(series.nunique())
+    record['key_growth'] = key_size(result[1]) - size
+    profile.add(record)
+    return result
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+# Cache of deduced types and transformation logs keyed by data schema
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def schema_fingerprint(data, fingerprint_rows=0, **params):
+    """
+    Hex digest of column names and dtypes of data, deduction parameters
+    and, with fingerprint_rows, a hash of that many leading rows.
+    """
+    schema = [[str(column), str(dtype)]
+              for column, dtype in data.dtypes.items()]
+    params = sorted((name, str(value)) for name, value in params.items())
+    digest = hashlib.sha256(json.dumps([schema, params]).encode('utf-8'))
+    if fingerprint_rows:
+        digest.update(pd.util.hash_pandas_object(
+                        data.head(fingerprint_rows)).values.tobytes())
+    return digest.hexdigest()
+
+
+def cache_entry(type_map, transformation_log, type_confidence=None):
+    """
+    JSON-compatible cache entry. type_map is kept as pairs, as JSON
+    objects only have string keys.
+    """
+    entry = {'type_map': [[column, type] for column, type
+                          in type_map.items()],
+             'transformation_log': [list(transformation)
+                                    for transformation in transformation_log]}
+    if type_confidence is not None:
+        entry['type_confidence'] = [[column, confidence] for column, confidence
+                                    in type_confidence.items()]
+    return entry
+
+
+def read_entry(entry):
+    """
+    (type_map, transformation_log, type_confidence) of a cache entry.
+    """
+    return (dict((column, type) for column, type in entry['type_map']),
+            [tuple(transformation)
+             for transformation in entry['transformation_log']],
+            dict((column, confidence) for column, confidence
+                 in entry['type_confidence'])
+            if 'type_confidence' in entry else None)
+
+
+def load_deduction(fingerprint, key, cache_dir=None):
+    """
+    Cached deduction for fingerprint from cache_dir, if given, or from
+    key['type_cache']; None on a miss.
+    """
+    if cache_dir is None:
+        entry = key.get('type_cache', {}).get(fingerprint, None)
+    else:
+        path = os.path.join(cache_dir, fingerprint + '.json')
+        if not os.path.exists(path):
+            return None
+        with open(path) as cache_file:
+            entry = json.load(cache_file)
+    return read_entry(entry) if entry is not None else None
+
+
+def store_deduction(fingerprint, key, type_map, transformation_log,
+                    type_confidence=None, cache_dir=None):
+    """
+    Store a deduction for fingerprint in cache_dir, if given, or in
+    key['type_cache'].
+    """
+    entry = cache_entry(type_map, transformation_log, type_confidence)
+    if cache_dir is None:
+        key['type_cache'] = dict(key.get('type_cache', {}))
+        key['type_cache'][fingerprint] = entry
+        return key
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    path = os.path.join(cache_dir, fingerprint + '.json')
+    # Write to a temporary file first, so readers never see partial files
+    with open(path + '.tmp', 'w') as cache_file:
+        json.dump(entry, cache_file)
+    os.rename(path + '.tmp', path)
+    return key
@@ -1,43 +1,74 @@
 # -*- coding: utf-8 -*-
+import numpy as np
 
 
 class AlphabetSequence:
+    """
+    Sequence of labels built from an alphabet: a, b, ..., z, aa, ab, ...
+    Labels are bijective base-k numerals of their index, so any label or
+    range of labels can be built directly, e.g. by parallel workers for
+    their own index ranges: sequence[i] or sequence.take(start, n).
+    """
 
     def __init__(self, alphabet, i=0):
         self.alphabet = alphabet
-        self.__alphabet_inverse = \
-            dict((alphabet[i], i) for i in range(0, len(alphabet)))
-        self.__alphabet_first = alphabet[0]
-        self.__alphabet_last = alphabet[len(alphabet)-1]
-        self.__prev = None if i == 0 else generate(i)
+        self.__i = i
 
     def __iter__(self):
         return self
 
-    def generate(i=0):
-        if i < len(alphabet):
-            return alphabet[i]
+    def __getitem__(self, i):
+        return self.generate(i)
+
+    def generate(self, i=0):
+        """
+        Label with index i in the sequence.
+        """
         ret = ''
-        cur = i
-        for k in range(int(math.ceil(math.log(i, len(alphabet)))), 0):
-            power = (len(alphabet) ** k)
-            j = cur / power
-            cur = cur % power
-            ret += alphabet[j]
+        cur = i + 1
+        while cur > 0:
+            cur, j = divmod(cur - 1, len(self.alphabet))
+            ret = self.alphabet[j] + ret
+        return ret
+
+    def take(self, start, n):
+        """
+        Object array of the n labels from index start on. Digits of all
+        indices are computed with integer array arithmetic and written as
+        code points into a table with a row per label, which is read back
+        as fixed width strings. Alphabets of multi-character symbols are
+        built one label at a time.
+        """
+        if any(len(symbol) != 1 for symbol in self.alphabet):
+            return np.array([self.generate(i)
+                             for i in range(start, start + n)], dtype=object)
+        k = len(self.alphabet)
+        symbols = np.array([ord(symbol) for symbol in self.alphabet],
+                           dtype=np.uint32)
+        cur = np.arange(start + 1, start + n + 1, dtype=np.int64)
+        # Labels of indices below (k^(l + 1) - 1) / (k - 1) have l digits
+        lengths = np.ones(n, dtype=np.int64)
+        bound = 1 + k
+        while n and bound <= cur[-1]:
+            lengths += cur >= bound
+            bound = bound * k + 1
+        width = int(lengths[-1]) if n else 1
+        table = np.zeros((n, width), dtype=np.uint32)
+        rows = np.arange(n)
+        position = lengths - 1
+        while len(rows):
+            cur, digits = np.divmod(cur - 1, k)
+            table[rows, position] = symbols[digits]
+            # Shorter labels are complete
+            more = cur > 0
+            cur = cur[more]
+            rows = rows[more]
+            position = position[more] - 1
+        return table.view('<U%d' % width).ravel().astype(object)
+
+    def next(self):
+        ret = self.generate(self.__i)
+        self.__i += 1
         return ret
 
-    def next():
-        if self.__prev:
-            k = len(self.__prev) - 1
-            while self.__prev[k] == self.__alphabet_last and k >= 0:
-                k -= 1
-            if k < 0:
-                self.__prev = self.__alphabet_first + self.__prev
-            else:
-                self.__prev[k] = \
-                    self.alphabet[self.__alphabet_inverse[self.__prev[k]]+1]
-                for i in range(0, k-1):
-                    self.__prev[i] = self.__alphabet_first
-        else:
-            self.__prev = generate(i)
-        return self.__prev
+    __next__ = next
@@ -2,7 +2,9 @@
 import pandas as pd
 
 from .. import exceptions
-from ..sequences.radix import AlphabetSequence
+from ..cardinality import count_distinct
+from ..encoding import encode_series, sequence_labels
+from ..key_stores import key_map
 from .string_replacers import RandomHexReplacer
 
 
@@ -16,23 +18,11 @@ class CategoricalAnonymizer():
         self.anonymizer = anonymizer
 
     def __low_cardinality_anonymizer(self, series, key=None, alphabet=None):
-        elements = set(series.unique())
         key = {} if not key else key.copy()
         key['type'] = 'categorical'
         key['subtype'] = 'low_cardinality'
-        key['map'] = key.get('map', {})
-        i = len(key['map'])
-        if alphabet:
-            alphabet_sequence = AlphabetSequence(alphabet, i)
-
-        for element in sorted(elements - set(key['map'].keys())):
-            if alphabet:
-                key['map'][element] = alphabet_sequence.next()
-            else:
-                key['map'][element] = i
-            i += 1
-
-        ret = series.apply(lambda x: key['map'][x])
+        key['map'] = key.get('map', key_map(key.get('backend', None)))
+        ret = encode_series(series, key['map'], sequence_labels(alphabet))
         return (ret, key)
 
     def __generic_anonymizer(
@@ -45,18 +35,25 @@ class CategoricalAnonymizer():
             key['map'] = {}
 
         replacer_obj = replacer_class(self.anonymizer, key)
-        ret = series.apply(replacer_obj.replacer)
+        if hasattr(self.anonymizer, 'memo_cache'):
+            replacer_obj.cache = self.anonymizer.memo_cache(series.name)
+        ret = replacer_obj.replace_series(series)
         return (ret, key)
 
     def anonymize(self, series, key=None,
                   low_cardinality_threshold=None, alphabet=None):
         ret = None
-        key = None
         low_cardinality_threshold = low_cardinality_threshold \
             if low_cardinality_threshold \
             else self.anonymizer.low_cardinality_threshold
 
-        if len(series) <= low_cardinality_threshold:
+        subtype = key.get('subtype', None) if key else None
+        if subtype is None:
+            subtype = 'low_cardinality' \
+                if count_distinct(series, low_cardinality_threshold,
+                                  dropna=True) <= low_cardinality_threshold \
+                else 'generic'
+        if subtype == 'low_cardinality':
             ret, key = self.__low_cardinality_anonymizer(series, key, alphabet)
         else:
             ret, key = self.__generic_anonymizer(series, key)
@@ -1,9 +1,7 @@
 # -*- coding: utf-8 -*-
-import numpy as np
-import pandas as pd
-from datetime import datetime
-
 from .. import exceptions
+from ..numeric import draw_time_shift, time_series, time_shift, \
+    time_values
 
 
 class DatetimeAnonymizer:
@@ -16,10 +14,14 @@ class DatetimeAnonymizer:
         self.anonymizer = anonymizer
 
     def anonymize(self, series, key=None, precision='s', timediff_max=100000):
+        """
+        Shift datetimes by a random number of precision units, working on
+        their int64 nanoseconds and keeping NaT.
+        """
         shift = None
         if not key:
             key = {}
-            key['kind'] = 'date'
+            key['type'] = 'datetime'
             key['precision'] = precision
         else:
             key = key.copy()
@@ -31,18 +33,10 @@ class DatetimeAnonymizer:
                     print("Wrong key type '%s' in datetime anonymizer",
                           (key.get('type', 'None')))
             shift = key.get('shift', None)
-        min_val = np.min(series)
-        max_val = np.max(series)
+            precision = key.get('precision', precision)
+        series, values, nat = time_values(series)
         if shift is None:
-            abs_diff = (max_val - min_val).total_seconds()
-            abs_diff = abs_diff if abs_diff else timediff_max
-            shift = np.random.random_integers(0,
-                                              np.min([abs_diff,
-                                                      timediff_max]))
-            if precision == 'D':
-                shift_td = datetime.timedelta(shift)
-            else:
-                shift_td = datetime.timedelta(0, shift)
-        key['shift'] = shift
-        ret = series.apply(lambda x: (x-shift_td))
+            shift = draw_time_shift(values, nat, timediff_max)
+        key['shift'] = int(shift)
+        ret = time_series(time_shift(values, nat, shift, precision), series)
         return (ret, key)
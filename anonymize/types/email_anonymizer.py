@@ -2,6 +2,7 @@
 import pandas as pd
 
 from .. import exceptions
+from ..encoding import email_domain_error, replace_emails
 from .string_replacers import HashSha256Replacer
 
 
@@ -15,12 +16,22 @@ class EmailAnonymizer:
         self.anonymizer = anonymizer
 
     def anonymize(self, series, key=None,
-                  replacer_class=HashSha256Replacer):
-        shift = None
+                  replacer_class=HashSha256Replacer,
+                  keep_domains=False, domain_table=None):
+        """
+        Replace users and domains through separate token maps, key['map']
+        and key['domain_map'], each distinct part once. With keep_domains
+        domains are kept; a domain_table (domain -> replacement) maps
+        known domains and tokenizes others. Domains already replaced in key
+        can not be kept and domain_table has to be one-to-one, otherwise
+        the options are refused.
+        """
         if not key:
             key = {}
-            key['kind'] = 'email'
+            key['type'] = 'email'
             key['map'] = {}
+            key['domain_map'] = {}
+            key['domains'] = 'replace'
         else:
             key = key.copy()
             if key.get('type', None) != 'email':
@@ -30,8 +41,23 @@ class EmailAnonymizer:
                 else:
                     print("Wrong key type '%s' in email anonymizer",
                           (key.get('type', 'None')))
-        emails = series.str.split("@", 1, True)
-        replacer_obj = replacer_class(self.anonymizer, key)
-        emails = emails.apply(replacer_obj.replacer)
-        emails = emails[0] + '@' + emails[1]
-        return (emails, key)
+        error = email_domain_error(key, keep_domains, domain_table)
+        if error:
+            if self.anonymizer.raise_exceptions:
+                raise exceptions.WrongParameters(error)
+            else:
+                print(error)
+        else:
+            if keep_domains:
+                key['domains'] = 'keep'
+            if domain_table is not None:
+                key['domain_table'] = dict(domain_table)
+
+        def replace(parts, part_key, prefix):
+            replacer_obj = replacer_class(self.anonymizer, part_key)
+            if hasattr(self.anonymizer, 'memo_cache'):
+                replacer_obj.cache = self.anonymizer.memo_cache(
+                    (series.name, 'domain' if prefix else 'user'))
+            return (replacer_obj.replace_series(parts), part_key)
+
+        return replace_emails(series, key, replace)
@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 
 from .. import exceptions
+from ..numeric import float_affine, float_scale_shift, output_array
 
 
 class FloatAnonymizer():
@@ -14,7 +15,11 @@ class FloatAnonymizer():
     def __init__(self, anonymizer):
         self.anonymizer = anonymizer
 
-    def anonymize(self, series, key=None):
+    def anonymize(self, series, key=None, inplace=False):
+        """
+        Scale, add noise and shift floats as whole arrays. With inplace
+        the float64 buffer of series is reused for the result.
+        """
         ret = None
         scale = None
         shift = None
@@ -30,19 +35,14 @@ class FloatAnonymizer():
                 else:
                     print("Wrong key type '%s' in float anonymizer",
                           (key.get('type', 'None')))
-            else:
-                key['type'] = 'float'
             scale = key.get('scale', None)
             shift = key.get('shift', None)
-        scale = np.random.random() * np.avg(series) if scale is None else scale
-        ret = series.apply(lambda x: x*scale)
-        min_val = np.min(ret)
-        max_val = np.max(ret)
-        if shift is None:
-            shift = np.random.random(min_val, max_val) \
-                if min_val >= 0.0 else 0.0
+        values = series.to_numpy()
+        scale, shift = float_scale_shift(values, scale, shift)
         key['scale'] = scale
         key['shift'] = shift
-        ret = series.apply(lambda x:
-                           (x-shift))+np.random.rand(len(series))*scale
+        out = float_affine(values, scale, shift,
+                           out=output_array(values, np.float64, inplace))
+        ret = pd.Series(out, index=series.index, name=series.name,
+                        copy=False)
         return (ret, key)
@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 
 from .. import exceptions
+from ..numeric import int_affine, int_scale_shift, output_array
 
 
 class IntAnonymizer():
@@ -14,7 +15,11 @@ class IntAnonymizer():
     def __init__(self, anonymizer):
         self.anonymizer = anonymizer
 
-    def anonymize(self, series, key=None, max_scale=1024):
+    def anonymize(self, series, key=None, max_scale=1024, inplace=False):
+        """
+        Scale, add noise and shift integers as whole arrays. With inplace
+        the int64 buffer of series is reused for the result.
+        """
         ret = None
         scale = None
         shift = None
@@ -30,20 +35,15 @@ class IntAnonymizer():
                 else:
                     print("Wrong key type '%s' in int anonymizer",
                           (key.get('type', 'None')))
-            else:
-                key['type']
             scale = key.get('scale', None)
             shift = key.get('shift', None)
-        scale = np.random.random_integers(max_scale) \
-            if scale is None else scale
-        ret = series.apply(lambda x: x*scale)
-        min_val = np.min(ret)
-        max_val = np.max(ret)
-        ret = ret + np.random.random_integers(0, scale, len(ret))
-        if shift is None:
-            shift = np.random.random(min_val, max_val) if min_val >= 0 else 0
+        values = series.to_numpy()
+        scale, shift = int_scale_shift(values, scale, shift, max_scale)
         key['scale'] = scale
         key['shift'] = shift
-        ret = series.apply(lambda x: (x-shift))
+        out = int_affine(values, scale, shift,
+                         out=output_array(values, np.int64, inplace))
+        ret = pd.Series(out, index=series.index, name=series.name,
+                        copy=False)
 
         return (ret, key)
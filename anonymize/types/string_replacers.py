@@ -2,143 +2,330 @@
 import random
 import hashlib
 
+import numpy as np
+import pandas as pd
+
 from .. import exceptions
+from ..encoding import factorize, keyed_hash, new_secret, \
+    random_hex_tokens, take_labels, to_bytes
+from ..key_stores import cached_replace, key_map
 
 
-class HashSha256Replacer():
-    """
-    SHA256-based replacer
+class Replacer():
     """
+    Abstract replacer class. Subclasses implement replacer(), which
+    replaces a single value and records it in the key. Collisionless
+    replacers also implement token(), which draws a candidate replacement.
 
+    A replacer may have a bounded memo cache of value -> replacement in
+    front of its key map, see key_stores.memo_cache(): hot values are
+    resolved from it without touching the map, which matters when the
+    map lives on disk. A cache may be shared across calls and batches;
+    it is bound to the key's map (or secret) and cleared when used with
+    another key, see MemoCache.bind().
+    """
     anonymizer = None
     key = {}
+    cache = None
+    collision_retries = 10
+
+    def replacer(self, entry):
+        return None
+
+    def token(self, entry):
+        return None
+
+    def tokens(self, values):
+        """
+        Candidate replacements for an array of values, see token().
+        """
+        return np.array([self.token(value) for value in values],
+                        dtype=object)
+
+    def _new_tokens(self, values, taken):
+        """
+        Tokens for an array of new distinct values, unique among
+        themselves and not taken, taken(tokens) being a mask of tokens
+        already in use. Only clashing tokens are redrawn, up to
+        collision_retries times. Returns tokens and the mask of clashes
+        left, whose tokens are _collision() results.
+        """
+        tokens = self.tokens(values)
+        retry = 0
+        while True:
+            clash = taken(tokens) | pd.Series(tokens).duplicated().values
+            if not clash.any() or retry >= self.collision_retries:
+                break
+            tokens[clash] = self.tokens(values[clash])
+            retry += 1
+        for position in np.flatnonzero(clash):
+            tokens[position] = self._collision(retry)
+        return (tokens, clash)
+
+    def replace_uniques(self, values):
+        """
+        Replacements for an array of distinct values.
+        """
+        if hasattr(self.key['map'], 'reverse_lookup'):
+            return self._replace_uniques_vectorized(values)
+        return [self.replacer(value) for value in values]
+
+    def _replace_uniques_vectorized(self, values):
+        """
+        replace_uniques() for vectorized key maps (token -> value): known
+        values are looked up in bulk, new values get tokens which are
+        checked against the map and each other in bulk, redrawing only
+        the clashing ones.
+        """
+        values = np.asarray(values, dtype=object)
+        tokens, found = self.key['map'].reverse_lookup(values)
+        new_values = values[~found]
+        new_tokens, clash = self._new_tokens(
+                                new_values,
+                                lambda tokens: self.key['map'].lookup(
+                                                    tokens)[1])
+        self.key['map'].extend(new_tokens[~clash], new_values[~clash])
+        tokens[~found] = new_tokens
+        return tokens
+
+    def cached_uniques(self, values):
+        """
+        replace_uniques() behind the memo cache, if there is one, see
+        key_stores.cached_replace().
+        """
+        if self.cache is not None:
+            self.cache.bind(self.key.get('map',
+                                         self.key.get('secret', None)))
+        return cached_replace(values, self.replace_uniques, self.cache)
+
+    def replace_series(self, series):
+        """
+        Replace series values. Each distinct value is replaced once and
+        the column is rebuilt from factorize codes.
+        """
+        codes, uniques = factorize(series)
+        return take_labels(codes, self.cached_uniques(uniques), series)
+
+    def _collision(self, retry):
+        if self.anonymizer is not None and self.anonymizer.raise_exceptions:
+            raise exceptions.RepeatedCollision(retry)
+        else:
+            print('Persistent collision after %d retries' % retry)
+        return None
+
+    def _method_missmatch(self, expected):
+        if self.anonymizer is not None and self.anonymizer.raise_exceptions:
+            raise exceptions.ReplacerMethodMissmatch(
+                        expected,
+                        self.key.get('method'))
+        else:
+            print('Missmatch in replacer. Expected: %s, but got: %s'
+                  % (expected, self.key.get('method')))
+
+
+class HashSha256Replacer(Replacer):
+    """
+    SHA256-based replacer
+    """
+
     salt = ''
 
-    def __init__(self, anonymizer=None, key={}):
+    def __init__(self, anonymizer=None, key=None, cache=None):
         self.anonymizer = anonymizer
-        self.key = key
+        self.key = {} if key is None else key
+        self.cache = cache
         if self.key.get('method', 'hash_sha256') != \
                 'hash_sha256':
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.ReplacerMethodMissmatch(
-                            'hash_sha256',
-                            self.key.get('method'))
-            else:
-                print('Missmatch in replacer. Expected: %s, but got: %s'
-                      % ('hash_sha256', self.key.get('method')))
+            self._method_missmatch('hash_sha256')
             return None
 
         self.key['method'] = 'hash_sha256'
+        self.key['map'] = self.key.get('map', key_map(self.key.get('backend')))
         self.salt = self.key['salt'] = self.key.get(
                                         'salt',
                                         '%x' % random.randrange(16**25))
 
+    def token(self, entry):
+        return hashlib.sha256(to_bytes(self.salt) +
+                              to_bytes(entry)).hexdigest()
+
     def replacer(self, entry):
-        hash = hashlib.sha256(salt + entry).hexdigest()
-        if hash not in self.key['map']:
-            self.key['map'][hash] = entry
-        else:
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.RepeatedCollision(0)
-            else:
-                print('Persistent collision after %d retries' % 0)
-            return None
+        hash = self.token(entry)
+        if self.key['map'].get(hash, entry) != entry:
+            return self._collision(0)
+        self.key['map'][hash] = entry
         return hash
 
+    def replace_uniques(self, values):
+        if not hasattr(self.key['map'], 'lookup'):
+            return [self.replacer(value) for value in values]
+        # Hashes are deterministic: check them against the map in bulk
+        values = np.asarray(values, dtype=object)
+        hashes = np.array([self.token(value) for value in values],
+                          dtype=object)
+        originals, found = self.key['map'].lookup(hashes)
+        clash = found & (originals != values)
+        for position in np.flatnonzero(clash):
+            hashes[position] = self._collision(0)
+        self.key['map'].extend(hashes[~found], values[~found])
+        return hashes
+
 
-class CollisionlessHashSha256Replacer():
+class CollisionlessHashSha256Replacer(Replacer):
     """
     Collisionless SHA256-based replacer
     """
 
-    anonymizer = None
-    key = {}
     collision_retries = 10
 
-    def __init__(self, anonymizer=None, key={}):
+    def __init__(self, anonymizer=None, key=None, cache=None):
         self.anonymizer = anonymizer
-        self.key = key.copy()
+        self.key = {} if key is None else key
+        self.cache = cache
         if self.key.get('method', 'hash_sha256_collisionless') != \
                 'hash_sha256_collisionless':
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.ReplacerMethodMissmatch(
-                            'hash_sha256_collisionless',
-                            self.key.get('method'))
-            else:
-                print('Missmatch in replacer. Expected: %s, but got: %s'
-                      % ('hash_sha256_collisionless', self.key.get('method')))
+            self._method_missmatch('hash_sha256_collisionless')
             return None
 
         self.key['method'] = 'hash_sha256_collisionless'
+        self.key['map'] = self.key.get('map', key_map(self.key.get('backend')))
+        if not hasattr(self.key['map'], 'reverse_lookup'):
+            self.key['map_reverse'] = self.key.get('map_reverse', {})
         self.collision_retries = self.key['collision_retries'] = \
             self.key.get('collision_retries', 10)
 
-    def replacer(entry):
+    def token(self, entry):
+        return hashlib.sha256(to_bytes('%x' % random.randrange(16**25)) +
+                              to_bytes(entry)).hexdigest()
+
+    def replacer(self, entry):
         retry = 0
-        if entry in key['map_reverse']:
-            return key['map_reverse'][entry]
-        while retry < collision_retries:
-            hash = hashlib.sha256('%x' % random.randrange(16**25) +
-                                  entry).hexdigest()
-            if hash not in key['map']:
+        if entry in self.key['map_reverse']:
+            return self.key['map_reverse'][entry]
+        while retry < self.collision_retries:
+            hash = self.token(entry)
+            if hash not in self.key['map']:
                 break
-        if hash not in key['map']:
-            key['map'][hash] = entry
-            key['map_reverse'][entry] = hash
+            retry += 1
+        if hash not in self.key['map']:
+            self.key['map'][hash] = entry
+            self.key['map_reverse'][entry] = hash
         else:
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.RepeatedCollision(retry)
-            else:
-                print('Persistent collision after %d retries' % retry)
-            return None
+            return self._collision(retry)
         return hash
 
 
-class RandomHexReplacer():
+class RandomHexReplacer(Replacer):
     """
-    Random hex string replacer
+    Random hex string replacer. Tokens for all new values of a batch are
+    drawn at once, see random_hex_tokens(), and checked against the map
+    and each other in bulk, redrawing only the clashing ones.
     """
 
-    anonymizer = None
-    key = {}
     collision_retries = 10
     hex_length = 25
 
-    def __init__(self, anonymizer=None, key={}):
+    def __init__(self, anonymizer=None, key=None, cache=None):
         self.anonymizer = anonymizer
-        self.key = key.copy()
+        self.key = {} if key is None else key
+        self.cache = cache
         if self.key.get('method', 'random_hex_collisionless') != \
                 'random_hex_collisionless':
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.ReplacerMethodMissmatch(
-                            'random_hex_collisionless',
-                            self.key.get('method'))
-            else:
-                print('Missmatch in replacer. Expected: %s, but got: %s'
-                      % ('random_hex_collisionless', self.key.get('method')))
+            self._method_missmatch('random_hex_collisionless')
             return None
 
         self.key['method'] = 'random_hex_collisionless'
+        self.key['map'] = self.key.get('map', key_map(self.key.get('backend')))
+        if not hasattr(self.key['map'], 'reverse_lookup'):
+            self.key['map_reverse'] = self.key.get('map_reverse', {})
         self.collision_retries = self.key['collision_retries'] = \
             self.key.get('collision_retries', 10)
         self.hex_length = self.key['hex_length'] = \
             self.key.get('hex_length', 25)
 
-    def replacer(entry):
+    def token(self, entry):
+        return random_hex_tokens(1, self.hex_length)[0]
+
+    def tokens(self, values):
+        return random_hex_tokens(len(values), self.hex_length)
+
+    def replace_uniques(self, values):
+        if hasattr(self.key['map'], 'reverse_lookup'):
+            return self._replace_uniques_vectorized(values)
+        mapping = self.key['map']
+        reverse = self.key['map_reverse']
+        values = np.asarray(values, dtype=object)
+        tokens = np.array([reverse.get(value, None) for value in values],
+                          dtype=object)
+        found = np.array([value in reverse for value in values], dtype=bool)
+        new_values = values[~found]
+
+        def taken(tokens):
+            # Usually none is: check that with one set operation first
+            if mapping.keys().isdisjoint(tokens):
+                return np.zeros(len(tokens), dtype=bool)
+            return np.array([token in mapping for token in tokens],
+                            dtype=bool)
+
+        new_tokens, clash = self._new_tokens(new_values, taken)
+        mapping.update(zip(new_tokens[~clash], new_values[~clash]))
+        reverse.update(zip(new_values[~clash], new_tokens[~clash]))
+        tokens[~found] = new_tokens
+        return tokens
+
+    def replacer(self, entry):
         retry = 0
-        if entry in key['map_reverse']:
-            return key['map_reverse'][entry]
-        while retry < collision_retries:
-            hash = '%x' % random.randrange(16**self.hex_length)
-            if hash not in key['map']:
+        if entry in self.key['map_reverse']:
+            return self.key['map_reverse'][entry]
+        while retry < self.collision_retries:
+            hash = self.token(entry)
+            if hash not in self.key['map']:
                 break
-        if hash not in key['map']:
-            key['map'][hash] = entry
-            key['map_reverse'][entry] = hash
+            retry += 1
+        if hash not in self.key['map']:
+            self.key['map'][hash] = entry
+            self.key['map_reverse'][entry] = hash
         else:
-            if self.anonymizer.raise_exceptions:
-                raise exceptions.RepeatedCollision(retry)
-            else:
-                print('Persistent collision after %d retries' % retry)
-            return None
+            return self._collision(retry)
         return hash
+
+
+class KeyedHashReplacer(Replacer):
+    """
+    Stateless replacer: tokens are BLAKE2b digests keyed with the key's
+    secret, so any worker holding the secret produces the same tokens
+    without a stored map and nothing is looked up per value. With
+    digest_size bytes (16 by default) collisions are negligible but not
+    checked. A reverse_sink, e.g. AsyncReverseSink, optionally receives
+    token -> value pairs for later deanonymization.
+    """
+
+    digest_size = 16
+
+    def __init__(self, anonymizer=None, key=None, reverse_sink=None,
+                 cache=None):
+        self.anonymizer = anonymizer
+        self.key = {} if key is None else key
+        self.reverse_sink = reverse_sink
+        self.cache = cache
+        if self.key.get('method', 'keyed_blake2b') != 'keyed_blake2b':
+            self._method_missmatch('keyed_blake2b')
+            return None
+
+        self.key['method'] = 'keyed_blake2b'
+        self.secret = self.key['secret'] = \
+            self.key.get('secret', new_secret())
+        self.digest_size = self.key['digest_size'] = \
+            self.key.get('digest_size', 16)
+
+    def token(self, entry):
+        return keyed_hash(entry, self.secret, self.digest_size)
+
+    def replacer(self, entry):
+        return self.replace_uniques([entry])[0]
+
+    def replace_uniques(self, values):
+        tokens = [self.token(value) for value in values]
+        if self.reverse_sink is not None:
+            self.reverse_sink.submit(tokens, values)
+        return tokens
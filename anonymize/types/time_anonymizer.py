@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 import numpy as np
-import pandas as pd
-from datetime import datetime
 
 from .. import exceptions
+from ..numeric import DAY, precision_ns, time_of_day_shift, \
+    time_series, time_values
 
 
 class TimeAnonymizer:
@@ -16,10 +16,15 @@ class TimeAnonymizer:
         self.anonymizer = anonymizer
 
     def anonymize(self, series, key=None, precision='s', timediff_max=100000):
+        """
+        Shift times of day by a random number of precision units, wrapping
+        around within the day. Works on int64 nanoseconds of datetime or
+        timedelta (time since midnight) columns and keeps NaT.
+        """
         shift = None
         if not key:
             key = {}
-            key['kind'] = 'time'
+            key['type'] = 'time'
             key['precision'] = precision
         else:
             key = key.copy()
@@ -31,18 +36,11 @@ class TimeAnonymizer:
                     print("Wrong key type '%s' in time anonymizer",
                           (key.get('type', 'None')))
             shift = key.get('shift', None)
-        min_val = np.min(series)
-        max_val = np.max(series)
+            precision = key.get('precision', precision)
+        series, values, nat = time_values(series, timedeltas=True)
         if shift is None:
-            abs_diff = (max_val - min_val).total_seconds()
-            abs_diff = abs_diff if abs_diff else timediff_max
-            shift = np.random.random_integers(0,
-                                              np.min([abs_diff,
-                                                      timediff_max]))
-            if precision == 'D':
-                shift_td = datetime.timedelta(shift)
-            else:
-                shift_td = datetime.timedelta(0, shift)
-        key['shift'] = shift
-        ret = series.apply(lambda x: (x-shift_td))
+            shift = np.random.randint(0, DAY // precision_ns(precision))
+        key['shift'] = int(shift)
+        ret = time_series(time_of_day_shift(values, nat, shift, precision),
+                          series)
         return (ret, key)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Synthetic data for benchmarks
+import string
+
+import numpy as np
+import pandas as pd
+
+KINDS = ['int', 'float', 'datetime', 'time', 'timedelta', 'categorical',
+         'string', 'email', 'url', 'numeric_string', 'date_string']
+
+
+def make_strings(codes, string_length, prefix=''):
+    """
+    Strings of string_length characters, equal for equal codes.
+    """
+    alphabet = np.array(list(string.ascii_lowercase))
+    uniques, inverse = np.unique(codes, return_inverse=True)
+    random_state = np.random.RandomState(len(uniques))
+    letters = alphabet[random_state.randint(0, len(alphabet),
+                                            (len(uniques), string_length))]
+    labels = np.array([prefix + ''.join(row) + str(unique)
+                       for row, unique in zip(letters, uniques)],
+                      dtype=object)
+    return labels[inverse]
+
+
+def make_series(kind, rows=100000, cardinality=None, null_rate=0.0,
+                string_length=8, seed=0):
+    """
+    Series of one of KINDS with rows values drawn from cardinality
+    distinct ones (rows / 10 by default) and a share null_rate of missing
+    values.
+    """
+    random_state = np.random.RandomState(seed)
+    cardinality = max(rows // 10, 1) if cardinality is None else cardinality
+    codes = random_state.randint(0, cardinality, rows)
+    if kind == 'int':
+        series = pd.Series(codes * 7 + 1000)
+    elif kind == 'float':
+        series = pd.Series(codes * 0.37 + 10.0)
+    elif kind == 'datetime':
+        series = pd.Series(pd.Timestamp('2001-01-01') +
+                           pd.to_timedelta(codes * 3607, unit='s'))
+    elif kind == 'time':
+        series = pd.Series(pd.to_timedelta(codes % 86400, unit='s'))
+    elif kind == 'timedelta':
+        series = pd.Series(pd.to_timedelta(codes * 61, unit='s'))
+    elif kind in ('categorical', 'string'):
+        series = pd.Series(make_strings(codes, string_length))
+    elif kind == 'email':
+        series = pd.Series(make_strings(codes, string_length)) + '@' + \
+            pd.Series(make_strings(codes % 50, string_length)) + '.com'
+    elif kind == 'url':
+        series = 'https://' + \
+            pd.Series(make_strings(codes % 50, string_length)) + '.com/' + \
+            pd.Series(make_strings(codes, string_length)) + '?id=' + \
+            pd.Series(codes).astype(str)
+    elif kind == 'numeric_string':
+        series = pd.Series(codes * 13).astype(str)
+    elif kind == 'date_string':
+        series = pd.Series((pd.Timestamp('2001-01-01') +
+                            pd.to_timedelta(codes, unit='D'))
+                           .strftime('%Y-%m-%d'))
+    else:
+        raise ValueError('Unknown kind of benchmark data: %s' % kind)
+    if null_rate:
+        series = series.where(random_state.random_sample(rows) >= null_rate)
+    return series
+
+
+def make_frame(rows=100000, columns=None, cardinality=None, null_rate=0.0,
+               string_length=8, seed=0):
+    """
+    Frame with one column of every kind in columns (all KINDS by
+    default), named so that type deduction has something to do.
+    """
+    columns = KINDS if columns is None else columns
+    return pd.DataFrame(dict(
+        (kind if kind != 'date_string' else 'created_date',
+         make_series(kind, rows, cardinality, null_rate, string_length,
+                     seed + idx))
+        for idx, kind in enumerate(columns)))
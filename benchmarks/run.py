@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Offline benchmark runner, no asv needed:
+
+    python -m benchmarks.run [--rows N] [--repeat N] [--json PATH] [PATTERN]
+
+Runs the time_* methods of benchmark classes in benchmarks/bench_*.py for
+every combination of their params (the same classes run with asv) and
+prints the best time, throughput in rows/s and peak memory traced by
+tracemalloc. Only benchmarks whose name contains PATTERN are run. --json
+saves the results, e.g. to compare releases.
+"""
+import argparse
+import importlib
+import inspect
+import itertools
+import json
+import os
+import time
+import tracemalloc
+
+
+def benchmark_classes(pattern=''):
+    """
+    (name, class) of benchmark classes in bench_*.py modules.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for file_name in sorted(os.listdir(directory)):
+        if not (file_name.startswith('bench_') and file_name.endswith('.py')):
+            continue
+        module = importlib.import_module('benchmarks.' + file_name[:-3])
+        for name, cls in inspect.getmembers(module, inspect.isclass):
+            if cls.__module__ == module.__name__ and \
+                    any(attr.startswith('time_') for attr in dir(cls)):
+                yield (name, cls)
+
+
+def param_combinations(cls):
+    params = getattr(cls, 'params', [])
+    if not params:
+        return [()]
+    if not isinstance(params[0], (list, tuple)):
+        params = [params]
+    return list(itertools.product(*params))
+
+
+def run_benchmark(cls, method, params, rows, repeat):
+    """
+    Best time of repeat calls and peak traced memory of one more call,
+    None if setup() skips the parameters by raising NotImplementedError.
+    """
+    benchmark = cls()
+    benchmark.rows = rows
+    if hasattr(benchmark, 'setup'):
+        try:
+            benchmark.setup(*params)
+        except NotImplementedError:
+            return None
+    func = getattr(benchmark, method)
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(*params)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func(*params)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    if hasattr(benchmark, 'teardown'):
+        benchmark.teardown(*params)
+    return {'seconds': best, 'rows_per_second': rows / best if best else None,
+            'peak_bytes': peak}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run benchmarks offline')
+    parser.add_argument('pattern', nargs='?', default='')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', default=None)
+    args = parser.parse_args(argv)
+
+    results = []
+    print('%-64s %10s %14s %10s' % ('benchmark', 'seconds', 'rows/s',
+                                    'peak MB'))
+    for name, cls in benchmark_classes():
+        for method in sorted(attr for attr in dir(cls)
+                             if attr.startswith('time_')):
+            for params in param_combinations(cls):
+                label = '%s.%s(%s)' % (name, method,
+                                       ', '.join(str(p) for p in params))
+                if args.pattern not in label:
+                    continue
+                result = run_benchmark(cls, method, params, args.rows,
+                                       args.repeat)
+                if result is None:
+                    continue
+                result.update(benchmark=label, rows=args.rows)
+                results.append(result)
+                print('%-64s %10.4f %14.0f %10.1f' %
+                      (label, result['seconds'],
+                       result['rows_per_second'] or 0,
+                       result['peak_bytes'] / 2.0**20))
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ Anonymize is a data anonymization library designed to be used with Pandas.
 Anonumization is easy with Anonymize!
 """
 
-from setuptools import setup
+from setuptools import find_packages, setup
 
 import anonymize
 
@@ -23,7 +23,8 @@ setup(
     description='Data anonymization library '
                 'for Pandas',
     long_description=__doc__,
-    packages=['anonymize'],
+    packages=find_packages(exclude=['tests', 'tests.*', 'benchmarks',
+                                    'benchmarks.*']),
     include_package_data=True,
     zip_safe=False,
     platforms='any',
@@ -31,6 +32,9 @@ setup(
         'pandas>=1.8',
         'numpy>=1.8',
     ],
+    extras_require={
+        'parquet': ['pyarrow>=7.0'],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
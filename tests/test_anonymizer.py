@@ -11,3 +11,68 @@ def test_init():
     anonymizer = anz.Anonymizer(columns, types)
     data = pd.DataFrame()
     anonymizer.anonymize(data)
+
+
+def test_anonymize_chunks():
+    columns = ['kind', 'email']
+    types = {'kind': 'categorical', 'email': 'email'}
+    anonymizer = anz.Anonymizer(columns, types)
+    data = pd.DataFrame(dict(kind=['a', 'b', 'a', 'c'] * 5,
+                             email=['u%d@example.com' % i for i in range(20)]))
+    chunks = [data[i:i+5] for i in range(0, 20, 5)]
+    ret = pd.concat(anonymizer.anonymize_chunks(chunks))
+    key = anonymizer.key
+    assert(list(ret.columns) == ['col_0', 'col_1'])
+    assert(key['name_map']['new_to_old'] == {'col_0': 'kind',
+                                             'col_1': 'email'})
+    assert(key['data_map']['col_0']['map'] == {'a': 0, 'b': 1, 'c': 2})
+    assert(ret['col_1'].nunique() == 20)
+    assert(ret['col_1'].str.split('@').str.get(1).nunique() == 1)
+
+
+def test_anonymize_n_jobs():
+    columns = ['kind', 'email']
+    types = {'kind': 'categorical', 'email': 'email'}
+    anonymizer = anz.Anonymizer(columns, types, n_jobs=2)
+    data = pd.DataFrame(dict(kind=['a', 'b', 'a', 'c'],
+                             email=['u%d@example.com' % i for i in range(4)]))
+    ret = anonymizer.anonymize(data)
+    key = anonymizer.key
+    assert(list(ret['col_0']) == [0, 1, 0, 2])
+    assert(key['data_map']['col_0']['map'] == {'a': 0, 'b': 1, 'c': 2})
+    assert(len(key['data_map']['col_1']['map']) == 4)
+    assert(len(key['data_map']['col_1']['domain_map']) == 1)
+
+
+def test_anonymize_memo_cache():
+    columns = ['user', 'email']
+    types = {'user': 'categorical', 'email': 'email'}
+    anonymizer = anz.Anonymizer(columns, types, cache_size=100,
+                                cache_policy='clock')
+    data = pd.DataFrame(dict(user=['u%d' % (i % 10) for i in range(20)],
+                             email=['u%d@example.com' % i
+                                    for i in range(20)]))
+    ret = anonymizer.anonymize(data)
+    again = anonymizer.anonymize(data)
+    assert(ret.equals(again))
+    stats = anonymizer.cache_stats()
+    assert(stats['user']['hits'] == 10 and stats['user']['misses'] == 10)
+    assert(stats[('email', 'domain')]['hits'] == 1)
+
+
+def test_memo_cache_key_change():
+    columns = ['user', 'url']
+    types = {'user': 'categorical', 'url': 'url'}
+    anonymizer = anz.Anonymizer(columns, types, cache_size=100)
+    data = pd.DataFrame(dict(user=['u%d' % (i % 10) for i in range(20)],
+                             url=['http://example.com/%d' % (i % 4)
+                                  for i in range(20)]))
+    ret = anonymizer.anonymize(data)
+    assert(anonymizer.cache_stats()['url']['misses'] > 0)
+    # New column keys get new tokens, none served from the former cache
+    anonymizer.key['data_map'] = {}
+    again = anonymizer.anonymize(data)
+    user_map = anonymizer.key['data_map']['col_0']['map']
+    assert(set(again['col_0']) <= set(user_map))
+    assert(not set(again['col_0']) & set(ret['col_0']))
+    assert(anonymizer.cache_stats()['user']['misses'] == 20)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from benchmarks import run
+from benchmarks.data import KINDS, make_frame
+import pandas as pd
+
+
+def test_make_frame():
+    data = make_frame(100, cardinality=5, null_rate=0.5, seed=1)
+    assert(len(data) == 100 and len(data.columns) == len(KINDS))
+    assert(data['categorical'].nunique() <= 5)
+    assert(0 < data['email'].isnull().sum() < 100)
+    assert(str(data['datetime'].dtype) == 'datetime64[ns]')
+
+
+def test_run_benchmarks():
+    results = run.main(['--rows', '200', '--repeat', '1',
+                        'LowCardinalityReplace'])
+    assert(len(results) == 4)
+    assert(all(result['rows_per_second'] > 0 for result in results))
+    assert(all(result['peak_bytes'] > 0 for result in results))
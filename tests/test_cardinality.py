@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from anonymize.cardinality import HyperLogLog, count_distinct
+import anonymize.anonymize as anz
+import pandas as pd
+import numpy as np
+
+
+def test_count_distinct():
+    series = pd.Series(['a', 'b', None, 'a', 'c'] * 100)
+    assert(count_distinct(series, 5) == 4)
+    assert(count_distinct(series, 5, dropna=True) == 3)
+    assert(count_distinct(series, 2) == 3)
+    assert(count_distinct(pd.Series(np.arange(10**6)), 5) == 6)
+    assert(count_distinct(pd.Series([], dtype=object), 5) == 0)
+
+
+def test_hyperloglog():
+    first = HyperLogLog().update(np.arange(50000))
+    second = HyperLogLog().update(np.arange(25000, 75000))
+    assert(abs(first.count() - 50000) < 2500)
+    first.merge(HyperLogLog.from_dict(second.to_dict()))
+    assert(abs(first.count() - 75000) < 3750)
+    assert(first.rows == 100000)
+    assert(HyperLogLog().update(['a', 'b', 'a']).count() == 2)
+
+
+def test_anonymize_cardinality_sketch():
+    chunks = [pd.DataFrame({'a': ['x', 'y'] * 50, 'b': np.arange(100) * i})
+              for i in range(1, 4)]
+    key = None
+    for chunk in chunks:
+        ret, key = anz.anonymize(chunk, key=key, cardinality_sketch=True)
+    assert(set(key['cardinality']) == {'col_0', 'col_1'})
+    assert(HyperLogLog.from_dict(key['cardinality']['col_0']).count() == 2)
+    assert(HyperLogLog.from_dict(key['cardinality']['col_0']).rows == 300)
+    assert(key['data_map']['col_0']['kind'] == 'low_cardinality')
+    assert(key['data_map']['col_1']['kind'] == 'int')
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from anonymize.key_journal import KeyJournal
+import anonymize.anonymize as anz
+import pandas as pd
+import numpy as np
+
+
+def batches():
+    return [pd.DataFrame({'name': ['a%d' % i, 'b%d' % i, 'a%d' % i] * 3,
+                          'value': np.arange(9) + i})
+            for i in range(3)]
+
+
+def test_key_journal(tmp_path):
+    for key_backend in [None, 'array']:
+        journal = KeyJournal(path=str(tmp_path / str(key_backend)))
+        results = []
+        for data in batches():
+            ret, key = anz.anonymize(data, key=journal.view(),
+                                     low_cardinality_threshold=1,
+                                     key_backend=key_backend)
+            delta = journal.commit(key)
+            results.append(ret)
+        assert(len(journal.deltas) == 3)
+        # Later deltas only hold the names new to them
+        assert(len(delta['data_map']['col_0']['map']) == 2)
+        assert('name_map' not in delta)
+        assert(set(journal.view()['data_map']['col_0']['map'].keys()) ==
+               set(['a0', 'b0', 'a1', 'b1', 'a2', 'b2']))
+        # The journal is reloaded from its directory and compacted
+        journal = KeyJournal(path=str(tmp_path / str(key_backend)))
+        assert(len(journal.deltas) == 3)
+        base = journal.compact()
+        assert(len(base['data_map']['col_0']['map']) == 6)
+        assert(KeyJournal(path=str(tmp_path / str(key_backend))).deltas == [])
+        restored = anz.deanonymize(results[1], base)
+        assert(restored['name'].equals(batches()[1]['name']))
+        assert(restored['value'].equals(batches()[1]['value']))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from anonymize.key_merge import prepare_key, merge_keys
+from anonymize import exceptions
+import anonymize.anonymize as anz
+import copy
+import pytest
+import pandas as pd
+import numpy as np
+
+
+def test_prepare_and_merge_keys():
+    df = pd.DataFrame(dict(kind=['a', 'b', 'c'] * 10,
+                           user=['user%d' % (i % 12) for i in range(30)],
+                           value=np.arange(30)))
+    for key_backend in [None, 'array']:
+        key = prepare_key(df[:6], low_cardinality_threshold=3,
+                          key_backend=key_backend,
+                          values={'kind': ['a', 'b', 'c']})
+        assert('map' not in key['data_map']['col_1'])
+        parts = [anz.anonymize(df[i:i + 10], key=copy.deepcopy(key))
+                 for i in range(0, 30, 10)]
+        merged, conflicts = merge_keys([part[1] for part in parts])
+        assert(conflicts == {})
+        data = pd.concat([part[0] for part in parts])
+        whole, key = anz.anonymize(df, key=copy.deepcopy(key))
+        # Partitions get the same tokens and labels as the whole data
+        assert(data['col_0'].equals(whole['col_0']))
+        assert(data['col_1'].equals(whole['col_1']))
+        assert(len(merged['data_map']['col_1']['map']) == 12)
+        restored = anz.deanonymize(data, merged)
+        assert(restored['user'].equals(df['user']))
+        assert(restored['kind'].equals(df['kind']))
+
+
+def test_merge_keys_conflicts():
+    df = pd.DataFrame(dict(kind=['a', 'b'] * 5 + ['c'] * 5 + ['d'] * 5))
+    key = prepare_key(df[:10], low_cardinality_threshold=2, quiet=True)
+    keys = [anz.anonymize(df[i:i + 5], key=copy.deepcopy(key))[1]
+            for i in range(0, 20, 5)]
+    keys[1]['data_map']['col_0']['kind'] = 'generic'
+    merged, conflicts = merge_keys(keys, quiet=True)
+    # 'c' and 'd' got the same label in two partitions independently
+    assert(conflicts == {'col_0': 2})
+    assert(merged['data_map']['col_0']['kind'] == 'low_cardinality')
+    assert(merged['data_map']['col_0']['map'] == {'a': 0, 'b': 1, 'c': 2})
+    with pytest.raises(exceptions.KeyConflict):
+        merge_keys([keys[0], {'data_map': {'col_0': {'map': {'x': 0}}}}],
+                   raise_exceptions=True)
+
+
+def test_prepare_key_low_cardinality_values():
+    df = pd.DataFrame(dict(kind=['a', 'b'] * 5 + ['c'] * 5 + ['d'] * 5))
+    # The sample misses 'c' and 'd': fail before partitions diverge
+    with pytest.raises(exceptions.IncompleteValues):
+        prepare_key(df[:10], low_cardinality_threshold=2,
+                    raise_exceptions=True)
+    key = prepare_key(df[:10], low_cardinality_threshold=2,
+                      values={'kind': df['kind'].unique()},
+                      raise_exceptions=True)
+    assert(key['data_map']['col_0']['map'] ==
+           {'a': 0, 'b': 1, 'c': 2, 'd': 3})
+    parts = [anz.anonymize(df[i:i + 5], key=copy.deepcopy(key))
+             for i in range(0, 20, 5)]
+    merged, conflicts = merge_keys([part[1] for part in parts])
+    assert(conflicts == {})
+    restored = anz.deanonymize(pd.concat([part[0] for part in parts]),
+                               merged)
+    assert(restored['kind'].equals(df['kind']))
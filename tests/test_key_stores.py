@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+from anonymize import key_stores as ks
+from anonymize.types import string_replacers as sr
+from anonymize.encoding import random_hex_tokens
+import anonymize.anonymize as anz
+import gc
+import os
+import pickle
+import tracemalloc
+import pytest
+import pandas as pd
+import numpy as np
+
+
+def test_array_key_map():
+    key_map = ks.ArrayKeyMap(['a', 'b'], [0, 1])
+    for i in range(2, 20):
+        key_map.extend(['k%d' % i], [i])
+    key_map['c'] = 20
+    assert(len(key_map) == 21)
+    assert('k7' in key_map and 'x' not in key_map)
+    assert(key_map['k7'] == 7 and key_map.get('x') is None)
+    values, found = key_map.lookup(['b', 'x', 'k19'])
+    assert(list(found) == [True, False, True])
+    assert(values[0] == 1 and values[2] == 19)
+    keys, found = key_map.reverse_lookup([20, 0])
+    assert(list(keys) == ['c', 'a'] and found.all())
+    assert(key_map.to_dict()['k12'] == 12)
+    with pytest.raises(ValueError):
+        key_map['a'] = 5
+    copy = key_map.copy()
+    copy.extend(['d', 'e'], [21, 22])
+    assert(len(key_map) == 21 and len(copy) == 23)
+    keys, values = copy.tail(19)
+    assert(list(keys) == ['k19', 'c', 'd', 'e'])
+    assert(list(values) == [19, 20, 21, 22])
+    # Strings and numbers are packed; mixed queries find only equal items
+    key_map.extend([u'z\u00e9', 'k1'], ['v', 'w'])
+    values, found = key_map.lookup([u'z\u00e9', 0, None, 'k7'])
+    assert(list(found) == [True, False, False, True])
+    assert(list(values[[0, 3]]) == ['v', 7])
+    keys, found = key_map.reverse_lookup(['w', '7', 7.0, 7.5])
+    assert(list(found) == [True, False, True, False])
+    assert(list(keys[[0, 2]]) == ['k1', 'k7'])
+
+
+def test_array_key_map_memory():
+    def traced(build):
+        gc.collect()
+        tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        mapping = build()
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.stop()
+        return (mapping, used)
+
+    def entries():
+        return (random_hex_tokens(20000, 25),
+                ['user%d' % i for i in range(20000)])
+
+    def dicts():
+        # map and map_reverse, as generic_replace() keeps them
+        tokens, values = entries()
+        return (dict(zip(tokens, values)), dict(zip(values, tokens)))
+
+    def array_key_map():
+        tokens, values = entries()
+        key_map = ks.ArrayKeyMap(tokens, values)
+        key_map.lookup(tokens[:1])
+        key_map.reverse_lookup(values[:1])
+        return key_map
+    dict_bytes = traced(dicts)[1]
+    key_map, array_bytes = traced(array_key_map)
+    assert(array_bytes < dict_bytes / 2)
+    assert(key_map.nbytes <= array_bytes)
+    keys = key_map.keys()
+    values, found = key_map.lookup(keys)
+    assert(found.all() and list(values) == ['user%d' % i
+                                            for i in range(20000)])
+    assert(list(key_map.reverse_lookup(values)[0]) == list(keys))
+
+
+def test_array_backend_replacers():
+    series = pd.Series(['foo', 'bar', 'foo', None, 'baz'])
+    for replacer_class in [sr.HashSha256Replacer,
+                           sr.CollisionlessHashSha256Replacer,
+                           sr.RandomHexReplacer]:
+        key = {'backend': 'array'}
+        ret = replacer_class(None, key).replace_series(series)
+        assert(isinstance(key['map'], ks.ArrayKeyMap))
+        assert(len(key['map']) == 3)
+        assert(ret[0] == ret[2] != ret[1])
+        assert(key['map'][ret[4]] == 'baz')
+        ret_next = replacer_class(None, key).replace_series(series[:2])
+        assert(list(ret_next) == list(ret[:2]))
+
+
+def test_array_backend_anonymize():
+    df = pd.DataFrame(dict(kind=['a', 'b'] * 10,
+                           user=['user%d' % i for i in range(20)]))
+    data, key = anz.anonymize(df, key_backend='array')
+    low_cardinality_map = key['data_map']['col_0']['map']
+    assert(isinstance(low_cardinality_map, ks.ArrayKeyMap))
+    assert(low_cardinality_map.to_dict() == {'a': 0, 'b': 1})
+    assert(list(data['col_0'][:4]) == [0, 1, 0, 1])
+    originals, found = key['data_map']['col_1']['map'].lookup(data['col_1'])
+    assert(found.all() and list(originals) == list(df['user']))
+
+
+def test_sqlite_key_map(tmp_path):
+    path = str(tmp_path / 'keys.sqlite')
+    key_map = ks.key_map('sqlite:' + path)
+    key_map.extend(['k%d' % i for i in range(2000)], np.arange(2000))
+    key_map['a'] = -1
+    assert(len(key_map) == 2001 and 'a' in key_map and 'x' not in key_map)
+    with pytest.raises(ValueError):
+        key_map['a'] = 5
+    # Large lookups go through a temporary table
+    keys = ['k%d' % i for i in range(1999, -1, -1)] + ['x']
+    values, found = key_map.lookup(keys)
+    assert(list(found) == [True] * 2000 + [False])
+    assert(list(values[:3]) == [1999, 1998, 1997])
+    keys, found = ks.SqliteKeyMap(path, key_map.table).reverse_lookup([-1, 7])
+    assert(list(keys) == ['a', 'k7'] and found.all())
+    copy = pickle.loads(pickle.dumps(key_map))
+    assert(copy.get('k12') == 12 and len(copy) == 2001)
+    copy.close()
+    key_map.close()
+    assert(os.path.exists(path))
+
+
+def test_sqlite_temporary_file():
+    key_map = ks.key_map('sqlite')
+    key_map['a'] = 1
+    copy = pickle.loads(pickle.dumps(key_map))
+    assert(copy['a'] == 1 and copy.temporary)
+    # The copy, e.g. sent back from a worker process, deletes the file
+    copy.close()
+    assert(not os.path.exists(key_map.path))
+    df = pd.DataFrame(dict(user=['user%d' % i for i in range(20)],
+                           other=['other%d' % i for i in range(20)]))
+    data, key = anz.anonymize(df, key_backend='sqlite', n_jobs=2)
+    maps = [column_key['map'] for column_key in key['data_map'].values()]
+    assert(all(key_map.temporary for key_map in maps))
+    for key_map in maps:
+        key_map.close()
+        assert(not os.path.exists(key_map.path))
+
+
+def test_sqlite_backend_anonymize(tmp_path):
+    df = pd.DataFrame(dict(kind=['a', 'b'] * 10,
+                           user=['user%d' % i for i in range(20)]))
+    backend = 'sqlite:' + str(tmp_path / 'anonymize.sqlite')
+    data, key = anz.anonymize(df, key_backend=backend)
+    assert(isinstance(key['data_map']['col_1']['map'], ks.SqliteKeyMap))
+    assert(key['data_map']['col_0']['map'].to_dict() == {'a': 0, 'b': 1})
+    restored = anz.deanonymize(data, key)
+    assert(list(restored['user']) == list(df['user']))
+    series = pd.Series(['foo', 'bar', 'foo', None])
+    key = {'backend': 'sqlite:' + str(tmp_path / 'replacer.sqlite')}
+    ret = sr.RandomHexReplacer(None, key).replace_series(series)
+    assert(ret[0] == ret[2] != ret[1] and pd.isnull(ret[3]))
+    assert(key['map'][ret[1]] == 'bar')
+
+
+def test_memo_caches():
+    for policy in ['lru', 'clock']:
+        cache = ks.memo_cache(3, policy)
+        for value in ['a', 'b', 'c']:
+            cache.put(value, value.upper())
+        assert(cache.get('a') == 'A')
+        cache.put('d', 'D')
+        # 'a' was used since it was added, 'b' was not
+        assert('a' in cache and 'b' not in cache and len(cache) == 3)
+        assert(cache.get('b', ks.MISSING) is ks.MISSING)
+        stats = cache.stats()
+        assert((stats['hits'], stats['misses'], stats['evictions']) ==
+               (1, 1, 1))
+        assert(stats['hit_rate'] == 0.5)
+    with pytest.raises(ValueError):
+        ks.memo_cache(3, 'random')
+
+
+def test_cached_replacer(tmp_path):
+    key = {'backend': 'sqlite:' + str(tmp_path / 'map.sqlite')}
+    cache = ks.memo_cache(2)
+    series = pd.Series(['a', 'b', 'c', 'a'])
+    ret = sr.RandomHexReplacer(None, key, cache=cache).replace_series(series)
+    assert(cache.stats()['misses'] == 3 and len(cache) == 2)
+    again = sr.RandomHexReplacer(None, key, cache=cache) \
+        .replace_series(series)
+    assert(list(again) == list(ret))
+    assert(cache.stats()['hits'] == 2)
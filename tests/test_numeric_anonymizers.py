@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from anonymize.types.int_anonymizer import IntAnonymizer
+from anonymize.types.float_anonymizer import FloatAnonymizer
+from anonymize.types.timedelta_anonymizer import TimedeltaAnonymizer
+import anonymize.anonymize as anz
+from anonymize import exceptions
+import pytest
+import pandas as pd
+import numpy as np
+
+
+def test_int_anonymizer():
+    series = pd.Series(np.arange(200000, dtype=np.int64) * 7 + 5)
+    ret, key = IntAnonymizer(None).anonymize(series)
+    assert(ret.dtype == np.int64)
+    assert(((ret + key['shift']) // key['scale'] == series).all())
+    ret_next, key_next = IntAnonymizer(None).anonymize(series[:10], key)
+    assert((key_next['scale'], key_next['shift']) ==
+           (key['scale'], key['shift']))
+    # In place anonymization reuses the int64 buffer
+    values = series.to_numpy().copy()
+    ret, key = anz.int_replace(pd.Series(values, copy=False), inplace=True)
+    assert(np.shares_memory(ret.to_numpy(), values))
+    assert(((ret + key['shift']) // key['scale'] == series).all())
+
+
+def test_float_anonymizer():
+    series = pd.Series(np.linspace(1.0, 100.0, 1000))
+    series[3] = np.nan
+    ret, key = FloatAnonymizer(None).anonymize(series)
+    restored = (ret + key['shift']) / key['scale'] - series
+    assert(np.isnan(ret[3]))
+    assert(((restored >= 0.0) & (restored < 1.0)).sum() == 999)
+
+
+def test_timedelta_anonymizer():
+    series = pd.Series(pd.to_timedelta(np.arange(100), unit='s'))
+    series[5] = pd.NaT
+    ret, key = TimedeltaAnonymizer(None).anonymize(series)
+    assert(ret.dtype == series.dtype)
+    assert(pd.isnull(ret[5]))
+    restored = (ret + key['shift']) // key['scale']
+    assert((restored == series).sum() == 99)
+
+
+def test_timedelta_anonymizer_multi_day():
+    # Scaled nanoseconds of thousands of days would overflow int64
+    series = pd.Series(pd.to_timedelta([-3000, -2, 0, 45, 3650], unit='D'))
+    values = series.values.view(np.int64)
+    for _ in range(20):
+        ret, key = TimedeltaAnonymizer(None).anonymize(series)
+        assert(key['scale'] * 3651 * 86400 * 10**9 < np.iinfo(np.int64).max)
+        restored = (ret.values.view(np.int64) + key['shift'].value) // \
+            key['scale']
+        assert((restored == values).all())
+    with pytest.raises(exceptions.IntegerOverflow):
+        TimedeltaAnonymizer(None).anonymize(series, dict(key, scale=10**6))
+
+
+def test_int_anonymizer_uint64():
+    series = pd.Series(np.array([0, 7, 2**62], dtype=np.uint64))
+    ret, key = anz.int_replace(series)
+    assert(key['scale'] == 1 and ret.dtype == np.int64)
+    assert(((ret + key['shift']) // key['scale'] == series).all())
+    with pytest.raises(exceptions.IntegerOverflow):
+        anz.int_replace(pd.Series(np.array([2**63], dtype=np.uint64)))
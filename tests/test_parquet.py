@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import anonymize.anonymize as anz
+import pytest
+import pandas as pd
+import numpy as np
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+
+def test_anonymize_parquet(tmp_path):
+    from anonymize.parquet import anonymize_parquet
+    df = pd.DataFrame(dict(kind=['a', 'b', None, 'c'] * 25,
+                           user=['user%d' % (i % 40) for i in range(100)],
+                           value=pd.array(list(range(99)) + [None],
+                                          dtype='Int64'),
+                           created=pd.date_range('2020-01-01', periods=100,
+                                                 freq='H'),
+                           day=pd.date_range('2020-01-01', periods=100,
+                                             freq='D').date))
+    src = str(tmp_path / 'src.parquet')
+    dst = str(tmp_path / 'dst.parquet')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), src,
+                   row_group_size=30)
+    key = anonymize_parquet(src, dst, low_cardinality_threshold=3)
+    assert(pq.ParquetFile(dst).num_row_groups == 4)
+    assert(pq.read_schema(dst).field('col_4').type == pa.date32())
+    ret = pq.read_table(dst).to_pandas()
+    assert(list(ret.columns) == ['col_0', 'col_1', 'col_2', 'col_3',
+                                 'col_4'])
+    assert(key['data_map']['col_0']['kind'] == 'low_cardinality')
+    assert(key['data_map']['col_2']['kind'] == 'int')
+    assert(ret['col_2'].isna().sum() == 1)
+    assert(((ret['col_2'][:99] + key['data_map']['col_2']['shift']) //
+            key['data_map']['col_2']['scale'] == df['value'][:99]).all())
+    shift = pd.Timedelta(key['data_map']['col_3']['shift'], unit='s')
+    assert((ret['col_3'] + shift == df['created']).all())
+    # date32 columns are shifted by whole days
+    assert(key['data_map']['col_4']['precision'] == 'D')
+    assert(key['data_map']['col_4']['shift'] > 0)
+    assert((ret['col_4'] != df['day']).all())
+    shift = pd.Timedelta(key['data_map']['col_4']['shift'], unit='D')
+    assert((pd.to_datetime(ret['col_4']) + shift ==
+            pd.to_datetime(df['day'])).all())
+    restored = anz.deanonymize(ret[['col_4']], key)
+    assert((restored['day'].dt.date == df['day']).all())
+    # Tokens are consistent across row groups and reversible
+    assert(ret['col_1'].nunique() == 40)
+    restored = anz.deanonymize(ret[['col_0', 'col_1']], key)
+    assert(restored['user'].equals(df['user']))
+    assert(restored['kind'].equals(df['kind']))
+
+
+def test_anonymize_parquet_uint64(tmp_path):
+    from anonymize.parquet import anonymize_parquet
+    values = np.arange(20, dtype=np.uint64) * 2**58
+    src = str(tmp_path / 'src.parquet')
+    dst = str(tmp_path / 'dst.parquet')
+    pq.write_table(pa.table({'id': values}), src)
+    key = anonymize_parquet(src, dst)
+    ret = pq.read_table(dst).column('col_0').to_numpy()
+    column_key = key['data_map']['col_0']
+    assert(column_key['kind'] == 'int')
+    assert(((ret + column_key['shift']) // column_key['scale'] ==
+            values.astype(np.int64)).all())
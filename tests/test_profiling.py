@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from anonymize.profiling import Profile
+import anonymize.anonymize as anz
+import anonymize.anonymizer as anonymizer
+import pandas as pd
+import numpy as np
+
+
+def test_anonymize_profile():
+    df = pd.DataFrame(dict(kind=['a', 'b'] * 50,
+                           user=['user%d' % i for i in range(100)],
+                           value=np.arange(100)))
+    forwarded = []
+    profile = Profile(hooks=[forwarded.append])
+    ret, key = anz.anonymize(df, profile=profile, n_jobs=2)
+    assert(forwarded == profile.records)
+    stages = profile.to_frame().set_index(['stage', 'column'])
+    assert(stages.loc[('generic_replace', 'user'), 'key_growth'] == 100)
+    assert(stages.loc[('generic_replace', 'user'), 'uniques'] == 100)
+    assert(stages.loc[('low_cardinality_replace', 'kind'), 'uniques'] == 2)
+    assert(len(stages.loc['cardinality']) == 3)
+    total = profile.records[-1]
+    assert(total['stage'] == 'anonymize' and total['rows'] == 100)
+    # Peaks of inner stages in this process are part of the total peak
+    assert(total['peak_bytes'] >= stages.loc[('deduce', None), 'peak_bytes'])
+    assert(all(record['seconds'] >= 0 for record in profile.records))
+    # Known values add nothing to the key
+    anz.anonymize(df, key=key, profile=profile)
+    assert(profile.records[-3]['column'] == 'user')
+    assert(profile.records[-3]['key_growth'] == 0)
+    assert(profile.summary().loc['anonymize', 'rows'] == 200)
+    # New values of a reused key count, also in process
+    df = pd.DataFrame(dict(user=['user%d' % i for i in range(150)],
+                           email=['u%d@d%d.com' % (i, i) for i in range(150)]))
+    ret, key = anz.anonymize(df[:100], types={'email': 'email'})
+    profile = Profile(trace_memory=False)
+    anz.anonymize(df, key=key, types={'email': 'email'}, profile=profile)
+    stages = profile.to_frame().set_index(['stage', 'column'])
+    assert(stages.loc[('generic_replace', 'user'), 'key_growth'] == 50)
+    assert(stages.loc[('email_replace', 'email'), 'key_growth'] == 100)
+
+
+def test_anonymizer_profile():
+    profile = Profile(trace_memory=False)
+    obj = anonymizer.Anonymizer(['kind'], {'kind': 'categorical'},
+                                profile=profile)
+    obj.anonymize(pd.DataFrame(dict(kind=['a', 'b', 'a', 'c'])))
+    assert([record['stage'] for record in profile.records] ==
+           ['CategoricalAnonymizer', 'anonymize'])
+    assert(profile.records[0]['uniques'] == 3)
+    assert('peak_bytes' not in profile.records[0])
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from anonymize.sequences.radix import AlphabetSequence
+
+
+def test_alphabet_sequence_take():
+    sequence = AlphabetSequence('abc')
+    labels = [sequence.next() for i in range(50)]
+    assert(labels[:5] == ['a', 'b', 'c', 'aa', 'ab'])
+    assert(list(AlphabetSequence('abc').take(0, 50)) == labels)
+    # Any range can be generated on its own
+    assert(list(AlphabetSequence('abc').take(12, 20)) == labels[12:32])
+    assert(AlphabetSequence('abc')[39] == labels[39])
+    assert(len(AlphabetSequence('abc').take(7, 0)) == 0)
+    sequence = AlphabetSequence(['x', 'yz'])
+    assert(list(sequence.take(2, 3)) == ['xx', 'xyz', 'yzx'])
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 import anonymize.anonymize as anz
+from anonymize import key_stores as ks
+from anonymize import exceptions
 import pytest
 import pandas as pd
 import numpy as np
@@ -55,6 +57,145 @@ def test_more_deduce_types():
     assert(type_map['float_number'] == 'float')
     assert(type_map['number'] == 'int')
     assert(type_map['more'] == 'generic')
+    assert('created_year' not in type_map)
+    assert(str(data['created_date'].dtype) == 'datetime64[ns]')
+    assert(list(data['updatedDate']) == [pd.Timestamp('2011-01-01')] * 3)
+    assert(('assemble', 'created_date', {'year': 'created_year',
+                                         'month': 'created_month',
+                                         'day': 'created_day'}) in
+           key['transformation_log'])
+    df['created_day'] = [1, 32, 30]
+    type_map, data, key = anz.deduce_types(df, heuristic_level=2,
+                                           quiet=True)
+    assert(list(data['created_date'][[0, 2]]) ==
+           list(pd.to_datetime(['2011-12-01', '2011-12-30'])))
+    assert(pd.isnull(data['created_date'][1]))
+    assert(key['type_mismatches'] == {'created_date': 1})
+
+
+def test_deduce_types_sample():
+    df = pd.DataFrame(dict(
+            number=['12'] * 1000,
+            mixed=['1'] * 999 + ['x'],
+            created_date=['2001/01/02'] * 1000,
+            more=['string'] * 1000
+            ))
+    df.loc[500, 'number'] = 'n/a'
+    sample = anz.sample_rows(df, 10)
+    assert(len(sample) == 10)
+    assert(list(sample.index[:3]) == [0, 1, 2])
+    assert(list(sample.index[-3:]) == [997, 998, 999])
+    type_map, data, key = anz.deduce_types(df, heuristic_level=2,
+                                           sample_size=30, quiet=True)
+    assert(type_map['number'] == 'float')
+    assert(type_map['mixed'] == 'generic')
+    assert(type_map['created_date'] == 'datetime')
+    assert(type_map['more'] == 'generic')
+    assert(('change_type', 'created_date', 'datetime', '%Y/%m/%d') in
+           key['transformation_log'])
+    confidence = key['type_confidence']
+    assert(confidence['number'] == 1.0 and confidence['created_date'] == 1.0)
+    # Columns below min_confidence are scored too
+    assert(0.9 < confidence['mixed'] < 1.0 and confidence['more'] == 0.0)
+    assert(key['type_mismatches'] == {'number': 1})
+    assert(np.isnan(data['number'][500]))
+    with pytest.raises(exceptions.TypeMismatch):
+        anz.deduce_types(df, heuristic_level=2, sample_size=30,
+                         raise_exceptions=True)
+    type_map, data, key = anz.deduce_types(df, heuristic_level=2,
+                                           sample_size=30,
+                                           min_confidence=0.9, quiet=True)
+    assert(type_map['mixed'] == 'float')
+    assert(key['type_confidence']['mixed'] < 1.0)
+
+
+def test_deduce_types_sample_nulls():
+    # Missing values do not lower the confidence of a numeric column
+    df = pd.DataFrame(dict(number=['12', None, '3,5', np.nan] * 250,
+                           event_date=['01/02/2001', None] * 500,
+                           start_date=['2001-01-02'] * 999 + ['soon']))
+    for sample_size in [None, 40]:
+        type_map, data, key = anz.deduce_types(df, heuristic_level=2,
+                                               sample_size=sample_size,
+                                               quiet=True)
+        assert(type_map['number'] == 'float')
+        assert(data['number'].isna().sum() == 500)
+    assert(key['type_confidence']['number'] == 1.0)
+    assert(('change_type', 'event_date', 'datetime', '%d/%m/%Y') in
+           key['transformation_log'])
+    # Dates below min_confidence are not converted
+    type_map, data, key = anz.deduce_types(df.iloc[-20:], heuristic_level=2,
+                                           sample_size=20, min_confidence=1.0,
+                                           quiet=True)
+    assert(key['type_confidence']['start_date'] == 0.95)
+    assert(type_map['start_date'] == 'generic')
+
+
+def test_deduce_types_cache(tmp_path, monkeypatch):
+    df = pd.DataFrame(dict(
+            created_year='2011',
+            created_month=[11, 10, 12],
+            number='12',
+            more='string'
+            ))
+    type_map, data, key = anz.deduce_types(df, heuristic_level=2,
+                                           cache=True)
+    assert(len(key['type_cache']) == 1)
+    anz.deduce_types(df, heuristic_level=2, cache_dir=str(tmp_path))
+    assert(len(list(tmp_path.iterdir())) == 1)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('Deduction was not cached')
+    monkeypatch.setattr(anz, 'deduce_transformations', fail)
+    for cached_key in [{'type_cache': key['type_cache']}, None]:
+        cached_type_map, cached_data, cached_key = \
+            anz.deduce_types(df, heuristic_level=2, key=cached_key,
+                             cache=True, cache_dir=None if cached_key
+                             else str(tmp_path))
+        assert(cached_type_map == type_map)
+        assert(cached_key['transformation_log'] == key['transformation_log'])
+        assert(cached_data.equals(data))
+
+
+def test_deduce_types_cache_reused_key(monkeypatch):
+    df = pd.DataFrame(dict(created_year=['2011', '2012', '2013'],
+                           number=['12', '3', '4']))
+    calls = []
+    deduce_transformations = anz.deduce_transformations
+
+    def counted(*args, **kwargs):
+        calls.append(args)
+        return deduce_transformations(*args, **kwargs)
+    monkeypatch.setattr(anz, 'deduce_transformations', counted)
+    type_map, data, key = anz.deduce_types(df, heuristic_level=2, cache=True)
+    transformation_log = list(key['transformation_log'])
+    for _ in range(3):
+        cached_type_map, cached_data, key = \
+            anz.deduce_types(df, heuristic_level=2, key=key, cache=True)
+        assert(cached_type_map == type_map and cached_data.equals(data))
+    assert(len(calls) == 1)
+    assert(key['transformation_log'] == transformation_log)
+
+
+def test_transform_data_shares_columns():
+    df = pd.DataFrame(dict(number=['1', '2,000'],
+                           value=[1.5, 2.5],
+                           other=[3.5, 4.5],
+                           created_year=[2001, 2002]))
+    original = df.copy()
+    key = {'number': {'kind': 'generic'}}
+    data, new_key = anz.transform_data(
+                        df, [('change_type', 'number', 'numeric'),
+                             ('assemble', 'created_date',
+                              {'year': 'created_year'}),
+                             ('remove', 'created_year')], key)
+    assert(df.equals(original))
+    assert(key == {'number': {'kind': 'generic'}})
+    assert(list(data.columns) == ['number', 'value', 'other', 'created_date'])
+    assert(list(data['number']) == [1, 2000])
+    assert(np.shares_memory(data['value'].values, df['value'].values))
+    assert(np.shares_memory(data['other'].values, df['other'].values))
+    assert(not np.shares_memory(data['number'].values, df['number'].values))
 
 
 def test_anonymize():
@@ -70,3 +211,111 @@ def test_anonymize():
             more='string'
             ))
     data, key = anz.anonymize(df, heuristic_level=2)
+
+
+def test_low_cardinality_replace():
+    series = pd.Series(['b', 'a', 'c', 'a', 'b'])
+    ret, key = anz.low_cardinality_replace(series)
+    assert(key['map'] == {'a': 0, 'b': 1, 'c': 2})
+    assert(list(ret) == [1, 0, 2, 0, 1])
+    ret, key = anz.low_cardinality_replace(pd.Series(['d', 'a', None]),
+                                           key=key)
+    assert(key['map']['d'] == 3)
+    assert(list(ret[:2]) == [3, 0])
+    assert(np.isnan(ret[2]))
+    ret, key = anz.low_cardinality_replace(series, alphabet='xy')
+    assert(list(ret) == ['y', 'x', 'xx', 'x', 'y'])
+
+
+def test_anonymize_chunks():
+    df = pd.DataFrame(dict(
+            created=pd.date_range('2001-01-01', periods=40, freq='H'),
+            kind=['a', 'b'] * 20,
+            user=['user%d' % (i % 15) for i in range(40)]
+            ))
+    chunks = [df[i:i+10] for i in range(0, 40, 10)]
+    results = list(anz.anonymize_chunks(chunks))
+    ret = pd.concat([data for data, key in results])
+    key = results[-1][1]
+    assert(list(ret.columns) == ['col_0', 'col_1', 'col_2'])
+    assert(key['data_map']['col_1']['kind'] == 'low_cardinality')
+    assert(key['data_map']['col_2']['kind'] == 'generic')
+    shift = df['created'] - ret['col_0']
+    assert(shift.nunique() == 1)
+    assert((ret['col_1'] == df['kind'].map(key['data_map']['col_1']['map']))
+           .all())
+    assert(ret['col_2'].nunique() == 15)
+    assert((ret['col_2'].map(key['data_map']['col_2']['map']) == df['user'])
+           .all())
+
+
+def test_anonymize_n_jobs():
+    df = pd.DataFrame(dict(
+            created=pd.date_range('2001-01-01', periods=20, freq='H'),
+            kind=['a', 'b'] * 10,
+            user=['user%d' % i for i in range(20)]
+            ))
+    data, key = anz.anonymize(df, n_jobs=2)
+    assert(list(data.columns) == ['col_0', 'col_1', 'col_2'])
+    assert(list(key['data_map']) == ['col_0', 'col_1', 'col_2'])
+    assert(key['data_map']['col_1']['map'] == {'a': 0, 'b': 1})
+    assert((data['col_2'].map(key['data_map']['col_2']['map']) ==
+            df['user']).all())
+    assert((df['created'] - data['col_0']).nunique() == 1)
+
+
+def test_deanonymize():
+    df = pd.DataFrame(dict(
+            created=pd.date_range('2001-01-01', periods=20, freq='H'),
+            kind=['a', 'b'] * 10,
+            count=np.arange(100, 120),
+            user=['user%d' % i for i in range(20)],
+            email=['user%d@example.com' % i for i in range(20)]
+            ))
+    data, key = anz.anonymize(df, types={'email': 'email'})
+    ret = anz.deanonymize(data, key)
+    assert(list(ret.columns) == list(df.columns))
+    for column in df.columns:
+        assert((ret[column] == df[column]).all())
+    data, key = anz.anonymize(df, key_backend='array')
+    ret = anz.deanonymize(data, key)
+    assert((ret['kind'] == df['kind']).all())
+    assert((ret['user'] == df['user']).all())
+
+
+def test_deanonymize_csv(tmp_path):
+    df = pd.DataFrame(dict(
+            created=pd.date_range('2001-01-01', periods=20, freq='H'),
+            day=pd.date_range('2001-01-01', periods=20, freq='D').date,
+            count=np.arange(100, 120)))
+    data, key = anz.anonymize(df, types={'day': 'datetime'})
+    data.to_csv(str(tmp_path / 'data.csv'), index=False)
+    data = pd.read_csv(str(tmp_path / 'data.csv'))
+    ret = anz.deanonymize(data, key)
+    assert((ret['created'] == df['created']).all())
+    assert((ret['day'].dt.date == df['day']).all())
+    assert((ret['count'] == df['count']).all())
+    data.loc[0, 'col_0'] = 'not a date'
+    with pytest.raises(exceptions.TypeMismatch):
+        anz.deanonymize(data, key, raise_exceptions=True)
+
+
+def test_anonymize_chunks_memo_caches():
+    df = pd.DataFrame(dict(
+            user=['user%d' % (i % 30) for i in range(120)],
+            email=['u%d@d%d.com' % (i % 30, i % 2) for i in range(120)]))
+    caches = ks.MemoCaches(100)
+    chunks = [df[i:i + 30] for i in range(0, 120, 30)]
+    results = list(anz.anonymize_chunks(chunks, types={'email': 'email'},
+                                        memo_caches=caches))
+    ret = pd.concat([data for data, key in results])
+    key = results[-1][1]
+    stats = caches.stats()
+    assert(stats['user']['hits'] == 90 and stats['user']['misses'] == 30)
+    assert(stats[('email', 'domain')]['hits'] == 6)
+    assert(anz.deanonymize(ret, key).equals(df))
+    # Caches are bound to the key's maps: a new key gets no stale tokens
+    data, new_key = anz.anonymize(df, types={'email': 'email'},
+                                  memo_caches=caches)
+    assert(not set(data['col_0']) & set(ret['col_0']))
+    assert(anz.deanonymize(data, new_key).equals(df))
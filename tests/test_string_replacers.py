@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from anonymize.types import string_replacers as sr
+from anonymize.types.email_anonymizer import EmailAnonymizer
+from anonymize import exceptions
+from anonymize import key_stores as ks
+from anonymize.anonymizer import Anonymizer
+import anonymize.anonymize as anz
+from functools import partial
+import sqlite3
+import pytest
+import pandas as pd
+import numpy as np
+
+
+def test_replace_series():
+    series = pd.Series(['foo', 'bar', 'foo', None, 'foo'])
+    for replacer_class in [sr.HashSha256Replacer,
+                           sr.CollisionlessHashSha256Replacer,
+                           sr.RandomHexReplacer]:
+        key = {}
+        ret = replacer_class(None, key).replace_series(series)
+        assert(ret[0] == ret[2] == ret[4])
+        assert(ret[0] != ret[1])
+        assert(pd.isnull(ret[3]))
+        assert(len(key['map']) == 2)
+        assert(key['map'][ret[0]] == 'foo')
+        # Known values keep their replacements
+        ret_next = replacer_class(None, key).replace_series(series[:2])
+        assert(list(ret_next) == list(ret[:2]))
+
+
+def test_email_anonymizer():
+    series = pd.Series(['a@example.com', 'b@example.com', 'a@example.com'])
+    ret, key = EmailAnonymizer(None).anonymize(series)
+    users = ret.str.split('@').str.get(0)
+    domains = ret.str.split('@').str.get(1)
+    assert(users[0] == users[2] != users[1])
+    assert(domains.nunique() == 1)
+    assert(key['domain_map'][domains[0]] == 'example.com')
+    assert(len(key['map']) == 2)
+    kept, key = EmailAnonymizer(None).anonymize(
+                    series, key={'type': 'email', 'domains': 'keep'})
+    assert(kept.str.endswith('@example.com').all())
+    # keep_domains also applies to an existing key
+    kept, kept_key = EmailAnonymizer(None).anonymize(
+                        series, key={'type': 'email'}, keep_domains=True)
+    assert(kept.str.endswith('@example.com').all())
+    assert(kept_key['domains'] == 'keep')
+
+
+def test_email_domain_options():
+    series = pd.Series(['a@example.com', 'b@other.com'])
+    anonymizer = EmailAnonymizer(Anonymizer(['email'], {'email': 'email'},
+                                            raise_exceptions=True))
+    ret, key = anonymizer.anonymize(series)
+    # Domains already replaced in the key can not be kept
+    with pytest.raises(exceptions.WrongParameters):
+        anonymizer.anonymize(series, key=key, keep_domains=True)
+    with pytest.raises(exceptions.WrongParameters):
+        anz.email_replace(series, key=anz.email_replace(series)[1],
+                          keep_domains=True, raise_exceptions=True)
+    # Many-to-one domain tables could not be deanonymized
+    table = {'example.com': 'example.org', 'other.com': 'example.org'}
+    with pytest.raises(exceptions.WrongParameters):
+        anonymizer.anonymize(series, domain_table=table)
+    with pytest.raises(exceptions.WrongParameters):
+        anz.email_replace(series, domain_table=table, raise_exceptions=True)
+    ret, key = anz.email_replace(series, domain_table=table, quiet=True)
+    assert('domain_table' not in key and ret.str.partition('@')[2].nunique()
+           == 2)
+
+
+def test_email_replace_domains():
+    df = pd.DataFrame(dict(email=['u%d@%s' % (i, domain)
+                                  for i in range(10)
+                                  for domain in ['a.com', 'b.com', 'c.com']]
+                           + [None]))
+    data, key = anz.anonymize(
+                    df, types={'email': 'email'},
+                    replacers={'email': partial(
+                                anz.email_replace,
+                                domain_table={'a.com': 'example.com'})})
+    domains = data['col_0'].str.partition('@')[2]
+    assert((domains == 'example.com').sum() == 10)
+    assert(domains.nunique() == 3)
+    assert(len(key['data_map']['col_0']['map']) == 10)
+    assert(len(key['data_map']['col_0']['domain_map']) == 2)
+    assert(pd.isnull(data['col_0'][30]))
+    assert(anz.deanonymize(data, key)['email'].equals(df['email']))
+    kept, key = anz.anonymize(
+                    df, types={'email': 'email'},
+                    replacers={'email': partial(anz.email_replace,
+                                                keep_domains=True)})
+    assert(kept['col_0'].str.partition('@')[2][:30].equals(
+                df['email'].str.partition('@')[2][:30]))
+    assert(anz.deanonymize(kept, key)['email'].equals(df['email']))
+
+
+def test_keyed_hash_replacer():
+    series = pd.Series(['foo', 'bar', 'foo', None])
+    key = {}
+    sink = ks.AsyncReverseSink(backend='array')
+    ret = sr.KeyedHashReplacer(None, key, reverse_sink=sink) \
+        .replace_series(series)
+    assert('map' not in key and key['method'] == 'keyed_blake2b')
+    assert(ret[0] == ret[2] != ret[1] and pd.isnull(ret[3]))
+    assert(len(ret[0]) == 32)
+    # Another worker with only the secret produces the same tokens
+    other = sr.KeyedHashReplacer(None, {'secret': key['secret'],
+                                        'digest_size': 16})
+    assert(list(other.replace_series(series[:3])) == list(ret[:3]))
+    assert(sink.flush()[ret[1]] == 'bar')
+    sink.close()
+    short = sr.KeyedHashReplacer(None, {'digest_size': 8})
+    assert(len(short.replacer('foo')) == 16)
+
+
+def test_reverse_sink_errors(tmp_path):
+    sink = ks.AsyncReverseSink(
+                backend='sqlite:' + str(tmp_path / 'sink.sqlite'))
+    # SQLite can not store Timestamp objects: the write fails
+    sink.submit(['t0', 't1'], list(pd.date_range('2020-01-01', periods=2)))
+    for i in range(3):
+        sink.submit(['u%d' % i], ['value'])
+    with pytest.raises(sqlite3.Error):
+        sink.flush()
+    assert(len(sink.flush()) == 3)
+    sink.close()
+
+
+def test_keyed_replace():
+    df = pd.DataFrame(dict(user=['user%d' % i for i in range(20)]))
+    sink = ks.AsyncReverseSink()
+    data, key = anz.anonymize(
+                    df, replacers={'generic': partial(anz.keyed_replace,
+                                                      reverse_sink=sink)})
+    assert(key['data_map']['col_0']['kind'] == 'keyed')
+    again, key = anz.anonymize(df, key=key)
+    assert(again.equals(data))
+    with pytest.raises(exceptions.NotReversible):
+        anz.deanonymize(data, key, raise_exceptions=True)
+    key['data_map']['col_0']['map'] = sink.flush()
+    assert(anz.deanonymize(data, key)['user'].equals(df['user']))
+
+
+def test_random_hex_tokens():
+    values = pd.Series(['v%d' % i for i in range(200)])
+    for backend in [None, 'array']:
+        # 4096 possible tokens for 200 values: clashes have to be redrawn
+        key = {'hex_length': 3, 'collision_retries': 100, 'backend': backend}
+        ret = sr.RandomHexReplacer(None, key).replace_series(values)
+        assert(ret.nunique() == 200)
+        assert(ret.str.len().eq(3).all())
+        assert(ret.str.match('^[0-9a-f]+$').all())
+        more = sr.RandomHexReplacer(None, key).replace_series(
+                    pd.Series(['v%d' % i for i in range(150, 250)]))
+        assert(list(more[:50]) == list(ret[150:]))
+        assert(len(set(more[50:]) & set(ret)) == 0)
+        assert(len(key['map']) == 250)
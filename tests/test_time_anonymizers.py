@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from anonymize.types.datetime_anonymizer import DatetimeAnonymizer
+from anonymize.types.time_anonymizer import TimeAnonymizer
+import anonymize.anonymize as anz
+import pytest
+import pandas as pd
+import numpy as np
+
+
+def test_datetime_anonymizer():
+    series = pd.Series(pd.date_range('2001-01-01', periods=50, freq='H'))
+    series[3] = pd.NaT
+    ret, key = DatetimeAnonymizer(None).anonymize(series)
+    assert(ret.dtype == series.dtype)
+    assert(pd.isnull(ret[3]))
+    shift = (series - ret).dropna()
+    assert((shift == pd.Timedelta(key['shift'], unit='s')).all())
+    series = series.dt.tz_localize('Europe/Kiev')
+    ret, key = DatetimeAnonymizer(None).anonymize(series, precision='D')
+    assert(str(ret.dtype) == 'datetime64[ns, Europe/Kiev]')
+    assert(((series - ret).dropna() ==
+            pd.Timedelta(key['shift'], unit='D')).all())
+
+
+def test_time_anonymizer():
+    series = pd.Series(pd.to_timedelta(['00:00:01', '12:00:00',
+                                        '23:59:59', None]))
+    ret, key = TimeAnonymizer(None).anonymize(series, key={'type': 'time',
+                                                           'shift': 7200})
+    assert(list(ret[:3]) == list(pd.to_timedelta(['22:00:01', '10:00:00',
+                                                  '21:59:59'])))
+    assert(pd.isnull(ret[3]))
+    series = pd.Series(pd.to_datetime(['2001-01-02 01:00:00']))
+    ret, key = TimeAnonymizer(None).anonymize(series, key=key)
+    assert(ret[0] == pd.Timestamp('2001-01-02 23:00:00'))
+    data = pd.DataFrame({'col_0': ret})
+    restored = anz.deanonymize(data, {'data_map': {'col_0': key}})
+    assert(restored['col_0'][0] == series[0])
+
+
+def test_date_replace():
+    series = pd.Series(pd.date_range('2001-01-01', periods=5, freq='D'))
+    series[1] = pd.NaT
+    ret, key = anz.date_replace(series, key={'kind': 'date', 'shift': 2,
+                                             'precision': 'D'})
+    assert(ret[0] == pd.Timestamp('2000-12-30'))
+    assert(pd.isnull(ret[1]))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from anonymize.types.url_anonymizer import UrlAnonymizer
+import pytest
+import pandas as pd
+import numpy as np
+
+
+class Settings():
+    raise_exceptions = True
+
+
+def test_url_anonymizer():
+    series = pd.Series(['http://user:pw@example.com/a/b?x=1&y=2#top',
+                        'example.com',
+                        'https://example.com/',
+                        None,
+                        'ftp://a.b.c?q'], index=[5, 5, 6, 7, 8])
+    url_anonymizer = UrlAnonymizer(Settings())
+    ret, key = url_anonymizer.anonymize(series)
+    assert(list(ret.index) == list(series.index))
+    assert(pd.isnull(ret[7]))
+    parts = ret.str.extract(r'^(?:(\w+)://)?(?:(\w+):(\w+)@)?(\w+)'
+                            r'(?:/(\w*))?(?:\?(\w+))?(?:#(\w+))?$')
+    assert(parts.iloc[[0, 1, 2, 4], 3].notna().all())
+    assert(key['map'][parts.iloc[0, 1]] == 'user')
+    assert(key['map'][parts.iloc[0, 2]] == 'pw')
+    assert(parts.iloc[0, 3] == parts.iloc[1, 3] == parts.iloc[2, 3])
+    assert(key['map'][parts.iloc[0, 4]] == 'a/b')
+    assert(key['map'][parts.iloc[0, 5]] == 'x=1&y=2')
+    assert(parts.iloc[0, 6] == 'top')
+    assert(parts.iloc[2, 4] == '' and ret[6].endswith('/'))
+
+    ret, key = url_anonymizer.anonymize(
+                    series,
+                    anonymization_parts=['domain_components',
+                                         'path_components',
+                                         'query_string_components'])
+    assert(ret[6] == ret[5].iloc[1].join(['https://', '/']))
+    domain = ret[5].iloc[1].split('.')
+    assert([key['map'][part] for part in domain] == ['example', 'com'])
+    query_string = ret[5].iloc[0].split('?')[1].split('#')[0]
+    assert([key['map'][part] for part in query_string.replace('&', '=')
+            .split('=')] == ['x', '1', 'y', '2'])